@@ -3,9 +3,16 @@ CropStack Sensor API — Flask Backend
 Serves real-time sensor data, market prices, orders, and transactions.
 Includes an admin dashboard with Firestore integration for hub/organizer management.
 Sensor data is stored locally to save Firestore read/write costs.
+
+Importing this module has no side effects; create_app() starts the
+background work, or the first request does when `app` is served directly
+(`flask --app app run`, `gunicorn app:app`). Hub state lives in the process,
+so serve from a single process and scale with threads
+(e.g. `gunicorn -w 1 --threads 8 'app:create_app()'`); a second process that
+shares the data directory runs without persistence.
 """
 
-from flask import Flask, jsonify, request, render_template, session, redirect, url_for
+from flask import Flask, Response, jsonify, request, render_template, session, redirect, url_for
 from flask_cors import CORS
 from functools import wraps
 import time
@@ -14,74 +21,424 @@ import threading
 import json
 import os
 import uuid
+import atexit
+import base64
+import gzip
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 from datetime import datetime, timedelta
-import urllib.request
-import urllib.error
+from itertools import islice
+
+try:
+    import fcntl  # optional (POSIX): exclusive locks on the local data directories
+except ImportError:
+    fcntl = None
+
+from device_control import ActuationExecutor, DeviceCircuitBreakers, DeviceCommandLog, DeviceConnectionPool, DeviceError
+from history_log import SegmentedHistoryLog
+from hub_history import AGGREGATES, HubHistoryStore, to_point
+from hub_snapshot import HubStateJournal
+from hub_store import Hub, HubStore, to_reading
+
+try:
+    import brotli  # optional: enables br response compression alongside gzip
+except ImportError:
+    brotli = None
+
+IMPORT_STARTED = time.perf_counter()
 
 
 # ─────────────────────────────────────────────
-#  AUTO MODE HELPER
+#  DEVICE ACTUATION (pooled connections + bounded workers)
 # ─────────────────────────────────────────────
-def run_auto_control(hub_id, hub):
-    """Background auto-control: check temp/moisture and actuate heater/fan."""
-    device_ip = hub.get('device_ip')
-    if not device_ip:
-        return
 
-    temp = hub.get('temperature', 25)
-    moisture = hub.get('moisture', 50)
-    current_heater = hub.get('device_state', 'OFF')
-    current_fan = hub.get('servo_state', 'OFF')
+# Keep-alive connections to ESP32 devices, reused across commands
+device_pool = DeviceConnectionPool()
+
+# One command at a time per device (the ESP32 web server is single-threaded), 16 overall
+actuation_executor = ActuationExecutor(max_workers=16, per_device=1)
+
+
+# Fail fast for dark devices: 3 straight failures open the circuit, 5s..5min backoff
+device_breakers = DeviceCircuitBreakers(failure_threshold=3, base_backoff=5.0, max_backoff=300.0)
+
+
+def send_device_command(hub, action, state, timeout=3):
+    """
+    Send /toggle or /servo to a hub's device through its circuit breaker and
+    return the reported state text. The hub is marked 'unreachable' while the
+    circuit is open and back 'online' after the next successful call.
+    """
+    device_ip = hub.device_ip
+    try:
+        result = device_breakers.call(device_ip, device_pool.request, device_ip,
+                                      f"/{action}?state={quote(state)}", timeout)
+    except DeviceError:
+        if device_breakers.is_open(device_ip):
+            set_hub_status(hub.id, 'unreachable')
+        raise
+    set_hub_status(hub.id, 'online', only_if='unreachable')
+    return result
+
+
+def set_hub_status(hub_id, status, only_if=None):
+    """
+    Atomically set a hub's status (optionally only when it is currently
+    `only_if`) and publish the hub if it changed.
+    """
+    def change(hub):
+        if hub.status == status or (only_if is not None and hub.status != only_if):
+            return False
+        hub.status = status
+
+    hub = hub_store.update(hub_id, change)
+    if hub is not None:
+        publish_hub_change(hub)
+
+
+# Asynchronous manual commands (toggle/servo), looked up by command ID
+device_commands = DeviceCommandLog(max_commands=1000)
+
+# Hub field updated with the state a device reports back for each action
+DEVICE_STATE_FIELDS = {'toggle': 'device_state', 'servo': 'servo_state'}
+
+
+def execute_device_command(command, hub, action, state):
+    """Run a queued manual command on an actuation worker and store the reported state."""
+    device_commands.mark_running(command)
+    result = send_device_command(hub, action, state)
+    updated = hub_store.update(hub.id, lambda h: set_actuator_state(h, DEVICE_STATE_FIELDS[action], result))
+    if updated is not None:
+        publish_hub_change(updated)
+    return result
+
+
+def finish_device_command(command, hub, future):
+    """Record a command's outcome and push it to stream subscribers."""
+    if command["status"] == "superseded":
+        return  # Published when it was replaced; the result belongs to the later command
+    try:
+        done = device_commands.complete(command, result=future.result())
+    except Exception as e:
+        done = device_commands.complete(command, error=str(e))
+    hub_events.publish('command', done, hub.organizer_id, hub.organizer_email)
+
+
+def enqueue_device_command(hub_id, hub, action, state):
+    """
+    Queue a manual toggle/servo command and return its record immediately.
+    An explicit on/off supersedes a still-queued one for the same hub and
+    actuator, which is then reported as 'superseded' (with 'superseded_by')
+    instead of being sent; 'toggle' commands are never merged.
+    """
+    device_ip = hub.device_ip
+    command = device_commands.create(hub_id, action, state)
+    key = (action, hub_id) if state in ('on', 'off') else (action, hub_id, command['id'])
+    replaced = []
+    future = actuation_executor.submit(key, device_ip, execute_device_command, command, hub, action, state,
+                                       on_merge=replaced.append)
+    for args in replaced:
+        previous = args[0]
+        done = device_commands.supersede(previous, command['id'])
+        hub_events.publish('command', done, args[1].organizer_id, args[1].organizer_email)
+    future.add_done_callback(lambda f: finish_device_command(command, hub, f))
+    return command
+
+
+def queue_auto_control(hub_id, hub, desired_heater, desired_fan):
+    """
+    Queue an auto-control actuation; a still-queued one for the same hub is replaced.
+    Skipped while the device's circuit is open so dead silos don't take workers.
+    """
+    if device_breakers.is_open(hub.device_ip):
+        return None
+    return actuation_executor.submit(('auto', hub_id), hub.device_ip, run_auto_control,
+                                     hub_id, hub, desired_heater, desired_fan)
+
+
+# ─────────────────────────────────────────────
+#  AUTO MODE CONTROL LOOP
+# ─────────────────────────────────────────────
+
+# Seconds between auto-control ticks (one pass over every auto_mode hub)
+AUTO_CONTROL_INTERVAL = 1.0
+
+# Moisture not optimal (<35%) -> heater ON, optimal (35-80%) -> heater OFF
+AUTO_MOISTURE_LOW = 35.0
+AUTO_MOISTURE_HIGH = 80.0
+# Temperature not optimal (>35°C) -> fan ON, normal (10-35°C) -> fan OFF
+AUTO_TEMP_HIGH = 35.0
+AUTO_TEMP_LOW = 10.0
+
+# Defaults for the per-hub settings in hub.auto_config (set via /api/hubs/<id>/auto).
+# Hysteresis: a running heater stays ON until moisture reaches 35% + band; a running
+# fan stays ON until temperature drops to 35°C - band. Setpoints are unchanged.
+# Dwell: an actuator is not switched again until it has held its state this long.
+AUTO_CONFIG_DEFAULTS = {
+    "moisture_hysteresis": 2.0,
+    "temperature_hysteresis": 1.0,
+    "min_dwell_seconds": 30.0,
+}
+
+auto_control_stats = {
+    "ticks": 0,
+    "hubs_evaluated": 0,
+    "hubs_skipped": 0,
+    "dispatched": 0,
+    "avoided_by_hysteresis": 0,
+    "avoided_by_dwell": 0,
+    "last_tick_ms": None,
+}
+
+# Epoch seconds of the last heater/fan state change: { (hub_id, field): ts }
+actuator_changed_at = {}
+
+# Why a heater/fan switch is currently held back: { (hub_id, field): 'hysteresis' | 'dwell' }
+auto_suppressed = {}
+
+
+def set_actuator_state(hub, field, value):
+    """
+    Set device_state/servo_state on a hub record being updated (inside
+    hub_store.update) and remember when it last changed (for dwell times).
+    """
+    if getattr(hub, field) != value:
+        actuator_changed_at[(hub.id, field)] = time.time()
+        auto_suppressed.pop((hub.id, field), None)
+    setattr(hub, field, value)
+
+
+def note_suppressed(hub_id, field, reason):
+    """
+    Track why a hub's heater/fan switch is held back (None = not held).
+    True only when it newly enters that state, so a switch held for many
+    ticks is counted as one avoided switch.
+    """
+    key = (hub_id, field)
+    if reason is None:
+        auto_suppressed.pop(key, None)
+        return False
+    if auto_suppressed.get(key) == reason:
+        return False
+    auto_suppressed[key] = reason
+    return True
+
+
+def get_auto_config(hub):
+    """Effective auto-control settings for a hub (defaults plus its overrides)."""
+    return dict(AUTO_CONFIG_DEFAULTS, **(hub.auto_config or {}))
+
+
+def compute_auto_targets(temperatures, moistures, heaters, fans, temp_bands=None, moisture_bands=None):
+    """
+    Desired heater/fan states for columns of hub readings, in one pass.
+    With hysteresis bands, an actuator that is already ON is only switched OFF
+    once the reading is back inside the normal range by the band width.
+    Outside the defined bands (moisture > 80%, temperature < 10°C) the current
+    state is kept. Returns (desired_heaters, desired_fans, held_heaters,
+    held_fans); the held columns are True where only the band kept it ON.
+    Columns are plain lists walked once per actuator — without NumPy (not a
+    dependency) that beats per-column comprehensions; see benchmarks/auto_control.py.
+    """
+    n = len(heaters)
+    temp_bands = temp_bands if temp_bands is not None else [0.0] * n
+    moisture_bands = moisture_bands if moisture_bands is not None else [0.0] * n
+
+    desired_heaters, held_heaters = [], []
+    for m, cur, band in zip(moistures, heaters, moisture_bands):
+        held = False
+        if m < AUTO_MOISTURE_LOW:
+            desired = 'ON'
+        elif m <= AUTO_MOISTURE_HIGH:
+            held = cur == 'ON' and m < AUTO_MOISTURE_LOW + band
+            desired = 'ON' if held else 'OFF'
+        else:
+            desired = cur
+        desired_heaters.append(desired)
+        held_heaters.append(held)
+
+    desired_fans, held_fans = [], []
+    for t, cur, band in zip(temperatures, fans, temp_bands):
+        held = False
+        if t > AUTO_TEMP_HIGH:
+            desired = 'ON'
+        elif t >= AUTO_TEMP_LOW:
+            held = cur == 'ON' and t > AUTO_TEMP_HIGH - band
+            desired = 'ON' if held else 'OFF'
+        else:
+            desired = cur
+        desired_fans.append(desired)
+        held_fans.append(held)
+
+    return desired_heaters, desired_fans, held_heaters, held_fans
 
-    # Moisture not optimal (<35%) -> heater ON, optimal (35-80%) -> heater OFF
-    desired_heater = 'ON' if moisture < 35 else 'OFF' if moisture <= 80 else current_heater
-    # Temperature not optimal (>35°C) -> fan ON, normal (10-35°C) -> fan OFF
-    desired_fan = 'ON' if temp > 35 else 'OFF' if temp >= 10 else current_fan
+
+def run_auto_control(hub_id, hub, desired_heater, desired_fan):
+    """Actuate heater/fan towards the desired states (runs on an actuation worker)."""
+    hub = hub_store.get(hub_id)  # the latest record, not the one seen when queued
+    if hub is None or not hub.device_ip:
+        return
+
+    # Re-check against current state: an earlier command may already have applied it
+    current_heater = hub.device_state or 'OFF'
+    current_fan = hub.servo_state or 'OFF'
+    if desired_heater == current_heater and desired_fan == current_fan:
+        return
 
     try:
         # Only send commands when state needs to change
         if desired_heater != current_heater:
-            url = f"http://{device_ip}/toggle?state={'on' if desired_heater == 'ON' else 'off'}"
-            req = urllib.request.Request(url)
-            urllib.request.urlopen(req, timeout=2)
-            hub['device_state'] = desired_heater
+            send_device_command(hub, 'toggle', 'on' if desired_heater == 'ON' else 'off', timeout=2)
+            hub_store.update(hub_id, lambda h: set_actuator_state(h, 'device_state', desired_heater))
 
         if desired_fan != current_fan:
-            url = f"http://{device_ip}/servo?state={'on' if desired_fan == 'ON' else 'off'}"
-            req = urllib.request.Request(url)
-            urllib.request.urlopen(req, timeout=2)
-            hub['servo_state'] = desired_fan
+            send_device_command(hub, 'servo', 'on' if desired_fan == 'ON' else 'off', timeout=2)
+            hub_store.update(hub_id, lambda h: set_actuator_state(h, 'servo_state', desired_fan))
     except Exception as e:
         print(f"[AUTO] Control error for {hub_id}: {e}")
+    finally:
+        hub = hub_store.get(hub_id)
+        if hub is not None:
+            publish_hub_change(hub)
+
+
+def auto_control_tick():
+    """
+    Evaluate every auto_mode hub once: gather readings into columns, compute
+    targets in one pass, and dispatch only hubs whose state must change.
+    Hubs with a missing or non-finite reading or setting are skipped (and
+    counted) without holding up the rest.
+    Switches suppressed by hysteresis or by minimum dwell time are counted
+    once each, when they start being held back.
+    Cost scales with the number of auto_mode hubs, not the ingest rate.
+    """
+    started = time.perf_counter()
+    now = time.time()
+    hubs, dwells = [], []
+    temperatures, moistures, temp_bands, moisture_bands = [], [], [], []
+    skipped = 0
+    for hub in hub_store.values():
+        if not (hub.auto_mode and hub.device_ip):
+            continue
+        config = get_auto_config(hub) if hub.auto_config else AUTO_CONFIG_DEFAULTS
+        temperature, moisture = hub.temperature, hub.moisture
+        temp_band, moisture_band = config['temperature_hysteresis'], config['moisture_hysteresis']
+        dwell = config['min_dwell_seconds']
+        # One check for all five: the sum is finite only if each is, and non-numbers raise TypeError
+        try:
+            valid = math.isfinite(temperature + moisture + temp_band + moisture_band + dwell)
+        except TypeError:
+            valid = False
+        if not valid:
+            skipped += 1
+            continue
+        hubs.append((hub.id, hub))
+        temperatures.append(temperature)
+        moistures.append(moisture)
+        temp_bands.append(temp_band)
+        moisture_bands.append(moisture_band)
+        dwells.append(dwell)
+    heaters = [hub.device_state or 'OFF' for _, hub in hubs]
+    fans = [hub.servo_state or 'OFF' for _, hub in hubs]
+
+    desired_heaters, desired_fans, held_heaters, held_fans = compute_auto_targets(
+        temperatures, moistures, heaters, fans, temp_bands, moisture_bands)
+
+    dispatched = avoided_hysteresis = avoided_dwell = 0
+    for i, (hub_id, hub) in enumerate(hubs):
+        min_dwell = dwells[i]
+        targets = []
+        for field, current, band_held, desired in (('device_state', heaters[i], held_heaters[i], desired_heaters[i]),
+                                                   ('servo_state', fans[i], held_fans[i], desired_fans[i])):
+            held = 'hysteresis' if band_held else None
+            # Hold any actuator that switched less than min_dwell_seconds ago
+            if desired != current and now - actuator_changed_at.get((hub_id, field), 0) < min_dwell:
+                desired, held = current, 'dwell'
+            if note_suppressed(hub_id, field, held):
+                if held == 'dwell':
+                    avoided_dwell += 1
+                else:
+                    avoided_hysteresis += 1
+            targets.append(desired)
+        heater, fan = targets
+
+        if heater != heaters[i] or fan != fans[i]:
+            if queue_auto_control(hub_id, hub, heater, fan) is not None:
+                dispatched += 1
+
+    # Forget hubs that left auto mode (or were deleted)
+    evaluated = {hub_id for hub_id, _ in hubs}
+    for key in [key for key in auto_suppressed if key[0] not in evaluated]:
+        auto_suppressed.pop(key, None)
+
+    auto_control_stats["ticks"] += 1
+    auto_control_stats["hubs_evaluated"] += len(hubs)
+    auto_control_stats["hubs_skipped"] += skipped
+    auto_control_stats["dispatched"] += dispatched
+    auto_control_stats["avoided_by_hysteresis"] += avoided_hysteresis
+    auto_control_stats["avoided_by_dwell"] += avoided_dwell
+    auto_control_stats["last_tick_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+
+def auto_control_loop():
+    """Run auto_control_tick every AUTO_CONTROL_INTERVAL seconds."""
+    while True:
+        started = time.monotonic()
+        try:
+            auto_control_tick()
+        except Exception as e:
+            print(f"[AUTO] Tick error: {e}")
+        time.sleep(max(0.0, AUTO_CONTROL_INTERVAL - (time.monotonic() - started)))
 
 # ─────────────────────────────────────────────
 #  FIREBASE ADMIN SDK INIT
 # ─────────────────────────────────────────────
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-
-# Initialize Firebase Admin SDK
 # Use a service account key file if available, otherwise use application default credentials
 SERVICE_ACCOUNT_PATH = os.path.join(os.path.dirname(__file__), 'serviceAccountKey.json')
 
-if os.path.exists(SERVICE_ACCOUNT_PATH):
-    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-    firebase_admin.initialize_app(cred)
-else:
-    # Fallback: try default credentials
-    try:
-        firebase_admin.initialize_app()
-    except Exception:
-        print("⚠️  No Firebase credentials found. Firestore features will be disabled.")
-        firebase_admin._apps.clear()
+# Firestore client, created on first use by get_firestore()
+firestore_state = {"initialized": False, "client": None, "init_ms": None}
+firestore_init_lock = threading.Lock()
 
-firestore_db = None
-try:
-    firestore_db = firestore.client()
-    print("✅ Firestore connected successfully")
-except Exception as e:
-    print(f"⚠️  Firestore unavailable: {e}")
+
+def get_firestore():
+    """
+    Return the Firestore client (None when Firebase is unavailable).
+    The Admin SDK is imported and initialized on first call — it can block on
+    credential discovery and network — so importing this module stays cheap.
+    """
+    if firestore_state["initialized"]:
+        return firestore_state["client"]
+    with firestore_init_lock:
+        if firestore_state["initialized"]:
+            return firestore_state["client"]
+        started = time.perf_counter()
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
+        # Initialize Firebase Admin SDK
+        if os.path.exists(SERVICE_ACCOUNT_PATH):
+            cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
+            firebase_admin.initialize_app(cred)
+        else:
+            # Fallback: try default credentials
+            try:
+                firebase_admin.initialize_app()
+            except Exception:
+                print("⚠️  No Firebase credentials found. Firestore features will be disabled.")
+                firebase_admin._apps.clear()
+
+        try:
+            firestore_state["client"] = firestore.client()
+            print("✅ Firestore connected successfully")
+        except Exception as e:
+            print(f"⚠️  Firestore unavailable: {e}")
+        firestore_state["init_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        firestore_state["initialized"] = True
+        return firestore_state["client"]
 
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
@@ -119,16 +476,31 @@ sensor_history = {key: [] for key in sensor_data}
 #  HUB DATA STORE (local — no Firestore writes for sensor data)
 # ─────────────────────────────────────────────
 
-# Each hub: { id, name, organizer_id, organizer_email, temperature, moisture, last_updated, status }
-hubs_data = {}
+# Each hub is a Hub record (id, name, organizer_id, organizer_email, temperature, moisture,
+# last_updated, status, plus device fields once reported); hub.to_dict() is the API shape.
+# Records are copy-on-write — change them only through hub_store.update()/put()
+hub_store = HubStore()
 
 def generate_hub_id():
     """Generate a short unique hub ID."""
     return f"HUB-{uuid.uuid4().hex[:6].upper()}"
 
+def hub_from_firestore(hub_id, data):
+    """Build a hub record from a Firestore 'hubs' document."""
+    return Hub.from_dict({
+        "id": hub_id,
+        "name": data.get("name", "Unnamed Hub"),
+        "organizer_id": data.get("organizer_id", ""),
+        "organizer_email": data.get("organizer_email", ""),
+        "temperature": data.get("temperature", 25.0),
+        "moisture": data.get("moisture", 50.0),
+        "last_updated": data.get("last_updated"),
+        "status": data.get("status", "online"),
+    })
+
 def load_hubs_from_firestore():
     """Load all hubs from the Firestore 'hubs' collection on startup."""
-    global hubs_data
+    firestore_db = get_firestore()
     if not firestore_db:
         print("⚠️  Firestore not available — starting with empty hub list")
         return
@@ -136,53 +508,407 @@ def load_hubs_from_firestore():
         hubs_ref = firestore_db.collection('hubs')
         docs = hubs_ref.get()
         for d in docs:
-            data = d.to_dict()
-            hub_id = d.id
-            hubs_data[hub_id] = {
-                "id": hub_id,
-                "name": data.get("name", "Unnamed Hub"),
-                "organizer_id": data.get("organizer_id", ""),
-                "organizer_email": data.get("organizer_email", ""),
-                "temperature": data.get("temperature", 25.0),
-                "moisture": data.get("moisture", 50.0),
-                "last_updated": data.get("last_updated", datetime.now().isoformat()),
-                "status": data.get("status", "online"),
-            }
-        print(f"✅ Loaded {len(hubs_data)} hubs from Firestore")
+            hub_store.put(hub_from_firestore(d.id, d.to_dict()))
+        print(f"✅ Loaded {len(hub_store)} hubs from Firestore")
     except Exception as e:
         print(f"⚠️  Error loading hubs from Firestore: {e}")
 
-def sync_hub_to_firestore(hub_id, hub_data):
-    """Write a hub's metadata to Firestore (not sensor readings to save cost)."""
+# Hub metadata that Firestore is authoritative for when reconciling a restored snapshot
+RECONCILED_HUB_FIELDS = ('name', 'organizer_id', 'organizer_email')
+
+def reconcile_hubs_with_firestore():
+    """
+    Merge the Firestore 'hubs' collection into hubs restored from the local
+    snapshot (runs in the background after a warm restart). Firestore wins for
+    hub metadata; runtime fields (device IP, actuator state, auto mode, latest
+    readings) are kept. Hubs only in Firestore are added unless deleted
+    locally; hubs missing from Firestore are queued for sync again.
+    """
+    firestore_db = get_firestore()
     if not firestore_db:
         return
+    started = time.perf_counter()
     try:
-        hub_doc = {
-            "name": hub_data["name"],
-            "organizer_id": hub_data.get("organizer_id", ""),
-            "organizer_email": hub_data.get("organizer_email", ""),
-            "status": hub_data.get("status", "online"),
-            "temperature": hub_data.get("temperature", 25.0),
-            "moisture": hub_data.get("moisture", 50.0),
-            "last_updated": hub_data.get("last_updated", datetime.now().isoformat()),
-        }
-        firestore_db.collection('hubs').document(hub_id).set(hub_doc, merge=True)
+        docs = firestore_db.collection('hubs').get()
     except Exception as e:
-        print(f"⚠️  Firestore sync error for hub {hub_id}: {e}")
+        print(f"⚠️  Error reconciling hubs with Firestore: {e}")
+        return
+    seen, added, changed = set(), [], 0
+    for d in docs:
+        seen.add(d.id)
+        if hub_state and hub_state.is_deleted(d.id):
+            delete_hub_from_firestore(d.id)
+            continue
+        data = d.to_dict()
+        hub = hub_store.get(d.id)
+        if hub is None:
+            hub = hub_store.put(hub_from_firestore(d.id, data))
+            added.append(d.id)
+            publish_hub_change(hub)
+            continue
+        updates = {key: data[key] for key in RECONCILED_HUB_FIELDS if key in data and getattr(hub, key) != data[key]}
+        if updates:
+            hub = hub_store.update(d.id, **updates)
+            if hub is not None:
+                changed += 1
+                publish_hub_change(hub)
+    resynced = 0
+    for hub in hub_store.values():
+        hub_id = hub.id
+        if hub_id not in seen:
+            sync_hub_to_firestore(hub_id, hub)
+            resynced += 1
+    hub_sensor_history.warm(added)
+    print(f"✅ Reconciled hubs with Firestore in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"({len(added)} added, {changed} updated, {resynced} re-synced)")
+
+class FirestoreSyncQueue:
+    """
+    Write-behind queue for hub metadata writes to Firestore.
+    Request handlers only enqueue; a background thread flushes pending writes
+    with batched commits when the queue reaches `max_pending` documents or every
+    `flush_interval` seconds. Repeated writes to the same hub are coalesced so
+    only the latest document (or delete) is sent. Failed batches are re-queued
+    and retried with exponential backoff.
+    """
 
-def delete_hub_from_firestore(hub_id):
-    """Delete a hub from Firestore."""
-    if not firestore_db:
+    MAX_BATCH_OPS = 500  # Firestore batched write limit
+
+    def __init__(self, flush_interval=1.0, max_pending=500, max_backoff=60.0):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.pending = {}  # { hub_id: ('set', doc) | ('delete', None) }
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "ops_written": 0,
+            "failures": 0,
+            "last_flush_ms": None,
+            "last_flush_at": None,
+            "last_error": None,
+        }
+
+    def enqueue(self, hub_id, op, doc=None):
+        with self.cond:
+            if hub_id in self.pending:
+                self.stats["coalesced"] += 1
+            self.pending[hub_id] = (op, doc)
+            self.stats["enqueued"] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='firestore-sync', daemon=True)
+                self.thread.start()
+            if len(self.pending) >= self.max_pending:
+                self.cond.notify()
+
+    def _take(self, limit):
+        """Pop up to `limit` pending ops (caller holds the lock)."""
+        ops = []
+        for hub_id in list(self.pending)[:limit]:
+            ops.append((hub_id,) + self.pending.pop(hub_id))
+        self.in_flight += len(ops)
+        return ops
+
+    def _requeue(self, ops):
+        """Put failed ops back unless a newer write for the same hub arrived meanwhile."""
+        with self.cond:
+            for hub_id, op, doc in ops:
+                self.pending.setdefault(hub_id, (op, doc))
+
+    def _commit(self, ops):
+        firestore_db = get_firestore()
+        started = time.perf_counter()
+        batch = firestore_db.batch()
+        hubs_ref = firestore_db.collection('hubs')
+        for hub_id, op, doc in ops:
+            if op == 'delete':
+                batch.delete(hubs_ref.document(hub_id))
+            else:
+                batch.set(hubs_ref.document(hub_id), doc, merge=True)
+        batch.commit()
+        with self.cond:
+            self.stats["flushes"] += 1
+            self.stats["ops_written"] += len(ops)
+            self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.stats["last_flush_at"] = datetime.now().isoformat()
+
+    def _flush_ops(self, ops):
+        try:
+            self._commit(ops)
+            return True
+        except Exception as e:
+            print(f"⚠️  Firestore batch sync error ({len(ops)} ops): {e}")
+            with self.cond:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = str(e)
+            self._requeue(ops)
+            return False
+        finally:
+            with self.cond:
+                self.in_flight -= len(ops)
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: len(self.pending) >= self.max_pending, timeout=self.flush_interval)
+                ops = self._take(self.MAX_BATCH_OPS)
+            if not ops:
+                continue
+            if self._flush_ops(ops):
+                backoff = 0.0
+            else:
+                backoff = min(max(backoff * 2, 1.0), self.max_backoff)
+                time.sleep(backoff)
+
+    def flush(self):
+        """Synchronously write everything pending (used at shutdown)."""
+        while True:
+            with self.cond:
+                ops = self._take(self.MAX_BATCH_OPS)
+            if not ops or not self._flush_ops(ops):
+                return
+
+    def status(self):
+        with self.cond:
+            return dict(self.stats, depth=len(self.pending) + self.in_flight, pending=len(self.pending),
+                        in_flight=self.in_flight)
+
+
+firestore_sync_queue = FirestoreSyncQueue()
+atexit.register(firestore_sync_queue.flush)
+
+
+def sync_hub_to_firestore(hub_id, hub):
+    """Queue a hub's metadata for Firestore (not sensor readings to save cost)."""
+    if not get_firestore():
         return
-    try:
-        firestore_db.collection('hubs').document(hub_id).delete()
-    except Exception as e:
-        print(f"⚠️  Firestore delete error for hub {hub_id}: {e}")
+    hub_doc = {
+        "name": hub.name,
+        "organizer_id": hub.organizer_id,
+        "organizer_email": hub.organizer_email,
+        "status": hub.status,
+        "temperature": hub.temperature,
+        "moisture": hub.moisture,
+        "last_updated": datetime.fromtimestamp(hub.last_updated).isoformat(),
+    }
+    firestore_sync_queue.enqueue(hub_id, 'set', hub_doc)
 
-load_hubs_from_firestore()
+def delete_hub_from_firestore(hub_id):
+    """Queue a hub deletion for Firestore."""
+    if not get_firestore():
+        return
+    firestore_sync_queue.enqueue(hub_id, 'delete')
 
 # Hub sensor history (local only — never sent to Firestore to save costs)
-hub_sensor_history = {}  # { hub_id: [ { time, temperature, moisture }, ... ] }
+# Columnar ring buffer per hub: { hub_id: HubHistoryBuffer(time, temperature, moisture) }
+# backed by a durable append-only log on local disk (set HUB_HISTORY_DIR = None to disable)
+HUB_HISTORY_DIR = os.path.join(os.path.dirname(__file__), 'data', 'history')
+
+history_log = SegmentedHistoryLog(HUB_HISTORY_DIR) if HUB_HISTORY_DIR else None
+hub_sensor_history = HubHistoryStore(capacity=100, backend=history_log)
+
+# Warm restart: hub records and history buffers come back from a local snapshot + WAL,
+# then reconcile with Firestore in the background (set HUB_STATE_DIR = None to disable)
+HUB_STATE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'state')
+
+hub_state = HubStateJournal(HUB_STATE_DIR, hub_store, hub_sensor_history) if HUB_STATE_DIR else None
+
+
+# ─────────────────────────────────────────────
+#  HUB CHANGE EVENTS (fan-out for the SSE stream)
+# ─────────────────────────────────────────────
+
+class HubEventBroadcaster:
+    """
+    Shared fan-out of hub change events to SSE subscribers.
+    Each change is serialized once into an SSE frame and kept in a bounded
+    backlog; subscribers only filter and forward frames, so N subscribers
+    never means N serializations. Event IDs are monotonic, which lets clients
+    resume with Last-Event-ID while the event is still in the backlog.
+    Like ChangeLog sequence numbers, IDs start from the process start time in
+    microseconds, so an ID from an earlier process never falls inside this
+    backlog and the client gets a fresh snapshot instead.
+    """
+
+    def __init__(self, max_events=1000):
+        self.events = deque(maxlen=max_events)  # (event_id, organizer_id, organizer_email, frame)
+        self.last_id = int(time.time() * 1_000_000)
+        self.cond = threading.Condition()
+
+    def publish(self, event, payload, organizer_id='', organizer_email=''):
+        """Append an event; payload is a JSON-serializable object or an already-encoded JSON string."""
+        data = payload if isinstance(payload, str) else json.dumps(payload, separators=(',', ':'))
+        with self.cond:
+            self.last_id += 1
+            frame = f"id: {self.last_id}\nevent: {event}\ndata: {data}\n\n"
+            self.events.append((self.last_id, organizer_id, organizer_email, frame))
+            self.cond.notify_all()
+
+    def events_since(self, last_id):
+        """Events newer than last_id, or None if last_id has fallen out of the backlog."""
+        with self.cond:
+            if last_id == self.last_id:
+                return []
+            if last_id > self.last_id:
+                return None  # cursor from another process
+            if not self.events or last_id < self.events[0][0] - 1:
+                return None
+            skip = last_id - self.events[0][0] + 1
+            return [self.events[i] for i in range(skip, len(self.events))]
+
+    def wait(self, last_id, timeout):
+        """Block until an event newer than last_id is published (or timeout)."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.last_id > last_id, timeout)
+
+
+hub_events = HubEventBroadcaster()
+
+
+# ─────────────────────────────────────────────
+#  CHANGE LOG (delta sync for ?since=<seq>)
+# ─────────────────────────────────────────────
+
+class ChangeLog:
+    """
+    Bounded log of which hubs and orders changed, for delta sync.
+    Every change gets the next global sequence number. Entries name the
+    changed record; readers look up its current state (missing = deleted), so
+    concurrent writers can never make the log replay an older version.
+    Entries also carry the record's indexed fields before and after the change
+    (`tags`), so filtered readers only hear about records they could have seen.
+    Sequence numbers start from the process start time in microseconds, so a
+    cursor from an earlier process always falls before the log and resyncs.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.entries = deque(maxlen=max_entries)  # (seq, collection, key, tags before, tags after)
+        self.seq = int(time.time() * 1_000_000)
+        self.tags = {}  # { (collection, key): tags of the last logged version }
+        self.lock = threading.Lock()
+
+    def seed(self, collection, items):
+        """Remember the tags of records loaded without a change, as (key, tags) pairs."""
+        with self.lock:
+            for key, tags in items:
+                self.tags.setdefault((collection, key), tags)
+
+    def append(self, collection, key, tags=None):
+        """Log a change to `key`; `tags` are the new version's indexed fields (None once deleted)."""
+        with self.lock:
+            self.seq += 1
+            if tags is None:
+                before = self.tags.pop((collection, key), None)
+            else:
+                before = self.tags.get((collection, key))
+                self.tags[(collection, key)] = tags
+            self.entries.append((self.seq, collection, key, before, tags))
+
+    def since(self, collection, seq, filters=None):
+        """
+        (latest_seq, keys) where keys are the distinct keys in `collection`
+        changed after seq, oldest first — or (latest_seq, None) if seq is not
+        covered by the log and the client needs a full resync. With `filters`
+        (field=value on the tags), keys that matched them neither at `seq` nor
+        in any later version are left out.
+        """
+
+        def matches(tags):
+            return tags is not None and all(tags.get(field) == value for field, value in filters.items())
+
+        with self.lock:
+            latest = self.seq
+            first = self.entries[0][0] if self.entries else latest + 1
+            if seq > latest or seq < first - 1:
+                return latest, None
+            keys = {}
+            for _, name, key, before, after in islice(self.entries, seq - first + 1, None):
+                if name == collection:
+                    seen = keys.pop(key, False)
+                    keys[key] = seen or not filters or matches(before) or matches(after)
+            return latest, [key for key, seen in keys.items() if seen]
+
+    def status(self):
+        with self.lock:
+            return {
+                "seq": self.seq,
+                "entries": len(self.entries),
+                "oldest_seq": self.entries[0][0] if self.entries else None,
+            }
+
+
+change_log = ChangeLog()
+
+
+def parse_since():
+    """The ?since= cursor as an int, or None if not given (ValueError if malformed)."""
+    since = request.args.get('since')
+    return None if since is None else int(since)
+
+
+def hub_tags(hub):
+    """A hub's indexed fields, logged with each change for filtered ?since= reads."""
+    return {field: getattr(hub, field) for field in HubStore.INDEXED}
+
+
+def publish_hub_change(hub):
+    """Notify stream subscribers that a hub was created or changed (and log it for warm restart)."""
+    change_log.append('hubs', hub.id, hub_tags(hub))
+    if hub_state:
+        hub_state.log_put(hub)
+    hub_events.publish('hub', hub.to_json(), hub.organizer_id, hub.organizer_email)
+
+
+def publish_hub_delete(hub):
+    """Notify stream subscribers that a hub was deleted (and log it for warm restart)."""
+    change_log.append('hubs', hub.id)
+    if hub_state:
+        hub_state.log_delete(hub.id)
+    hub_events.publish('delete', {"id": hub.id}, hub.organizer_id, hub.organizer_email)
+
+
+def hub_list_json(hubs=None, hub_fields=None, **fields):
+    """
+    JSON object {"hubs": [...], **fields} built by joining the hubs' cached
+    fragments (all hubs if `hubs` is None), so only changed hubs are re-encoded.
+    `hub_fields` projects each hub to those keys (see parse_hub_fields()).
+    The other fields are encoded by the app's JSON provider, as jsonify() would.
+    """
+    if hub_fields is not None:
+        hubs = hub_store.values() if hubs is None else hubs
+        hubs_json = '[' + ','.join(h.to_json(hub_fields) for h in hubs) + ']'
+    elif hubs is None:
+        hubs_json = hub_store.values_json()
+    else:
+        hubs_json = '[' + ','.join(h.to_json() for h in hubs) + ']'
+    if not fields:
+        return '{"hubs":' + hubs_json + '}'
+    return '{"hubs":' + hubs_json + ',' + app.json.dumps(fields, separators=(',', ':'))[1:]
+
+
+def hub_list_response(hubs=None, hub_fields=None, **fields):
+    return Response(hub_list_json(hubs, hub_fields, **fields), mimetype='application/json')
+
+
+def parse_hub_fields():
+    """
+    The ?fields= projection for hub lists (e.g. ?fields=id,temperature,moisture,status)
+    as a tuple, or None if not given. `id` is always included. Raises
+    ValueError for unknown fields.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in Hub.FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown hub fields: {', '.join(unknown)}")
+    return ('id',) + tuple(field for field in requested if field != 'id')
 
 
 market_data = [
@@ -332,29 +1058,156 @@ network_stats = {
 # Record sensor history periodically
 def record_history():
     while True:
-        ts = datetime.now().isoformat()
+        now = datetime.now()
+        ts = now.isoformat()
         for key, val in sensor_data.items():
             sensor_history[key].append({"time": ts, "value": val})
             # Keep last 100 data points
             if len(sensor_history[key]) > 100:
                 sensor_history[key] = sensor_history[key][-100:]
         
-        # Record hub sensor history
-        for hub_id, hub in hubs_data.items():
-            if hub_id not in hub_sensor_history:
-                hub_sensor_history[hub_id] = []
-            hub_sensor_history[hub_id].append({
-                "time": ts,
-                "temperature": hub["temperature"],
-                "moisture": hub["moisture"],
-            })
-            if len(hub_sensor_history[hub_id]) > 100:
-                hub_sensor_history[hub_id] = hub_sensor_history[hub_id][-100:]
+        # Record hub sensor history (from a snapshot, so hubs created mid-tick are safe)
+        for hub in hub_store.values():
+            try:
+                hub_sensor_history.record(hub.id, now, hub.temperature, hub.moisture)
+            except Exception as e:
+                # One bad record must not stop history for every hub
+                print(f"⚠️  Could not record history for hub {hub.id}: {e}")
         
         time.sleep(5)
 
 history_thread = threading.Thread(target=record_history, daemon=True)
-history_thread.start()
+
+auto_control_thread = threading.Thread(target=auto_control_loop, name='auto-control', daemon=True)
+
+
+# ─────────────────────────────────────────────
+#  STARTUP (application factory + async hub loading)
+# ─────────────────────────────────────────────
+
+# Cold start timings and readiness, reported by /api/ready
+startup_state = {
+    "phase": "imported",  # imported -> loading_hubs -> ready | failed
+    "ready": False,
+    "hub_source": None,  # 'snapshot' | 'firestore' | 'empty'
+    "import_ms": None,
+    "create_app_ms": None,
+    "hub_load_ms": None,
+    "time_to_ready_ms": None,
+    "error": None,
+}
+startup_lock = threading.Lock()
+
+# Open lock files on the data directories this process owns (kept open for its lifetime)
+data_dir_locks = []
+
+
+def lock_data_dir(path):
+    """
+    Take an exclusive, non-blocking lock on a data directory. Returns False if
+    another process (e.g. a second worker or the reloader's parent) holds it.
+    """
+    if fcntl is None:
+        return True
+    os.makedirs(path, exist_ok=True)
+    lock_file = open(os.path.join(path, '.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    data_dir_locks.append(lock_file)
+    return True
+
+
+def claim_data_dirs():
+    """
+    Lock the history and hub state directories before using them. If another
+    process owns one, run without that persistence rather than interleave
+    writes to the same segments, WALs and snapshot.
+    """
+    global history_log, hub_state
+    if history_log and not lock_data_dir(history_log.root):
+        print(f"⚠️  {history_log.root} is in use by another process; hub history will not be persisted")
+        history_log = None
+        hub_sensor_history.backend = None
+    if hub_state and not lock_data_dir(hub_state.root):
+        print(f"⚠️  {hub_state.root} is in use by another process; hub state will not be persisted")
+        hub_state = None
+
+
+def load_hub_state():
+    """
+    Load hubs and their history, then start the background loops. Runs on the
+    'hub-loader' thread so the server accepts traffic (and answers /api/ready)
+    while it works. After a warm restart Firestore is reconciled afterwards.
+    """
+    started = time.perf_counter()
+    try:
+        claim_data_dirs()
+        if history_log:
+            history_log.start()
+            atexit.register(history_log.close)
+        restored = hub_state.restore() if hub_state else None
+        if restored:
+            print(f"✅ Restored {restored['hubs']} hubs from local snapshot "
+                  f"(+{restored['wal_records']} WAL records) in {restored['ms']} ms")
+            startup_state["hub_source"] = "snapshot"
+        else:
+            load_hubs_from_firestore()
+            startup_state["hub_source"] = "firestore" if firestore_state["client"] else "empty"
+        change_log.seed('hubs', ((hub.id, hub_tags(hub)) for hub in hub_store.values()))
+        if history_log:
+            hub_sensor_history.warm(hub_store.ids())
+        if hub_state:
+            hub_state.start()
+            atexit.register(hub_state.close)
+    except Exception as e:
+        startup_state.update(phase="failed", error=str(e))
+        print(f"⚠️  Hub loading failed: {e}")
+        return
+
+    history_thread.start()
+    auto_control_thread.start()
+    now = time.perf_counter()
+    startup_state.update(phase="ready", ready=True, hub_load_ms=round((now - started) * 1000, 1),
+                         time_to_ready_ms=round((now - IMPORT_STARTED) * 1000, 1))
+    print(f"✅ Ready in {startup_state['time_to_ready_ms']} ms ({len(hub_store)} hubs from "
+          f"{startup_state['hub_source']})")
+    if restored:
+        reconcile_hubs_with_firestore()
+
+
+def create_app():
+    """
+    Application factory: start hub loading in the background and return the
+    Flask app. Safe to call more than once (later calls just return the app).
+    Call it only in the process that serves requests, after any fork.
+    """
+    with startup_lock:
+        if startup_state["phase"] == "imported":
+            started = time.perf_counter()
+            startup_state["phase"] = "loading_hubs"
+            threading.Thread(target=load_hub_state, name='hub-loader', daemon=True).start()
+            startup_state["create_app_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return app
+
+
+@app.before_request
+def require_hubs_loaded():
+    """
+    Hub routes answer 503 until hubs are loaded, rather than 404 for every hub.
+    Starts loading on the first request if create_app() was never called.
+    """
+    if startup_state["ready"]:
+        return None
+    if startup_state["phase"] == "imported":
+        create_app()
+    if request.path.startswith(('/api/hubs', '/admin/hubs')):
+        response = jsonify({"error": "Hub data is still loading", "phase": startup_state["phase"]})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return None
 
 
 # ─────────────────────────────────────────────
@@ -371,17 +1224,248 @@ def admin_required(f):
     return decorated_function
 
 
+# ─────────────────────────────────────────────
+#  CONDITIONAL GET (ETags from collection versions)
+# ─────────────────────────────────────────────
+
+class CollectionVersions:
+    """
+    A monotonically increasing version per in-memory collection, bumped by
+    every write to it. ETags are built from the versions a route reads plus a
+    per-process ID, so a restarted server never reuses an old tag.
+    """
+
+    def __init__(self, *names, **sources):
+        self.counts = dict.fromkeys(names, 0)
+        self.sources = sources  # { name: callable } for collections that keep their own version
+        self.lock = threading.Lock()
+        self.instance = uuid.uuid4().hex[:8]
+
+    def bump(self, *names):
+        with self.lock:
+            for name in names:
+                self.counts[name] += 1
+
+    def get(self, name):
+        source = self.sources.get(name)
+        return source() if source else self.counts[name]
+
+    def etag(self, *names):
+        return self.instance + '-' + '.'.join(str(self.get(name)) for name in names)
+
+
+collection_versions = CollectionVersions(
+    'market', 'orders', 'transactions', 'buyer_stats', 'seller_stats', 'organizer_stats',
+    hubs=lambda: hub_store.version,
+    directory=lambda: admin_directory_version(),
+)
+
+
+def versioned(*collections):
+    """
+    Decorator for GET routes that only read the named collections: responses
+    carry a weak ETag from their versions, and a matching If-None-Match is
+    answered with 304 without running the route (the query string is part of
+    the cached URL, so filtered variants share the tag safely). A compressed
+    body already cached for the same tag is served without running it either.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Read the versions before building the body: a concurrent write can only make the tag older
+            tag = collection_versions.etag(*collections)
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+            else:
+                response = cached_compressed_response(tag)
+                if response is None:
+                    response = app.make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+            response.set_etag(tag, weak=True)
+            return response
+        return decorated_function
+    return decorator
+
+
+# ─────────────────────────────────────────────
+#  RESPONSE COMPRESSION
+# ─────────────────────────────────────────────
+
+# JSON bodies smaller than this are sent uncompressed (not worth the CPU or the header)
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVELS = {'br': 5, 'gzip': 6}
+
+# Compressed bodies of ETag-versioned responses, reused until the versions change:
+# { (path with query, etag, encoding): bytes }, least recently used dropped first
+COMPRESSED_CACHE_SIZE = 64
+compressed_cache = {}
+compressed_cache_lock = threading.Lock()
+
+
+def choose_encoding():
+    """Best content coding the client accepts: br (if brotli is installed), then gzip."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def cached_compressed_response(etag):
+    """A response from the compressed-body cache for this URL and ETag, or None."""
+    encoding = choose_encoding()
+    key = (request.full_path, etag, encoding)
+    with compressed_cache_lock:
+        body = compressed_cache.pop(key, None) if encoding else None
+        if body is None:
+            return None
+        compressed_cache[key] = body  # most recently used
+    response = Response(body, mimetype='application/json')
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESS_LEVELS['br'])
+    return gzip.compress(body, compresslevel=COMPRESS_LEVELS['gzip'], mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress JSON responses of at least COMPRESS_MIN_BYTES with the best
+    encoding the client accepts. For responses with an ETag the compressed
+    body is cached, so polls of an unchanged collection skip compression.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None or response.content_length is None or response.content_length < COMPRESS_MIN_BYTES:
+        return response
+
+    etag = response.get_etag()[0]
+    key = (request.full_path, etag, encoding) if etag else None
+    with compressed_cache_lock:
+        body = compressed_cache.pop(key, None) if key else None
+        if body is not None:
+            compressed_cache[key] = body  # most recently used
+    if body is None:
+        body = compress_body(response.get_data(), encoding)
+        if key:
+            with compressed_cache_lock:
+                compressed_cache[key] = body
+                while len(compressed_cache) > COMPRESSED_CACHE_SIZE:
+                    del compressed_cache[next(iter(compressed_cache))]
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
 # ─────────────────────────────────────────────
 #  FIRESTORE HELPERS
 # ─────────────────────────────────────────────
 
+# Columns the admin dashboard renders — Firestore field masks, so unused fields are never downloaded
+PROFILE_FIELDS = ['full_name', 'email', 'role', 'created_at']
+PROFILE_ROLES = ('organizer', 'buyer', 'seller')
+COLLATERAL_FIELDS = ['collateral_id', 'seller_name', 'seller_email', 'crop_name', 'crop_quantity', 'crop_unit',
+                     'crop_total_value', 'loan_amount_requested', 'status', 'created_at']
+
+# Server-side orderings for paginated listings: [(field, direction)], document ID breaks ties
+PROFILE_ORDER = [('__name__', 'ASCENDING')]
+COLLATERAL_ORDER = [('created_at', 'DESCENDING')]
+
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
+
+
+def encode_page_cursor(values):
+    """Opaque cursor for the order-by values of the last document on a page."""
+    values = [{"$ts": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_page_cursor(cursor):
+    """Order-by values from encode_page_cursor() (ValueError if malformed)."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return [datetime.fromisoformat(v["$ts"]) if isinstance(v, dict) and "$ts" in v else v for v in values]
+
+
+def get_firestore_page(collection, order, fields, id_key, limit, cursor=None, where=None):
+    """
+    One page of a Firestore collection as (records, next_cursor), ordered and
+    limited server-side with start_after(cursor), fetching only `fields`.
+    Documents without an order-by field are skipped by Firestore. next_cursor
+    is None on the last page. Raises ValueError for a malformed cursor,
+    including one Firestore rejects (HTTP 400) as not matching the ordering.
+    """
+    firestore_db = get_firestore()
+    if not firestore_db:
+        return [], None
+    if order[-1][0] != '__name__':
+        order = order + [('__name__', order[-1][1])]
+    order_keys = [field for field, _ in order]
+    start_after = dict(zip(order_keys, decode_page_cursor(cursor))) if cursor else None
+    if start_after is not None and len(start_after) != len(order_keys):
+        raise ValueError("Invalid cursor")
+    try:
+        query = firestore_db.collection(collection)
+        for field, value in (where or {}).items():
+            query = query.where(field, '==', value)
+        for field, direction in order:
+            query = query.order_by(field, direction=direction)
+        query = query.select(sorted(set(fields) | set(order_keys[:-1])))
+        if start_after is not None:
+            query = query.start_after(start_after)
+        docs = list(query.limit(limit).stream())
+    except Exception as e:
+        if start_after is not None and (isinstance(e, (ValueError, TypeError)) or getattr(e, 'code', None) == 400):
+            raise ValueError("Invalid cursor") from e
+        print(f"Error fetching {collection} page: {e}")
+        return [], None
+    records = []
+    for doc in docs:
+        data = doc.to_dict()
+        data[id_key] = doc.id
+        records.append(data)
+    next_cursor = None
+    if len(docs) == limit:
+        last = docs[-1]
+        next_cursor = encode_page_cursor([last.id if key == '__name__' else last.get(key) for key in order_keys])
+    return records, next_cursor
+
+
+def parse_page_args():
+    """(limit, cursor) from ?limit= and ?cursor= (ValueError if malformed)."""
+    limit = request.args.get('limit', ADMIN_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+    if not 1 <= limit <= ADMIN_MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {ADMIN_MAX_PAGE_SIZE}")
+    return limit, request.args.get('cursor') or None
+
+
 def get_organizers_from_firestore():
     """Fetch all organizer profiles from Firestore."""
+    firestore_db = get_firestore()
     if not firestore_db:
         return []
     try:
         profiles_ref = firestore_db.collection('profiles')
-        query = profiles_ref.where('role', '==', 'organizer')
+        query = profiles_ref.where('role', '==', 'organizer').select(PROFILE_FIELDS)
         docs = query.get()
         organizers = []
         for doc in docs:
@@ -393,47 +1477,93 @@ def get_organizers_from_firestore():
         print(f"Error fetching organizers: {e}")
         return []
 
-def get_all_profiles_from_firestore():
-    """Fetch all profiles from Firestore."""
+def count_firestore_query(query):
+    """Number of documents matching a query, via a count aggregation (no documents are read)."""
+    return query.count(alias='count').get()[0][0].value
+
+
+def get_profile_counts_from_firestore():
+    """
+    total_users and role_counts from Firestore count aggregations — billed one
+    read per 1000 matching index entries — instead of downloading every profile.
+    Profiles with a role outside PROFILE_ROLES (or none) are counted as 'other'.
+    """
+    firestore_db = get_firestore()
     if not firestore_db:
-        return []
+        return {"total_users": 0, "role_counts": {}}
     try:
         profiles_ref = firestore_db.collection('profiles')
-        docs = profiles_ref.get()
-        profiles = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['uid'] = doc.id
-            profiles.append(data)
-        return profiles
+        total = count_firestore_query(profiles_ref)
+        counts = {role: count_firestore_query(profiles_ref.where('role', '==', role)) for role in PROFILE_ROLES}
     except Exception as e:
-        print(f"Error fetching profiles: {e}")
-        return []
+        print(f"Error counting profiles: {e}")
+        return {"total_users": 0, "role_counts": {}}
+    role_counts = {role: n for role, n in counts.items() if n}
+    if total > sum(counts.values()):
+        role_counts['other'] = total - sum(counts.values())
+    return {"total_users": total, "role_counts": role_counts}
 
 
 # ─────────────────────────────────────────────
-#  ADMIN DASHBOARD ROUTES
+#  ADMIN STATS SERVICE (cached Firestore aggregation)
 # ─────────────────────────────────────────────
 
+# Seconds the Firestore-backed part of /api/admin/stats is reused between polls
+ADMIN_STATS_TTL = 30
 
-def get_collaterals_from_firestore():
-    """Fetch all collateral records from Firestore."""
-    if not firestore_db:
-        return []
-    try:
-        collaterals_ref = firestore_db.collection('collaterals')
-        docs = collaterals_ref.stream()
-        collaterals = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            collaterals.append(data)
-        # Sort by created_at descending
-        collaterals.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        return collaterals
-    except Exception as e:
-        print(f"Error fetching collaterals: {e}")
-        return []
+admin_stats_cache = {"value": None, "expires_at": 0.0, "version": 0}
+admin_stats_lock = threading.Lock()
+admin_stats_executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix='admin-stats')
+
+
+def get_admin_directory_stats():
+    """
+    Profiles/collaterals part of the admin stats, cached for ADMIN_STATS_TTL
+    (invalidate_admin_stats() forces a refresh). User counts come from count
+    aggregations; all organizers are listed (hub assignment needs them) but
+    only the first page of buyers, sellers and collaterals, with cursors for
+    /api/admin/profiles and /api/admin/collaterals. Queries run concurrently, and only one request
+    refreshes at a time — concurrent callers wait for it and reuse the result.
+    """
+    cached = admin_stats_cache["value"]
+    if cached is not None and time.monotonic() < admin_stats_cache["expires_at"]:
+        return cached
+
+    with admin_stats_lock:
+        cached = admin_stats_cache["value"]
+        if cached is not None and time.monotonic() < admin_stats_cache["expires_at"]:
+            return cached
+
+        counts_future = admin_stats_executor.submit(get_profile_counts_from_firestore)
+        organizers_future = admin_stats_executor.submit(get_organizers_from_firestore)
+        page_futures = {
+            role: admin_stats_executor.submit(get_firestore_page, 'profiles', PROFILE_ORDER, PROFILE_FIELDS, 'uid',
+                                              ADMIN_PAGE_SIZE, None, {"role": role})
+            for role in ('buyer', 'seller')
+        }
+        collaterals_future = admin_stats_executor.submit(get_firestore_page, 'collaterals', COLLATERAL_ORDER,
+                                                         COLLATERAL_FIELDS, 'id', ADMIN_PAGE_SIZE)
+        stats = counts_future.result()
+        stats["organizers"] = organizers_future.result()
+        stats["buyers"], stats["buyers_next_cursor"] = page_futures['buyer'].result()
+        stats["sellers"], stats["sellers_next_cursor"] = page_futures['seller'].result()
+        stats["collaterals"], stats["collaterals_next_cursor"] = collaterals_future.result()
+
+        admin_stats_cache["value"] = stats
+        admin_stats_cache["expires_at"] = time.monotonic() + ADMIN_STATS_TTL
+        admin_stats_cache["version"] += 1
+        return stats
+
+
+def admin_directory_version():
+    """Version of the cached directory stats, refreshing them first if they expired."""
+    get_admin_directory_stats()
+    return admin_stats_cache["version"]
+
+
+def invalidate_admin_stats():
+    """Drop cached admin stats so the next request re-reads Firestore."""
+    admin_stats_cache["expires_at"] = 0.0
 
 
 # ─────────────────────────────────────────────
@@ -484,33 +1614,113 @@ def admin_dashboard():
 # ─────────────────────────────────────────────
 
 @app.route('/api/hubs', methods=['GET'])
+@versioned('hubs')
 def get_hubs():
-    """Get all hubs with their sensor data. Supports filtering by organizer_id or organizer_email."""
-    organizer_id = request.args.get('organizer_id')
-    organizer_email = request.args.get('organizer_email')
-    
-    if organizer_id:
-        filtered = {k: v for k, v in hubs_data.items() if v.get('organizer_id') == organizer_id}
-        return jsonify({"hubs": list(filtered.values()), "timestamp": datetime.now().isoformat()})
+    """
+    Get all hubs with their sensor data. Supports filtering by organizer_id,
+    organizer_email and status, alone or combined
+    (e.g. ?organizer_id=..&status=online); filters use the hub store's indexes.
+    Every response carries `seq`; ?since=<seq> returns only hubs changed after
+    it, with removed hubs (or hubs no longer matching the filters) listed in
+    `deleted` — hubs that never matched the filters since the cursor are left
+    out. If the cursor is older than the change log, the full list is
+    returned with resync: true. ?fields=id,temperature,.. limits each hub to those keys.
+    """
+    filters = {key: request.args[key] for key in HubStore.INDEXED if request.args.get(key)}
+    try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({"error": "'since' must be an integer sequence number"}), 400
+    try:
+        hub_fields = parse_hub_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    if organizer_email:
-        filtered = {k: v for k, v in hubs_data.items() if v.get('organizer_email') == organizer_email}
-        return jsonify({"hubs": list(filtered.values()), "timestamp": datetime.now().isoformat()})
+    seq, changed = change_log.since('hubs', since, filters) if since is not None else (change_log.seq, None)
+    if changed is not None:
+        hubs, deleted = [], []
+        for hub_id in changed:
+            hub = hub_store.get(hub_id)
+            if hub is not None and all(getattr(hub, key) == value for key, value in filters.items()):
+                hubs.append(hub)
+            else:
+                deleted.append(hub_id)
+        return hub_list_response(hubs, hub_fields, deleted=deleted, seq=seq, resync=False,
+                                 timestamp=datetime.now().isoformat())
     
-    return jsonify({"hubs": list(hubs_data.values()), "timestamp": datetime.now().isoformat()})
+    hubs = hub_store.find(**filters) if filters else None
+    extra = {"seq": seq, "resync": True} if since is not None else {"seq": seq}
+    return hub_list_response(hubs, hub_fields, **extra, timestamp=datetime.now().isoformat())
+
+
+@app.route('/api/hubs/stream', methods=['GET'])
+def stream_hubs():
+    """
+    Server-Sent Events stream of hub changes (replaces polling /api/hubs).
+    Supports the same organizer_id / organizer_email filters as /api/hubs.
+    Sends a 'snapshot' event with all matching hubs first, then 'hub' events for
+    changed hubs and 'delete' events for removed ones. Reconnecting clients send
+    Last-Event-ID and receive only what they missed (or a fresh snapshot if the
+    backlog no longer reaches back that far).
+    """
+    organizer_id = request.args.get('organizer_id')
+    organizer_email = request.args.get('organizer_email')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        cursor = int(last_event_id) if last_event_id else None
+    except ValueError:
+        cursor = None
+    filters = {key: value for key, value in (("organizer_id", organizer_id), ("organizer_email", organizer_email)) if value}
+
+    def matches(hub_org_id, hub_org_email):
+        if organizer_id and hub_org_id != organizer_id:
+            return False
+        if organizer_email and hub_org_email != organizer_email:
+            return False
+        return True
+
+    def snapshot():
+        event_id = hub_events.last_id
+        data = hub_list_json(hub_store.find(**filters) if filters else None, timestamp=datetime.now().isoformat())
+        return event_id, f"id: {event_id}\nevent: snapshot\ndata: {data}\n\n"
+
+    def generate():
+        nonlocal cursor
+        yield "retry: 3000\n\n"
+        if cursor is None or hub_events.events_since(cursor) is None:
+            cursor, frame = snapshot()
+            yield frame
+        while True:
+            events = hub_events.events_since(cursor)
+            if events is None:
+                # Fell behind the backlog — resync with a full snapshot
+                cursor, frame = snapshot()
+                yield frame
+                continue
+            for event_id, org_id, org_email, frame in events:
+                cursor = event_id
+                if matches(org_id, org_email):
+                    yield frame
+            if not events and not hub_events.wait(cursor, timeout=15):
+                yield ": keepalive\n\n"
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 
 @app.route('/api/hubs/<hub_id>', methods=['GET'])
 def get_hub(hub_id):
     """Get a specific hub by ID."""
-    if hub_id not in hubs_data:
+    hub = hub_store.get(hub_id)
+    if hub is None:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
     
-    hub = hubs_data[hub_id]
-    history = hub_sensor_history.get(hub_id, [])[-20:]
+    history = hub_sensor_history.tail(hub_id, 20)
     
     return jsonify({
-        "hub": hub,
+        "hub": hub.to_dict(),
         "history": history,
         "timestamp": datetime.now().isoformat()
     })
@@ -520,43 +1730,43 @@ def get_hub(hub_id):
 @admin_required
 def edit_hub_page(hub_id):
     """Serve the page to manually update hub sensor data."""
-    if hub_id not in hubs_data:
+    hub = hub_store.get(hub_id)
+    if hub is None:
         return redirect(url_for('admin_dashboard'))
-    hub = hubs_data[hub_id]
-    return render_template('edit_hub.html', hub=hub)
+    return render_template('edit_hub.html', hub=hub.to_dict())
 
 
 @app.route('/admin/hubs/<hub_id>/update-sensors', methods=['POST'])
 @admin_required
 def update_hub_sensors_manual(hub_id):
     """Manually update hub sensors from the edit page."""
-    if hub_id not in hubs_data:
+    if hub_id not in hub_store:
         return jsonify({"error": "Hub not found"}), 404
         
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
+    readings = {}
+    for key in ('temperature', 'moisture'):
+        if key in data:
+            readings[key] = to_reading(data[key])
+            if readings[key] is None:
+                return jsonify({"error": f"'{key}' must be a number"}), 400
         
-    hub = hubs_data[hub_id]
-    
-    if 'temperature' in data:
-        hub['temperature'] = round(float(data['temperature']), 1)
-    if 'moisture' in data:
-        hub['moisture'] = round(float(data['moisture']), 1)
-        
-    hub['last_updated'] = datetime.now().isoformat()
-    hub['status'] = 'online'
-    
-    # Record to history
-    if hub_id not in hub_sensor_history:
-        hub_sensor_history[hub_id] = []
-    hub_sensor_history[hub_id].append({
-        "time": datetime.now().isoformat(),
-        "temperature": hub['temperature'],
-        "moisture": hub['moisture'],
-    })
+    def change(hub):
+        for key, value in readings.items():
+            setattr(hub, key, value)
+        hub.last_updated = time.time()
+        hub.status = 'online'
+        # Record to history
+        hub_sensor_history.record(hub_id, hub.last_updated, hub.temperature, hub.moisture)
+
+    hub = hub_store.update(hub_id, change)
+    if hub is None:
+        return jsonify({"error": "Hub not found"}), 404
+    publish_hub_change(hub)
     
-    return jsonify({"message": "Hub sensors updated successfully", "hub": hub})
+    return jsonify({"message": "Hub sensors updated successfully", "hub": hub.to_dict()})
 
 
 @app.route('/api/hubs', methods=['POST'])
@@ -565,58 +1775,71 @@ def create_hub():
     data = request.get_json()
     if not data or 'name' not in data:
         return jsonify({"error": "Hub name is required"}), 400
+    for key in ('organizer_id', 'organizer_email'):
+        if not isinstance(data.get(key, ''), str):
+            return jsonify({"error": f"'{key}' must be a string"}), 400
+    readings = {}
+    for key, default in (('temperature', 25.0), ('moisture', 50.0)):
+        readings[key] = to_reading(data.get(key, default))
+        if readings[key] is None:
+            return jsonify({"error": f"'{key}' must be a number"}), 400
     
     hub_id = generate_hub_id()
-    hub = {
-        "id": hub_id,
-        "name": data['name'],
-        "organizer_id": data.get('organizer_id', ''),
-        "organizer_email": data.get('organizer_email', ''),
-        "temperature": data.get('temperature', 25.0),
-        "moisture": data.get('moisture', 50.0),
-        "last_updated": datetime.now().isoformat(),
-        "status": "online",
-    }
-    hubs_data[hub_id] = hub
+    hub = Hub(
+        id=hub_id,
+        name=data['name'],
+        organizer_id=data.get('organizer_id', ''),
+        organizer_email=data.get('organizer_email', ''),
+        temperature=readings['temperature'],
+        moisture=readings['moisture'],
+        last_updated=time.time(),
+        status="online",
+    )
+    hub_store.put(hub)
+    publish_hub_change(hub)
     
     # Sync to Firestore
     sync_hub_to_firestore(hub_id, hub)
     
-    return jsonify({"hub": hub, "message": "Hub created successfully", "timestamp": datetime.now().isoformat()}), 201
+    return jsonify({"hub": hub.to_dict(), "message": "Hub created successfully", "timestamp": datetime.now().isoformat()}), 201
 
 
 @app.route('/api/hubs/<hub_id>', methods=['PUT'])
 def update_hub(hub_id):
     """Update hub details and sync to Firestore."""
-    if hub_id not in hubs_data:
+    if hub_id not in hub_store:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
     
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
-    hub = hubs_data[hub_id]
-    for key in ['name', 'organizer_id', 'organizer_email', 'status']:
-        if key in data:
-            hub[key] = data[key]
-    
-    hub['last_updated'] = datetime.now().isoformat()
+    fields = {key: data[key] for key in ['name', 'organizer_id', 'organizer_email', 'status'] if key in data}
+    for key in HubStore.INDEXED:
+        if key in fields and not isinstance(fields[key], str):
+            return jsonify({"error": f"'{key}' must be a string"}), 400
+    hub = hub_store.update(hub_id, last_updated=time.time(), **fields)
+    if hub is None:
+        return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
+    publish_hub_change(hub)
     
     # Sync to Firestore
     sync_hub_to_firestore(hub_id, hub)
     
-    return jsonify({"hub": hub, "message": "Hub updated", "timestamp": datetime.now().isoformat()})
+    return jsonify({"hub": hub.to_dict(), "message": "Hub updated", "timestamp": datetime.now().isoformat()})
 
 
 @app.route('/api/hubs/<hub_id>', methods=['DELETE'])
 def delete_hub(hub_id):
     """Delete a hub and remove from Firestore."""
-    if hub_id not in hubs_data:
+    hub = hub_store.pop(hub_id)
+    if hub is None:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
     
-    del hubs_data[hub_id]
-    if hub_id in hub_sensor_history:
-        del hub_sensor_history[hub_id]
+    hub_sensor_history.remove(hub_id)
+    actuator_changed_at.pop((hub_id, 'device_state'), None)
+    actuator_changed_at.pop((hub_id, 'servo_state'), None)
+    publish_hub_delete(hub)
     
     # Remove from Firestore
     delete_hub_from_firestore(hub_id)
@@ -628,6 +1851,67 @@ def delete_hub(hub_id):
 #  SENSOR INGESTION ENDPOINT (for IoT devices)
 # ─────────────────────────────────────────────
 
+def parse_reading_time(value):
+    """Parse a reading timestamp (epoch seconds or ISO string). Falls back to now."""
+    if value is None:
+        return datetime.now()
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(float(value))
+        return datetime.fromisoformat(str(value))
+    except (ValueError, TypeError, OverflowError, OSError):
+        return datetime.now()
+
+
+def apply_hub_reading(hub, data, reading_time=None):
+    """
+    Apply one sensor reading to a hub record being updated (inside
+    hub_store.update) and record it to local history.
+    """
+    ts = (reading_time or datetime.now()).timestamp()
+
+    # Invalid readings are ignored (the device keeps reporting)
+    for key in ('temperature', 'moisture'):
+        value = to_reading(data.get(key))
+        if value is not None:
+            setattr(hub, key, value)
+
+    hub.last_updated = ts
+
+    # Save device IP for remote toggle (valid for 30 min)
+    if 'device_ip' in data:
+        device_ip = str(data['device_ip'])
+        if hub.device_ip and hub.device_ip != device_ip:
+            # The device moved: drop the old address's pooled connections and breaker state
+            device_pool.forget(hub.device_ip)
+            device_breakers.forget(hub.device_ip)
+        hub.device_ip = device_ip
+        hub.device_ip_updated = time.time()
+
+    # Reporting in means online, unless commands to the device are failing fast
+    hub.status = 'unreachable' if device_breakers.is_open(hub.device_ip) else 'online'
+
+    # Save pin/device state reported by the ESP32
+    if 'pin_state' in data:
+        set_actuator_state(hub, 'device_state', str(data['pin_state']).upper())
+
+    # Save servo state reported by the ESP32
+    if 'servo_state' in data:
+        set_actuator_state(hub, 'servo_state', str(data['servo_state']).upper())
+
+    # Record to local history
+    hub_sensor_history.record(hub.id, ts, hub.temperature, hub.moisture)
+
+
+def ingest_reading(hub_id, data, reading_time=None):
+    """
+    Atomically apply one reading to a stored hub (read-modify-write under the
+    hub's lock). Returns the new record, or None if the hub does not exist.
+    Shared by the single and batch ingestion endpoints.
+    """
+    return hub_store.update(hub_id, lambda hub: apply_hub_reading(hub, data, reading_time))
+
+
 @app.route('/api/hubs/<hub_id>/sensors', methods=['POST', 'PUT'])
 def ingest_hub_sensor_data(hub_id):
     """
@@ -635,80 +1919,213 @@ def ingest_hub_sensor_data(hub_id):
     Accepts JSON: { "temperature": 28.5, "moisture": 42.0 }
     Data is stored locally only (not sent to Firestore).
     """
-    if hub_id not in hubs_data:
+    if hub_id not in hub_store:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
     
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
-    hub = hubs_data[hub_id]
-    
-    if 'temperature' in data:
-        try:
-            hub['temperature'] = round(float(data['temperature']), 1)
-        except (ValueError, TypeError):
-            pass
-    
-    if 'moisture' in data:
-        try:
-            hub['moisture'] = round(float(data['moisture']), 1)
-        except (ValueError, TypeError):
-            pass
+    hub = ingest_reading(hub_id, data)
+    if hub is None:
+        return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
+    publish_hub_change(hub)
+    # Auto mode is evaluated by auto_control_loop on its own tick, not per reading
     
-    hub['last_updated'] = datetime.now().isoformat()
-    hub['status'] = 'online'
+    return jsonify({
+        "hub_id": hub_id,
+        "temperature": hub.temperature,
+        "moisture": hub.moisture,
+        "auto_mode": bool(hub.auto_mode),
+        "message": "Sensor data updated",
+        "timestamp": datetime.now().isoformat()
+    })
 
-    # Save device IP for remote toggle (valid for 30 min)
-    if 'device_ip' in data:
-        hub['device_ip'] = str(data['device_ip'])
-        hub['device_ip_updated'] = datetime.now().isoformat()
 
-    # Save pin/device state reported by the ESP32
-    if 'pin_state' in data:
-        hub['device_state'] = str(data['pin_state']).upper()
+def iter_batch_records():
+    """
+    Yield raw records from a batch ingestion request.
+    NDJSON bodies are read line by line from the request stream; JSON bodies
+    may be a list of records or { "readings": [...] }.
+    Lines that fail to parse are yielded as None so they get a per-record error.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        return
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if isinstance(data, list):
+        yield from data
+
+
+@app.route('/api/hubs/sensors/batch', methods=['POST'])
+def ingest_hub_sensor_batch():
+    """
+    Bulk sensor ingestion for gateways fronting many hubs.
+    Accepts a JSON array (or NDJSON stream) of records:
+      { "hub_id": "HUB-ABC123", "temperature": 28.5, "moisture": 42.0,
+        "device_ip": "...", "pin_state": "ON", "servo_state": "OFF", "ts": 1718000000 }
+    Returns a status per record, in input order. Auto mode is not evaluated
+    here; auto_control_loop picks up each hub's latest reading on its next tick.
+    """
+    results = []
+    touched = {}
+    accepted = 0
+
+    for index, record in enumerate(iter_batch_records()):
+        if not isinstance(record, dict):
+            results.append({"index": index, "status": "error", "error": "Invalid record"})
+            continue
+
+        hub_id = record.get('hub_id')
+        hub = ingest_reading(hub_id, record, parse_reading_time(record.get('ts'))) if isinstance(hub_id, str) else None
+        if hub is None:
+            results.append({"index": index, "hub_id": hub_id, "status": "error",
+                            "error": f"Hub '{hub_id}' not found"})
+            continue
+
+        touched[hub_id] = hub
+        accepted += 1
+        results.append({"index": index, "hub_id": hub_id, "status": "ok"})
+
+    if not results:
+        return jsonify({"error": "No data provided"}), 400
+
+    # One stream event per hub touched, not per reading
+    for hub in touched.values():
+        publish_hub_change(hub)
 
-    # Save servo state reported by the ESP32
-    if 'servo_state' in data:
-        hub['servo_state'] = str(data['servo_state']).upper()
-    
-    # Record to local history
-    if hub_id not in hub_sensor_history:
-        hub_sensor_history[hub_id] = []
-    hub_sensor_history[hub_id].append({
-        "time": datetime.now().isoformat(),
-        "temperature": hub['temperature'],
-        "moisture": hub['moisture'],
-    })
-    if len(hub_sensor_history[hub_id]) > 100:
-        hub_sensor_history[hub_id] = hub_sensor_history[hub_id][-100:]
-    
-    # Auto mode: check thresholds and actuate in background thread
-    if hub.get('auto_mode'):
-        t = threading.Thread(target=run_auto_control, args=(hub_id, hub), daemon=True)
-        t.start()
-    
     return jsonify({
-        "hub_id": hub_id,
-        "temperature": hub['temperature'],
-        "moisture": hub['moisture'],
-        "auto_mode": hub.get('auto_mode', False),
-        "message": "Sensor data updated",
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results,
         "timestamp": datetime.now().isoformat()
     })
 
 
+# Upper bounds for one history query
+MAX_HISTORY_BUCKETS = 5000
+MAX_HISTORY_POINTS = 10000
+# Raw readings one aggregated query may read when no rollup tier fits its step
+MAX_HISTORY_SCAN = 100000
+# Latest accepted from/to (end of year 9999, the last datetime can represent)
+MAX_HISTORY_TIMESTAMP = 253402300799
+
+STEP_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_time_param(value):
+    """Parse a from/to query value (epoch seconds or ISO string) to epoch seconds."""
+    try:
+        ts = float(value)
+    except ValueError:
+        ts = datetime.fromisoformat(value).timestamp()
+    if not (math.isfinite(ts) and 0 <= ts <= MAX_HISTORY_TIMESTAMP):
+        raise ValueError(f"{value!r} is out of range")
+    return ts
+
+
+def parse_step_param(value):
+    """Parse a step query value: seconds, or a number with s/m/h/d suffix ('15m', '1h')."""
+    unit = STEP_UNITS.get(value[-1:].lower())
+    seconds = float(value[:-1]) * unit if unit else float(value)
+    if not (math.isfinite(seconds) and seconds > 0):
+        raise ValueError("step must be a positive number")
+    return seconds
+
+
+def parse_limit_param(value, default):
+    """Parse a ?limit= value: a whole number from 1 to MAX_HISTORY_POINTS (default if not given)."""
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("'limit' must be a whole number") from None
+    if not 1 <= limit <= MAX_HISTORY_POINTS:
+        raise ValueError(f"'limit' must be between 1 and {MAX_HISTORY_POINTS}")
+    return limit
+
+
 @app.route('/api/hubs/<hub_id>/sensors/history', methods=['GET'])
 def get_hub_sensor_history(hub_id):
-    """Get sensor history for a specific hub."""
-    if hub_id not in hubs_data:
+    """
+    Get sensor history for a specific hub.
+    Without range parameters returns the last `limit` readings (default 20,
+    at most MAX_HISTORY_POINTS; raw range queries take the same limit).
+    Range query: ?from=&to= (epoch seconds or ISO; default the last 24h up to now)
+    with optional &step= (seconds or 30s/15m/1h/1d) and &agg=min|max|avg|last
+    (default avg) to return one aggregated point per bucket instead of raw readings.
+    Steps that are multiples of 1m/15m/1h are answered from rollup tiers, with
+    'from' snapped down to the tier grid; other steps aggregate raw readings,
+    at most MAX_HISTORY_SCAN of them.
+    """
+    if hub_id not in hub_store:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
     
-    limit = int(request.args.get('limit', 20))
-    history = hub_sensor_history.get(hub_id, [])[-limit:]
-    
+    args = request.args
+    ranged = any(k in args for k in ('from', 'to', 'step'))
+    try:
+        limit = parse_limit_param(args.get('limit'), MAX_HISTORY_POINTS if ranged else 20)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not ranged:
+        history = hub_sensor_history.tail(hub_id, limit)
+        
+        return jsonify({
+            "hub_id": hub_id,
+            "history": history,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    try:
+        end = parse_time_param(args['to']) if 'to' in args else time.time()
+        start = parse_time_param(args['from']) if 'from' in args else end - 86400
+        step = parse_step_param(args['step']) if 'step' in args else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid range parameter: {e}"}), 400
+    agg = args.get('agg', 'avg')
+    if agg not in AGGREGATES:
+        return jsonify({"error": f"Invalid agg. Must be one of: {', '.join(AGGREGATES)}"}), 400
+    if end < start:
+        return jsonify({"error": "'to' must not be before 'from'"}), 400
+    if step and (end - start) / step > MAX_HISTORY_BUCKETS:
+        return jsonify({"error": f"Too many buckets (max {MAX_HISTORY_BUCKETS}); use a larger step"}), 400
+
+    truncated = False
+    if step:
+        # Served from the coarsest rollup tier that fits the step, else raw readings
+        try:
+            history, source, scanned = hub_sensor_history.aggregate(hub_id, start, end, step, agg,
+                                                                     max_scan=MAX_HISTORY_SCAN)
+        except ValueError as e:
+            return jsonify({"error": f"Too many readings to aggregate ({e}); "
+                                     "use a step that is a multiple of 1m or a shorter range"}), 400
+    else:
+        # One past the limit, to tell whether older readings were left out
+        records = hub_sensor_history.read_range(hub_id, start, end, limit + 1)
+        source, scanned = 'raw', len(records)
+        truncated = len(records) > limit
+        history = [to_point(*r) for r in records[-limit:]]
+
     return jsonify({
         "hub_id": hub_id,
+        "from": datetime.fromtimestamp(start).isoformat(),
+        "to": datetime.fromtimestamp(end).isoformat(),
+        "step": step,
+        "agg": agg if step else None,
+        "source": source,
+        "points_scanned": scanned,
+        "truncated": truncated,
         "history": history,
         "timestamp": datetime.now().isoformat()
     })
@@ -717,100 +2134,100 @@ def get_hub_sensor_history(hub_id):
 @app.route('/api/hubs/<hub_id>/toggle', methods=['POST'])
 def toggle_hub_device(hub_id):
     """
-    Send an ON/OFF command to the hub's connected ESP32 device.
+    Queue an ON/OFF command for the hub's connected ESP32 device.
     The device IP is obtained from sensor check-ins (valid for 30 min).
     Expects JSON: { "state": "on" } or { "state": "off" }
+    Returns 202 with a command ID; poll /api/hubs/<hub_id>/commands/<id> for the result.
     """
-    if hub_id not in hubs_data:
+    hub = hub_store.get(hub_id)
+    if hub is None:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
 
-    hub = hubs_data[hub_id]
-    device_ip = hub.get('device_ip')
+    device_ip = hub.device_ip
 
     if not device_ip:
         return jsonify({"error": "No device connected to this hub"}), 400
 
     # Check if IP is stale (device sends every 1s, so 15s = offline)
-    ip_updated = hub.get('device_ip_updated')
-    if ip_updated:
-        try:
-            updated_time = datetime.fromisoformat(ip_updated)
-            if (datetime.now() - updated_time).total_seconds() > 15:
-                return jsonify({"error": "Device is offline (no data received in 15s)"}), 400
-        except Exception:
-            pass
+    if hub.device_ip_updated and time.time() - hub.device_ip_updated > 15:
+        return jsonify({"error": "Device is offline (no data received in 15s)"}), 400
+
+    # Fail fast while the device's circuit breaker is open
+    retry_after = device_breakers.retry_after(device_ip)
+    if retry_after:
+        return jsonify({"error": "Device is unreachable", "retry_after": round(retry_after, 1)}), 503
 
     req_data = request.get_json() or {}
     state = req_data.get('state', 'toggle').lower()
 
-    try:
-        url = f"http://{device_ip}/toggle?state={state}"
-        req = urllib.request.Request(url)
-        response = urllib.request.urlopen(req, timeout=3)
-        result = response.read().decode().strip()
-
-        # Update stored state
-        hub['device_state'] = result
+    command = enqueue_device_command(hub_id, hub, 'toggle', state)
 
-        return jsonify({
-            "hub_id": hub_id,
-            "device_ip": device_ip,
-            "state": result,
-            "message": f"Device set to {result}"
-        })
-    except urllib.error.URLError as e:
-        return jsonify({"error": f"Could not reach device at {device_ip}: {str(e)}"}), 502
-    except Exception as e:
-        return jsonify({"error": f"Toggle failed: {str(e)}"}), 500
+    return jsonify({
+        "hub_id": hub_id,
+        "device_ip": device_ip,
+        "command_id": command['id'],
+        "status": command['status'],
+        "state": state.upper() if state in ('on', 'off') else hub.device_state,
+        "status_url": url_for('get_device_command', hub_id=hub_id, command_id=command['id']),
+        "message": f"Device command queued ({state})"
+    }), 202
 
 
 @app.route('/api/hubs/<hub_id>/servo', methods=['POST'])
 def servo_hub_device(hub_id):
     """
-    Send a servo ON/OFF command to the hub's connected ESP32 device.
+    Queue a servo ON/OFF command for the hub's connected ESP32 device.
     ON = continuous rotation, OFF = stop.
     Expects JSON: { "state": "on" } or { "state": "off" }
+    Returns 202 with a command ID; poll /api/hubs/<hub_id>/commands/<id> for the result.
     """
-    if hub_id not in hubs_data:
+    hub = hub_store.get(hub_id)
+    if hub is None:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
 
-    hub = hubs_data[hub_id]
-    device_ip = hub.get('device_ip')
+    device_ip = hub.device_ip
 
     if not device_ip:
         return jsonify({"error": "No device connected to this hub"}), 400
 
     # Check if device is online
-    ip_updated = hub.get('device_ip_updated')
-    if ip_updated:
-        try:
-            updated_time = datetime.fromisoformat(ip_updated)
-            if (datetime.now() - updated_time).total_seconds() > 15:
-                return jsonify({"error": "Device is offline (no data received in 15s)"}), 400
-        except Exception:
-            pass
+    if hub.device_ip_updated and time.time() - hub.device_ip_updated > 15:
+        return jsonify({"error": "Device is offline (no data received in 15s)"}), 400
+
+    # Fail fast while the device's circuit breaker is open
+    retry_after = device_breakers.retry_after(device_ip)
+    if retry_after:
+        return jsonify({"error": "Device is unreachable", "retry_after": round(retry_after, 1)}), 503
 
     req_data = request.get_json() or {}
     state = req_data.get('state', 'toggle').lower()
 
-    try:
-        url = f"http://{device_ip}/servo?state={state}"
-        req = urllib.request.Request(url)
-        response = urllib.request.urlopen(req, timeout=3)
-        result = response.read().decode().strip()
+    command = enqueue_device_command(hub_id, hub, 'servo', state)
 
-        hub['servo_state'] = result
+    return jsonify({
+        "hub_id": hub_id,
+        "device_ip": device_ip,
+        "command_id": command['id'],
+        "status": command['status'],
+        "state": state.upper() if state in ('on', 'off') else hub.servo_state,
+        "status_url": url_for('get_device_command', hub_id=hub_id, command_id=command['id']),
+        "message": f"Servo command queued ({state})"
+    }), 202
 
-        return jsonify({
-            "hub_id": hub_id,
-            "device_ip": device_ip,
-            "state": result,
-            "message": f"Servo set to {result}"
-        })
-    except urllib.error.URLError as e:
-        return jsonify({"error": f"Could not reach device at {device_ip}: {str(e)}"}), 502
-    except Exception as e:
-        return jsonify({"error": f"Servo control failed: {str(e)}"}), 500
+
+@app.route('/api/hubs/<hub_id>/commands/<command_id>', methods=['GET'])
+def get_device_command(hub_id, command_id):
+    """
+    Get the status of an asynchronous device command.
+    Status is one of queued, running, succeeded, failed or superseded (replaced
+    by a later on/off command, see 'superseded_by', before it was sent);
+    'result' holds the state reported by the device and 'error' the failure reason.
+    Outcomes are also pushed as 'command' events on /api/hubs/stream.
+    """
+    command = device_commands.get(command_id)
+    if not command or command['hub_id'] != hub_id:
+        return jsonify({"error": f"Command '{command_id}' not found"}), 404
+    return jsonify({"command": command, "timestamp": datetime.now().isoformat()})
 
 
 @app.route('/api/hubs/<hub_id>/auto', methods=['POST'])
@@ -821,18 +2238,43 @@ def toggle_auto_mode(hub_id):
       - Moisture < 35% -> heater ON, 35-80% -> heater OFF
       - Temperature > 35°C -> fan ON, 10-35°C -> fan OFF
     Expects JSON: { "enabled": true/false }
+    Optional tuning (kept per hub): "moisture_hysteresis" (%), "temperature_hysteresis" (°C),
+    "min_dwell_seconds" — see AUTO_CONFIG_DEFAULTS.
     """
-    if hub_id not in hubs_data:
+    if hub_id not in hub_store:
         return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
 
-    hub = hubs_data[hub_id]
     req_data = request.get_json() or {}
-    hub['auto_mode'] = bool(req_data.get('enabled', not hub.get('auto_mode', False)))
+
+    overrides = {}
+    for key in AUTO_CONFIG_DEFAULTS:
+        if key in req_data:
+            try:
+                overrides[key] = float(req_data[key])
+            except (ValueError, TypeError):
+                return jsonify({"error": f"'{key}' must be a number"}), 400
+            if not math.isfinite(overrides[key]):
+                return jsonify({"error": f"'{key}' must be a finite number"}), 400
+            if overrides[key] < 0:
+                return jsonify({"error": f"'{key}' must not be negative"}), 400
+    def change(hub):
+        if overrides:
+            hub.auto_config = dict(hub.auto_config or {}, **overrides)
+        if 'enabled' in req_data or not overrides:
+            hub.auto_mode = bool(req_data.get('enabled', not hub.auto_mode))
+        elif hub.auto_mode is None:
+            hub.auto_mode = False
+
+    hub = hub_store.update(hub_id, change)
+    if hub is None:
+        return jsonify({"error": f"Hub '{hub_id}' not found"}), 404
+    publish_hub_change(hub)
 
     return jsonify({
         "hub_id": hub_id,
-        "auto_mode": hub['auto_mode'],
-        "message": f"Auto mode {'enabled' if hub['auto_mode'] else 'disabled'}"
+        "auto_mode": hub.auto_mode,
+        "auto_config": get_auto_config(hub),
+        "message": f"Auto mode {'enabled' if hub.auto_mode else 'disabled'}"
     })
 
 
@@ -849,45 +2291,69 @@ def api_get_organizers():
 
 @app.route('/api/admin/profiles', methods=['GET'])
 def api_get_profiles():
-    """Get all profiles from Firestore."""
-    profiles = get_all_profiles_from_firestore()
-    return jsonify({"profiles": profiles, "timestamp": datetime.now().isoformat()})
+    """
+    Get profiles from Firestore one page at a time, in document ID order.
+    ?limit= (default 50, max 500), ?cursor= (next_cursor of the previous page), ?role= to filter.
+    """
+    try:
+        limit, cursor = parse_page_args()
+        where = {"role": request.args['role']} if request.args.get('role') else None
+        profiles, next_cursor = get_firestore_page('profiles', PROFILE_ORDER, PROFILE_FIELDS, 'uid',
+                                                   limit, cursor, where)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"profiles": profiles, "next_cursor": next_cursor, "timestamp": datetime.now().isoformat()})
+
+
+@app.route('/api/admin/collaterals', methods=['GET'])
+def api_get_collaterals():
+    """
+    Get loan collaterals from Firestore one page at a time, newest first.
+    ?limit= (default 50, max 500), ?cursor= (next_cursor of the previous page).
+    """
+    try:
+        limit, cursor = parse_page_args()
+        collaterals, next_cursor = get_firestore_page('collaterals', COLLATERAL_ORDER, COLLATERAL_FIELDS, 'id',
+                                                      limit, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"collaterals": collaterals, "next_cursor": next_cursor, "timestamp": datetime.now().isoformat()})
 
 
 @app.route('/api/admin/stats', methods=['GET'])
+@versioned('hubs', 'orders', 'transactions', 'directory')
 def api_get_admin_stats():
-    """Get admin dashboard stats — combines Firestore data with local hub data."""
-    organizers = get_organizers_from_firestore()
-    all_profiles = get_all_profiles_from_firestore()
-    collaterals = get_collaterals_from_firestore()
-    
-    # Filter profiles by role
-    buyers = [p for p in all_profiles if p.get('role') == 'buyer']
-    sellers = [p for p in all_profiles if p.get('role') == 'seller']
-    
-    # Count by role
-    role_counts = {}
-    for p in all_profiles:
-        role = p.get('role', 'unknown')
-        role_counts[role] = role_counts.get(role, 0) + 1
+    """
+    Get admin dashboard stats — combines cached Firestore data with local hub data.
+    Supports ?fields= to project the hubs (as for /api/hubs).
+    """
+    try:
+        hub_fields = parse_hub_fields()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    directory = get_admin_directory_stats()
     
-    return jsonify({
-        "total_hubs": len(hubs_data),
-        "hubs_online": sum(1 for h in hubs_data.values() if h.get('status') == 'online'),
-        "total_organizers": len(organizers),
-        "total_buyers": len(buyers),
-        "total_sellers": len(sellers),
-        "total_users": len(all_profiles),
-        "role_counts": role_counts,
-        "hubs": list(hubs_data.values()),
-        "organizers": organizers,
-        "buyers": buyers,
-        "sellers": sellers,
-        "orders": orders_data,
-        "transactions": transactions_data,
-        "collaterals": collaterals,
-        "timestamp": datetime.now().isoformat()
-    })
+    return hub_list_response(
+        None,
+        hub_fields,
+        total_hubs=len(hub_store),
+        hubs_online=hub_store.count('status', 'online'),
+        total_organizers=directory["role_counts"].get('organizer', 0),
+        total_buyers=directory["role_counts"].get('buyer', 0),
+        total_sellers=directory["role_counts"].get('seller', 0),
+        total_users=directory["total_users"],
+        role_counts=directory["role_counts"],
+        organizers=directory["organizers"],
+        buyers=directory["buyers"],
+        buyers_next_cursor=directory["buyers_next_cursor"],
+        sellers=directory["sellers"],
+        sellers_next_cursor=directory["sellers_next_cursor"],
+        orders=orders_data,
+        transactions=transactions_data,
+        collaterals=directory["collaterals"],
+        collaterals_next_cursor=directory["collaterals_next_cursor"],
+        timestamp=datetime.now().isoformat(),
+    )
 
 
 # ─────────────────────────────────────────────
@@ -897,6 +2363,7 @@ def api_get_admin_stats():
 @app.route('/api/admin/collaterals/<doc_id>/approve', methods=['POST'])
 def approve_collateral(doc_id):
     """Approve or reject a loan collateral — updates status in Firestore."""
+    firestore_db = get_firestore()
     if not firestore_db:
         return jsonify({"error": "Firestore not available"}), 500
 
@@ -917,6 +2384,7 @@ def approve_collateral(doc_id):
             'status': new_status,
             'approved_at': datetime.now().isoformat() if new_status == 'verified' else None,
         })
+        invalidate_admin_stats()
 
         return jsonify({
             "message": f"Collateral {doc_id} status updated to '{new_status}'",
@@ -1019,6 +2487,7 @@ def get_sensor_history():
 # ─────────────────────────────────────────────
 
 @app.route('/api/market', methods=['GET'])
+@versioned('market')
 def get_market():
     """Get market commodity data."""
     return jsonify({
@@ -1041,6 +2510,7 @@ def update_market():
         for i, item in enumerate(data['cluster_health']):
             if i < len(cluster_health):
                 cluster_health[i].update(item)
+    collection_versions.bump('market')
     
     return jsonify({"message": "Market data updated", "timestamp": datetime.now().isoformat()})
 
@@ -1050,6 +2520,7 @@ def update_market():
 # ─────────────────────────────────────────────
 
 @app.route('/api/stats/buyer', methods=['GET'])
+@versioned('buyer_stats', 'market')
 def get_buyer_stats():
     """Get buyer dashboard stats."""
     return jsonify({
@@ -1070,9 +2541,11 @@ def update_buyer_stats():
         if 'chart_data' in data:
             global monthly_chart_data
             monthly_chart_data = data['chart_data']
+        collection_versions.bump('buyer_stats')
     return jsonify({"stats": buyer_stats, "timestamp": datetime.now().isoformat()})
 
 @app.route('/api/stats/seller', methods=['GET'])
+@versioned('seller_stats', 'transactions')
 def get_seller_stats():
     """Get seller dashboard stats."""
     return jsonify({
@@ -1089,9 +2562,11 @@ def update_seller_stats():
         for key, val in data.items():
             if key in seller_stats:
                 seller_stats[key] = val
+        collection_versions.bump('seller_stats')
     return jsonify({"stats": seller_stats, "timestamp": datetime.now().isoformat()})
 
 @app.route('/api/stats/organizer', methods=['GET'])
+@versioned('organizer_stats', 'orders')
 def get_organizer_stats():
     """Get organizer dashboard stats."""
     return jsonify({
@@ -1108,6 +2583,7 @@ def update_organizer_stats():
         for key, val in data.items():
             if key in organizer_stats:
                 organizer_stats[key] = val
+        collection_versions.bump('organizer_stats')
     return jsonify({"stats": organizer_stats, "timestamp": datetime.now().isoformat()})
 
 
@@ -1116,9 +2592,32 @@ def update_organizer_stats():
 # ─────────────────────────────────────────────
 
 @app.route('/api/orders', methods=['GET'])
+@versioned('orders')
 def get_orders():
-    """Get all orders."""
-    return jsonify({"orders": orders_data, "timestamp": datetime.now().isoformat()})
+    """
+    Get all orders. Supports ?since=<seq> (as for /api/hubs) to get only orders
+    added or changed after that sequence number.
+    """
+    try:
+        since = parse_since()
+    except ValueError:
+        return jsonify({"error": "'since' must be an integer sequence number"}), 400
+    
+    seq, changed = change_log.since('orders', since) if since is not None else (change_log.seq, None)
+    if changed is not None:
+        orders = {order['id']: order for order in orders_data}
+        return jsonify({
+            "orders": [orders[order_id] for order_id in changed if order_id in orders],
+            "deleted": [order_id for order_id in changed if order_id not in orders],
+            "seq": seq,
+            "resync": False,
+            "timestamp": datetime.now().isoformat(),
+        })
+    
+    response = {"orders": orders_data, "seq": seq, "timestamp": datetime.now().isoformat()}
+    if since is not None:
+        response["resync"] = True
+    return jsonify(response)
 
 @app.route('/api/orders', methods=['POST'])
 def add_order():
@@ -1129,6 +2628,8 @@ def add_order():
         data.setdefault('created_at', datetime.now().isoformat())
         data.setdefault('status', 'reserved')
         orders_data.append(data)
+        collection_versions.bump('orders')
+        change_log.append('orders', data['id'])
     return jsonify({"orders": orders_data, "timestamp": datetime.now().isoformat()})
 
 @app.route('/api/orders/<order_id>/complete', methods=['POST'])
@@ -1145,10 +2646,13 @@ def complete_order(order_id):
                 "status": "held",
                 "created_at": datetime.now().isoformat()
             })
+            collection_versions.bump('orders', 'transactions')
+            change_log.append('orders', order_id)
             return jsonify({"message": "Order completed", "order": order})
     return jsonify({"error": "Order not found"}), 404
 
 @app.route('/api/transactions', methods=['GET'])
+@versioned('transactions')
 def get_transactions():
     """Get all transactions."""
     return jsonify({"transactions": transactions_data, "timestamp": datetime.now().isoformat()})
@@ -1158,18 +2662,35 @@ def get_transactions():
 #  HEALTH CHECK
 # ─────────────────────────────────────────────
 
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once hubs are loaded, 503 before. /api/health stays a liveness check."""
+    body = dict(startup_state, hubs_loaded=len(hub_store), firestore_init_ms=firestore_state["init_ms"],
+                timestamp=datetime.now().isoformat())
+    return jsonify(body), 200 if startup_state["ready"] else 503
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({
         "status": "online",
         "uptime": time.time(),
         "sensors_active": len(sensor_data),
-        "hubs_active": len(hubs_data),
-        "firestore_connected": firestore_db is not None,
+        "hubs_active": len(hub_store),
+        "firestore_connected": firestore_state["client"] is not None,
+        "firestore_sync": firestore_sync_queue.status(),
+        "history_log": history_log.status() if history_log else None,
+        "hub_state": hub_state.status() if hub_state else None,
+        "change_log": change_log.status(),
+        "actuation": dict(actuation_executor.status(), connections=device_pool.status(),
+                          circuit_breakers=device_breakers.status(), auto_control=auto_control_stats),
         "timestamp": datetime.now().isoformat()
     })
 
 
+startup_state["import_ms"] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("  🌾 CropStack Sensor API v2.0")
@@ -1177,4 +2698,9 @@ if __name__ == '__main__':
     print("  🔌 API Base:  http://localhost:5000/api")
     print("  🔐 Admin Login: admin@cropstack.com / admin123")
     print("="*60 + "\n")
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    # The reloader re-runs this module in a child process that serves requests;
+    # only that child (WERKZEUG_RUN_MAIN set) starts the background work
+    use_reloader = True
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+    app.run(debug=True, use_reloader=use_reloader, port=5000, host='0.0.0.0')
@@ -0,0 +1,86 @@
+"""
+Benchmark: cost of one auto-control tick.
+
+Builds N auto_mode hubs (default 10k) with random readings and actuator
+states, then times auto_control_tick() (gather columns, compute targets in
+one pass, dispatch) with dispatch stubbed out, next to compute_auto_targets()
+alone and to evaluating the same hubs one at a time, as the per-reading
+evaluation did.
+
+    python benchmarks/auto_control.py [hubs]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from hub_store import Hub, HubStore  # noqa: E402
+
+TICKS = 20
+
+
+def build_store(n, rng):
+    store = HubStore()
+    for i in range(n):
+        store.put(Hub(
+            id=f"HUB-{i:06X}",
+            name=f"Silo {i}",
+            temperature=round(rng.uniform(5, 45), 1),
+            moisture=round(rng.uniform(20, 90), 1),
+            device_ip=f"10.0.{i >> 8 & 255}.{i & 255}",
+            device_state=rng.choice(('ON', 'OFF')),
+            servo_state=rng.choice(('ON', 'OFF')),
+            auto_mode=True,
+        ))
+    return store
+
+
+def per_hub(store):
+    """Targets for each hub on its own (one compute_auto_targets call per hub)."""
+    for hub in store.values():
+        config = app.get_auto_config(hub)
+        app.compute_auto_targets([hub.temperature], [hub.moisture], [hub.device_state], [hub.servo_state],
+                                 [config['temperature_hysteresis']], [config['moisture_hysteresis']])
+
+
+def columns(store):
+    hubs = store.values()
+    configs = [app.get_auto_config(hub) for hub in hubs]
+    return ([hub.temperature for hub in hubs], [hub.moisture for hub in hubs],
+            [hub.device_state for hub in hubs], [hub.servo_state for hub in hubs],
+            [c['temperature_hysteresis'] for c in configs], [c['moisture_hysteresis'] for c in configs])
+
+
+def timed(fn, *args):
+    fn(*args)
+    started = time.perf_counter()
+    for _ in range(TICKS):
+        fn(*args)
+    return (time.perf_counter() - started) / TICKS
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = random.Random(1)
+    store = build_store(n, rng)
+    app.hub_store = store
+    app.queue_auto_control = lambda *args: None  # no device I/O; every change counts as skipped
+
+    tick_s = timed(app.auto_control_tick)
+    compute_s = timed(app.compute_auto_targets, *columns(store))
+    per_hub_s = timed(per_hub, store)
+
+    print(f"{n:,} auto_mode hubs, {TICKS} ticks\n")
+    print(f"{'evaluation':<32}{'ms/tick':>10}{'us/hub':>10}")
+    for name, seconds in (("per hub (one call each)", per_hub_s), ("compute_auto_targets (columns)", compute_s),
+                          ("auto_control_tick (full)", tick_s)):
+        print(f"{name:<32}{seconds * 1e3:>10.2f}{seconds * 1e6 / n:>10.2f}")
+    print(f"\nlast_tick_ms reported by the app: {app.auto_control_stats['last_tick_ms']}")
+
+
+if __name__ == '__main__':
+    main()
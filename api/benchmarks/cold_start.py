@@ -0,0 +1,58 @@
+"""
+Benchmark: API cold start.
+
+Starts fresh interpreters and reports, per run, the wall time to import the
+app module, to answer the first request (/api/health) after create_app(), and
+until /api/ready turns 200 (hubs loaded), plus the app's own startup_state.
+
+    python benchmarks/cold_start.py [runs]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.create_app().test_client()
+client.get('/api/health')
+first_response = time.perf_counter()
+while client.get('/api/ready').status_code != 200:
+    if app.startup_state["phase"] == "failed":
+        break
+    time.sleep(0.005)
+ready = time.perf_counter()
+sys.stdout.write("\n" + json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_response_ms": (first_response - started) * 1000,
+    "ready_ms": (ready - started) * 1000,
+    "startup_state": app.startup_state,
+}) + "\n")
+'''
+
+
+def run_once():
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=API_DIR, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [run_once() for _ in range(runs)]
+    print(f"{runs} cold starts (hub source: {results[-1]['startup_state']['hub_source']})\n")
+    print(f"{'metric':<22}{'median ms':>12}{'max ms':>12}")
+    for key in ('import_ms', 'first_response_ms', 'ready_ms'):
+        values = [r[key] for r in results]
+        print(f"{key:<22}{statistics.median(values):>12.1f}{max(values):>12.1f}")
+    print("\nlast startup_state:", json.dumps(results[-1]['startup_state']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: storage size and decode throughput of hub history representations.
+
+Compares the original in-memory list of {timestamp, temperature, moisture}
+dicts (ISO timestamps), its JSON encoding, fixed-width 16-byte log records and
+Gorilla-compressed segments, on a synthetic day of 1 Hz silo readings.
+
+    python benchmarks/history_compression.py [points]
+"""
+
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gorilla  # noqa: E402
+from history_log import RECORD  # noqa: E402
+
+
+def synthetic_readings(n, start=1_700_000_000.0, interval=1.0, seed=7):
+    """Slowly drifting readings rounded like the ESP32 firmware reports them, with send jitter."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        ts = start + i * interval + rng.choice((0, 0, 0, 0.001, -0.001, 0.002))
+        t = round(24 + 3 * math.sin(i / 3600) + rng.choice((0, 0, 0.1, -0.1)), 1)
+        m = round(55 + 10 * math.sin(i / 7200) + rng.choice((0, 0, 0, 0.1)), 1)
+        records.append((ts, t, m))
+    return records
+
+
+def deep_size(points):
+    size = sys.getsizeof(points)
+    for p in points:
+        size += sys.getsizeof(p) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in p.items())
+    return size
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 86400
+    records = synthetic_readings(n)
+
+    dicts = [{"timestamp": datetime.fromtimestamp(ts).isoformat(), "temperature": t, "moisture": m}
+             for ts, t, m in records]
+    as_json = json.dumps(dicts).encode()
+    raw = b''.join(RECORD.pack(*r) for r in records)
+    compressed = gorilla.encode_segment(records)
+
+    def decode_dicts():
+        for p in dicts:
+            datetime.fromisoformat(p["timestamp"]).timestamp(), p["temperature"], p["moisture"]
+
+    def decode_json():
+        for p in json.loads(as_json):
+            datetime.fromisoformat(p["timestamp"]).timestamp(), p["temperature"], p["moisture"]
+
+    def decode_raw():
+        for _ in RECORD.iter_unpack(raw):
+            pass
+
+    def decode_gorilla():
+        for _ in gorilla.iter_segment(compressed):
+            pass
+
+    rows = [
+        ("list of dicts (in memory)", deep_size(dicts), decode_dicts),
+        ("list of dicts (JSON)", len(as_json), decode_json),
+        ("fixed-width records", len(raw), decode_raw),
+        ("gorilla segment", len(compressed), decode_gorilla),
+    ]
+    print(f"{n} points\n")
+    print(f"{'representation':<28}{'bytes/point':>12}{'decode pts/s':>16}")
+    for name, size, decode in rows:
+        print(f"{name:<28}{size / n:>12.2f}{n / timed(decode):>16,.0f}")
+
+    decoded = list(gorilla.iter_segment(compressed))
+    assert all(abs(a[0] - b[0]) < 0.0005 for a, b in zip(decoded, records))
+    hour = records[n // 2][0]
+    window = timed(lambda: list(gorilla.iter_segment(compressed, hour, hour + 3600)))
+    print(f"\n1 h range query on gorilla segment: {window * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
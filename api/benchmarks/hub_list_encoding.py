@@ -0,0 +1,85 @@
+"""
+Benchmark: encoding the /api/hubs list between polls.
+
+Builds N hubs (default 10k), then simulates polls where a fraction of hubs
+(default 1%) changed since the previous poll. Compares re-encoding every hub
+(json.dumps of [hub.to_dict() ...], as jsonify did) with joining the cached
+per-hub fragments, where only the changed hubs are serialized again.
+
+    python benchmarks/hub_list_encoding.py [hubs] [changed_fraction]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub_store import Hub, HubStore  # noqa: E402
+
+POLLS = 50
+
+
+def build_store(n):
+    store = HubStore()
+    for i in range(n):
+        store.put(Hub(
+            id=f"HUB-{i:06X}",
+            name=f"Silo {i}",
+            organizer_id=f"org-{i % 500}",
+            organizer_email=f"organizer{i % 500}@example.com",
+            temperature=round(20 + (i % 150) / 10, 1),
+            moisture=round(40 + (i % 300) / 10, 1),
+            device_ip=f"10.0.{i >> 8 & 255}.{i & 255}",
+            device_ip_updated=time.time(),
+            device_state="ON" if i % 2 else "OFF",
+        ))
+    return store
+
+
+def mutate(store, ids, count, rng):
+    for hub_id in rng.sample(ids, count):
+        store.update(hub_id, temperature=round(rng.uniform(15, 40), 1), last_updated=time.time())
+
+
+def run(store, encode, changed, seed):
+    rng = random.Random(seed)
+    ids = store.ids()
+    encode(store)  # first poll fills any caches
+    elapsed = 0.0
+    for _ in range(POLLS):
+        mutate(store, ids, changed, rng)
+        start = time.perf_counter()
+        body = encode(store)
+        elapsed += time.perf_counter() - start
+    return elapsed / POLLS, body
+
+
+def full_encode(store):
+    return json.dumps({"hubs": [h.to_dict() for h in store.values()]}, separators=(',', ':'))
+
+
+def fragment_encode(store):
+    return '{"hubs":' + store.values_json() + '}'
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    changed = max(1, int(n * fraction))
+
+    full_s, full_body = run(build_store(n), full_encode, changed, seed=1)
+    frag_s, frag_body = run(build_store(n), fragment_encode, changed, seed=1)
+    assert json.loads(full_body)["hubs"][0].keys() == json.loads(frag_body)["hubs"][0].keys()
+
+    print(f"{n:,} hubs, {changed:,} changed per poll, {POLLS} polls\n")
+    print(f"{'encoding':<28}{'ms/poll':>10}")
+    print(f"{'to_dict + json.dumps':<28}{full_s * 1e3:>10.2f}")
+    print(f"{'cached fragments':<28}{frag_s * 1e3:>10.2f}")
+    print(f"\nspeedup: {full_s / frag_s:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
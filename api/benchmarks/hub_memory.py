@@ -0,0 +1,79 @@
+"""
+Benchmark: memory used by hub records.
+
+Builds N hubs (default 100k) with device fields set, as the per-hub dicts
+previously held in hubs_data (ISO timestamp strings) and as slotted Hub
+records (epoch timestamps, interned status/actuator strings), and reports
+the memory allocated for each via tracemalloc.
+
+    python benchmarks/hub_memory.py [hubs]
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hub_store import Hub  # noqa: E402
+
+
+def hub_fields(i, now):
+    """Field values as they arrive from requests (fresh string objects per hub)."""
+    return {
+        "id": f"HUB-{i:06X}",
+        "name": f"Silo {i}",
+        "organizer_id": f"org-{i % 500}",
+        "organizer_email": f"organizer{i % 500}@example.com",
+        "temperature": round(20 + (i % 150) / 10, 1),
+        "moisture": round(40 + (i % 300) / 10, 1),
+        "status": "".join(["on", "line"]),
+        "device_ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+        "device_state": "".join(["O", "N" if i % 2 else "FF"]),
+        "servo_state": "".join(["O", "FF"]),
+        "auto_mode": bool(i % 3),
+        "last_updated": now - i % 60,
+        "device_ip_updated": now - i % 60,
+    }
+
+
+def as_dict(fields):
+    hub = dict(fields)
+    hub["last_updated"] = datetime.fromtimestamp(fields["last_updated"]).isoformat()
+    hub["device_ip_updated"] = datetime.fromtimestamp(fields["device_ip_updated"]).isoformat()
+    return hub
+
+
+def measure(build, n, now):
+    gc.collect()
+    tracemalloc.start()
+    records = {}
+    for i in range(n):
+        fields = hub_fields(i, now)
+        records[fields["id"]] = build(fields)
+    del fields
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, records
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    now = time.time()
+    dict_bytes, dicts = measure(as_dict, n, now)
+    hub_bytes, hubs = measure(lambda fields: Hub(**fields), n, now)
+    assert len(dicts) == len(hubs) == n
+
+    print(f"{n:,} hubs (including the id -> record dict)\n")
+    print(f"{'representation':<28}{'total MB':>10}{'bytes/hub':>12}")
+    print(f"{'dict per hub (ISO times)':<28}{dict_bytes / 1e6:>10.1f}{dict_bytes / n:>12.0f}")
+    print(f"{'slotted Hub (epoch times)':<28}{hub_bytes / 1e6:>10.1f}{hub_bytes / n:>12.0f}")
+    print(f"\nreduction: {(1 - hub_bytes / dict_bytes) * 100:.0f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""
+CropStack Device Control — HTTP actuation of ESP32 hub devices.
+Keeps keep-alive connections per device and runs actuation commands on a
+bounded worker pool, capped per device and globally. Queued commands for the
+same hub and actuator are merged so only the latest one is sent.
+"""
+
+import http.client
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+
+class DeviceError(Exception):
+    """Raised when a device cannot be reached or returns an error."""
+
+
+class DeviceUnavailable(DeviceError):
+    """Raised without contacting the device while its circuit breaker is open."""
+
+    def __init__(self, device_ip, retry_after):
+        super().__init__(f"Device at {device_ip} is unreachable (retry in {retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+class DeviceConnectionPool:
+    """Per-device pool of keep-alive HTTP connections."""
+
+    def __init__(self, max_idle_per_device=2, idle_timeout=30.0):
+        self.max_idle_per_device = max_idle_per_device
+        self.idle_timeout = idle_timeout
+        self.idle = {}  # { device_ip: [(conn, last_used), ...] }
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "reused": 0, "opened": 0, "errors": 0}
+
+    def _acquire(self, device_ip, timeout):
+        now = time.monotonic()
+        with self.lock:
+            conns = self.idle.get(device_ip, [])
+            while conns:
+                conn, last_used = conns.pop()
+                if now - last_used < self.idle_timeout:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    self.stats["reused"] += 1
+                    return conn, True
+                conn.close()
+            self.stats["opened"] += 1
+        return http.client.HTTPConnection(device_ip, timeout=timeout), False
+
+    def _release(self, device_ip, conn):
+        with self.lock:
+            conns = self.idle.setdefault(device_ip, [])
+            if len(conns) < self.max_idle_per_device:
+                conns.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(self, device_ip, path, timeout=3):
+        """GET `path` on the device and return the response body as stripped text."""
+        with self.lock:
+            self.stats["requests"] += 1
+        for attempt in range(2):
+            conn, reused = self._acquire(device_ip, timeout)
+            try:
+                conn.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = conn.getresponse()
+                body = response.read().decode().strip()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                # The device may have closed an idle keep-alive socket — retry once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                self._count_error()
+                raise DeviceError(f"Could not reach device at {device_ip}: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._count_error()
+                raise DeviceError(f"Could not reach device at {device_ip}: {e}") from e
+            except UnicodeDecodeError as e:
+                conn.close()
+                self._count_error()
+                raise DeviceError(f"Device at {device_ip} sent an unreadable response: {e}") from e
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(device_ip, conn)
+            if response.status >= 400:
+                self._count_error()
+                raise DeviceError(f"Device at {device_ip} returned HTTP {response.status}")
+            return body
+
+    def _count_error(self):
+        with self.lock:
+            self.stats["errors"] += 1
+
+    def forget(self, device_ip):
+        """Close idle connections to a device (e.g. when its IP changes)."""
+        with self.lock:
+            conns = self.idle.pop(device_ip, [])
+        for conn, _ in conns:
+            conn.close()
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, idle_connections=sum(len(c) for c in self.idle.values()))
+
+
+class CircuitBreaker:
+    """
+    Failure tracking for one device.
+    closed: calls go through; `failure_threshold` consecutive failures open it.
+    open: calls fail fast until the backoff expires, then one trial call is let
+    through (half_open). A successful trial closes the circuit; a failed one
+    re-opens it with the backoff doubled, up to `max_backoff`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=3, base_backoff=5.0, max_backoff=300.0):
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = base_backoff
+        self.opened_at = 0.0
+
+    def retry_after(self):
+        """Seconds until a trial call is allowed (0 when calls may go through)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.backoff - time.monotonic())
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self.state = self.HALF_OPEN
+            return True
+        return False  # open, or a half-open trial is already in flight
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = self.base_backoff
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        elif self.failures < self.failure_threshold:
+            return
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+
+class DeviceCircuitBreakers:
+    """Circuit breaker per device IP."""
+
+    def __init__(self, **breaker_options):
+        self.breaker_options = breaker_options
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.stats = {"fast_failures": 0, "opened": 0}
+
+    def _breaker(self, device_ip):
+        breaker = self.breakers.get(device_ip)
+        if breaker is None:
+            breaker = self.breakers[device_ip] = CircuitBreaker(**self.breaker_options)
+        return breaker
+
+    def call(self, device_ip, fn, *args):
+        """
+        Run fn(*args) through the device's breaker; raises DeviceUnavailable while open.
+        Any exception from fn counts as a failure, so a half-open trial always
+        closes or re-opens the circuit.
+        """
+        with self.lock:
+            breaker = self._breaker(device_ip)
+            if not breaker.allow():
+                self.stats["fast_failures"] += 1
+                raise DeviceUnavailable(device_ip, breaker.retry_after())
+        try:
+            result = fn(*args)
+        except Exception:
+            with self.lock:
+                was_open = breaker.state == CircuitBreaker.OPEN
+                breaker.record_failure()
+                if not was_open and breaker.state == CircuitBreaker.OPEN:
+                    self.stats["opened"] += 1
+            raise
+        with self.lock:
+            breaker.record_success()
+        return result
+
+    def is_open(self, device_ip):
+        """True while calls to the device fail fast (open and still backing off)."""
+        with self.lock:
+            breaker = self.breakers.get(device_ip)
+            return breaker is not None and breaker.retry_after() > 0
+
+    def retry_after(self, device_ip):
+        with self.lock:
+            breaker = self.breakers.get(device_ip)
+            return breaker.retry_after() if breaker else 0.0
+
+    def forget(self, device_ip):
+        with self.lock:
+            self.breakers.pop(device_ip, None)
+
+    def status(self):
+        with self.lock:
+            states = {}
+            for breaker in self.breakers.values():
+                states[breaker.state] = states.get(breaker.state, 0) + 1
+            return dict(self.stats, devices=len(self.breakers), states=states)
+
+
+class ActuationExecutor:
+    """
+    Bounded worker pool for device commands.
+    Commands are queued under a key (e.g. ('auto', hub_id)); submitting a key
+    that is still queued replaces the queued command instead of adding another,
+    and every caller waiting on the merged command gets the same result.
+    `on_merge`, if given, is called with the replaced command's args (under the
+    queue lock, so it must not block) when a submission is merged.
+    At most `per_device` commands run against one device at a time and at most
+    `max_workers` run overall.
+    """
+
+    def __init__(self, max_workers=16, per_device=1):
+        self.max_workers = max_workers
+        self.per_device = per_device
+        self.queue = OrderedDict()  # { key: { device, fn, args, futures } }
+        self.active = {}  # { device: running command count }
+        self.cond = threading.Condition()
+        self.workers = []
+        self.stats = {"submitted": 0, "merged": 0, "completed": 0, "failed": 0}
+
+    def submit(self, key, device, fn, *args, on_merge=None):
+        """Queue fn(*args) against `device`. Returns a Future for its result."""
+        future = Future()
+        with self.cond:
+            self.stats["submitted"] += 1
+            entry = self.queue.get(key)
+            if entry is not None:
+                if on_merge is not None:
+                    on_merge(entry["args"])
+                entry["fn"], entry["args"] = fn, args
+                entry["futures"].append(future)
+                self.stats["merged"] += 1
+            else:
+                self.queue[key] = {"device": device, "fn": fn, "args": args, "futures": [future]}
+                if len(self.workers) < self.max_workers and len(self.workers) < len(self.queue) + sum(self.active.values()):
+                    worker = threading.Thread(target=self._run, name=f'actuation-{len(self.workers)}', daemon=True)
+                    self.workers.append(worker)
+                    worker.start()
+            self.cond.notify()
+        return future
+
+    def _next(self):
+        """Pop the oldest queued command whose device has a free slot (caller holds the lock)."""
+        for key, entry in self.queue.items():
+            if self.active.get(entry["device"], 0) < self.per_device:
+                del self.queue[key]
+                self.active[entry["device"]] = self.active.get(entry["device"], 0) + 1
+                return entry
+        return None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                entry = self._next()
+                while entry is None:
+                    self.cond.wait()
+                    entry = self._next()
+            try:
+                result = entry["fn"](*entry["args"])
+            except Exception as e:
+                with self.cond:
+                    self.stats["failed"] += 1
+                for future in entry["futures"]:
+                    future.set_exception(e)
+            else:
+                with self.cond:
+                    self.stats["completed"] += 1
+                for future in entry["futures"]:
+                    future.set_result(result)
+            finally:
+                with self.cond:
+                    device = entry["device"]
+                    self.active[device] -= 1
+                    if not self.active[device]:
+                        del self.active[device]
+                    self.cond.notify_all()
+
+    def status(self):
+        with self.cond:
+            return dict(self.stats, queued=len(self.queue), running=sum(self.active.values()),
+                        workers=len(self.workers))
+
+
+class DeviceCommandLog:
+    """
+    Bounded record of asynchronous device commands, looked up by command ID.
+    Status moves queued -> running -> succeeded | failed, or queued ->
+    superseded when a later command replaced it before it was sent. The
+    oldest finished commands are dropped once more than `max_commands` are held.
+    """
+
+    def __init__(self, max_commands=1000):
+        self.max_commands = max_commands
+        self.commands = OrderedDict()  # { command_id: command }
+        self.lock = threading.Lock()
+        self.next_id = 0
+
+    def create(self, hub_id, action, state):
+        with self.lock:
+            self.next_id += 1
+            command = {
+                "id": f"cmd-{self.next_id}",
+                "hub_id": hub_id,
+                "action": action,
+                "state": state,
+                "status": "queued",
+                "result": None,
+                "error": None,
+                "superseded_by": None,
+                "created_at": datetime.now().isoformat(),
+                "completed_at": None,
+            }
+            self.commands[command["id"]] = command
+            self._trim()
+            return command
+
+    def _trim(self):
+        """Drop the oldest finished commands beyond max_commands (caller holds the lock)."""
+        excess = len(self.commands) - self.max_commands
+        if excess <= 0:
+            return
+        for command_id in [cid for cid, c in self.commands.items() if c["status"] in ('succeeded', 'failed', 'superseded')][:excess]:
+            del self.commands[command_id]
+
+    def mark_running(self, command):
+        with self.lock:
+            command["status"] = "running"
+
+    def supersede(self, command, by):
+        """Mark a queued command as replaced by command `by` (it is never sent)."""
+        with self.lock:
+            command["status"] = "superseded"
+            command["superseded_by"] = by
+            command["completed_at"] = datetime.now().isoformat()
+            return dict(command)
+
+    def complete(self, command, result=None, error=None):
+        with self.lock:
+            if command["status"] == "superseded":
+                return dict(command)
+            command["status"] = "failed" if error else "succeeded"
+            command["result"] = result
+            command["error"] = error
+            command["completed_at"] = datetime.now().isoformat()
+            return dict(command)
+
+    def get(self, command_id):
+        with self.lock:
+            command = self.commands.get(command_id)
+            return dict(command) if command else None
@@ -0,0 +1,267 @@
+"""
+CropStack Gorilla — compressed block format for sealed hub history segments.
+Timestamps are stored as delta-of-delta milliseconds and temperature/moisture
+as XOR-encoded float32 bit patterns (as in Facebook's Gorilla TSDB). Silo
+readings change slowly and are rounded to one decimal, so most values encode
+in one or a few bits.
+
+File layout (little-endian):
+    b'GRL2'
+    block * N                       bit-packed records, each block byte-aligned
+    index entry * N                 <QIdd: offset, count, first_ts, last_ts
+    <I: N  b'GRL2'                  footer
+
+Timestamps round-trip exactly: each one also stores the distance, in float64
+steps, from its whole millisecond (one bit when it is a whole millisecond,
+as device-reported times are). Segments in the earlier b'GRL1' format,
+whole milliseconds only, are still read.
+"""
+
+import bisect
+import struct
+
+
+MAGIC = b'GRL2'
+MAGIC_MS = b'GRL1'  # earlier format: timestamps rounded to whole milliseconds
+INDEX_ENTRY = struct.Struct('<QIdd')
+FOOTER = struct.Struct('<I4s')
+FLOAT32 = struct.Struct('<f')
+UINT32 = struct.Struct('<I')
+FLOAT64 = struct.Struct('<d')
+UINT64 = struct.Struct('<Q')
+
+# Records per block; a range query decodes only the blocks it overlaps
+BLOCK_RECORDS = 1024
+
+
+class BitWriter:
+    def __init__(self):
+        self.buf = bytearray()
+        self.acc = 0
+        self.nbits = 0
+
+    def write(self, value, nbits):
+        self.acc = (self.acc << nbits) | (value & ((1 << nbits) - 1))
+        self.nbits += nbits
+        while self.nbits >= 8:
+            self.nbits -= 8
+            self.buf.append((self.acc >> self.nbits) & 0xFF)
+        self.acc &= (1 << self.nbits) - 1
+
+    def getvalue(self):
+        if self.nbits:
+            return bytes(self.buf) + bytes([(self.acc << (8 - self.nbits)) & 0xFF])
+        return bytes(self.buf)
+
+
+class BitReader:
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.pos = offset * 8
+
+    def read(self, nbits):
+        byte, off = self.pos >> 3, self.pos & 7
+        need = (off + nbits + 7) >> 3
+        chunk = int.from_bytes(self.data[byte:byte + need], 'big')
+        self.pos += nbits
+        return (chunk >> (need * 8 - off - nbits)) & ((1 << nbits) - 1)
+
+
+# Delta-of-delta buckets: (prefix bits, prefix length, value bits)
+DOD_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+def _write_dod(w, dod):
+    if dod == 0:
+        w.write(0, 1)
+        return
+    for prefix, plen, bits in DOD_BUCKETS:
+        if -(1 << (bits - 1)) < dod <= (1 << (bits - 1)):
+            w.write(prefix, plen)
+            w.write(dod, bits)
+            return
+    w.write(0b1111, 4)
+    w.write(dod, 64)
+
+
+def _read_dod(r):
+    if not r.read(1):
+        return 0
+    for _, plen, bits in DOD_BUCKETS:
+        if not r.read(1):
+            value = r.read(bits)
+            return value - (1 << bits) if value > (1 << (bits - 1)) else value
+    value = r.read(64)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+# Float64 steps between a timestamp and its whole millisecond: 0, or signed in 16 or 64 bits
+RESIDUAL_BITS = 16
+
+
+def _ts_bits(value):
+    return UINT64.unpack(FLOAT64.pack(value))[0]
+
+
+def _write_residual(w, ms, ts):
+    # Wrapped to 64 bits so any pair of float64 bit patterns round-trips
+    residual = (_ts_bits(ts) - _ts_bits(ms / 1000)) & 0xFFFFFFFFFFFFFFFF
+    if residual == 0:
+        w.write(0, 1)
+    elif residual < 1 << (RESIDUAL_BITS - 1) or residual >= (1 << 64) - (1 << (RESIDUAL_BITS - 1)):
+        w.write(0b10, 2)
+        w.write(residual, RESIDUAL_BITS)
+    else:
+        w.write(0b11, 2)
+        w.write(residual, 64)
+
+
+def _read_residual(r, ms):
+    if not r.read(1):
+        return ms / 1000
+    if r.read(1):
+        residual = r.read(64)
+    else:
+        residual = r.read(RESIDUAL_BITS)
+        if residual >= 1 << (RESIDUAL_BITS - 1):
+            residual -= 1 << RESIDUAL_BITS
+    return FLOAT64.unpack(UINT64.pack((_ts_bits(ms / 1000) + residual) & 0xFFFFFFFFFFFFFFFF))[0]
+
+
+class _XorState:
+    __slots__ = ('prev', 'leading', 'trailing')
+
+    def __init__(self, first):
+        self.prev = first
+        self.leading = 33  # no window yet
+        self.trailing = 0
+
+
+def _write_xor(w, state, bits):
+    xor = bits ^ state.prev
+    state.prev = bits
+    if xor == 0:
+        w.write(0, 1)
+        return
+    w.write(1, 1)
+    leading = min(32 - xor.bit_length(), 31)
+    trailing = (xor & -xor).bit_length() - 1
+    if leading >= state.leading and trailing >= state.trailing:
+        # Fits the previous meaningful-bit window
+        w.write(0, 1)
+        w.write(xor >> state.trailing, 32 - state.leading - state.trailing)
+        return
+    w.write(1, 1)
+    length = 32 - leading - trailing
+    w.write(leading, 5)
+    w.write(length - 1, 5)
+    w.write(xor >> trailing, length)
+    state.leading, state.trailing = leading, trailing
+
+
+def _read_xor(r, state):
+    if not r.read(1):
+        return state.prev
+    if r.read(1):
+        state.leading = r.read(5)
+        length = r.read(5) + 1
+        state.trailing = 32 - state.leading - length
+    else:
+        length = 32 - state.leading - state.trailing
+    state.prev ^= r.read(length) << state.trailing
+    return state.prev
+
+
+def _float_bits(value):
+    return UINT32.unpack(FLOAT32.pack(value))[0]
+
+
+def _bits_float(bits):
+    return FLOAT32.unpack(UINT32.pack(bits))[0]
+
+
+def encode_block(records):
+    """Bit-pack time-sorted (ts, temperature, moisture) records into one block."""
+    w = BitWriter()
+    prev_ts = round(records[0][0] * 1000)
+    temp = _XorState(_float_bits(records[0][1]))
+    moist = _XorState(_float_bits(records[0][2]))
+    w.write(prev_ts, 64)
+    _write_residual(w, prev_ts, records[0][0])
+    w.write(temp.prev, 32)
+    w.write(moist.prev, 32)
+    prev_delta = 0
+    for exact, t, m in records[1:]:
+        ts = round(exact * 1000)
+        delta = ts - prev_ts
+        _write_dod(w, delta - prev_delta)
+        _write_residual(w, ts, exact)
+        prev_ts, prev_delta = ts, delta
+        _write_xor(w, temp, _float_bits(t))
+        _write_xor(w, moist, _float_bits(m))
+    return w.getvalue()
+
+
+def decode_block(data, offset, count, exact=True):
+    """
+    Stream (ts, temperature, moisture) records out of one block
+    (`exact` False for a block in the whole-millisecond GRL1 format).
+    """
+    r = BitReader(data, offset)
+    ts = r.read(64)
+    if ts >= 1 << 63:
+        ts -= 1 << 64
+    first = _read_residual(r, ts) if exact else ts / 1000
+    temp = _XorState(r.read(32))
+    moist = _XorState(r.read(32))
+    yield first, _bits_float(temp.prev), _bits_float(moist.prev)
+    delta = 0
+    for _ in range(count - 1):
+        delta += _read_dod(r)
+        ts += delta
+        yield (_read_residual(r, ts) if exact else ts / 1000,
+               _bits_float(_read_xor(r, temp)), _bits_float(_read_xor(r, moist)))
+
+
+def encode_segment(records, block_records=BLOCK_RECORDS):
+    """Encode time-sorted records into a complete compressed segment."""
+    out = bytearray(MAGIC)
+    index = []
+    for i in range(0, len(records), block_records):
+        block = records[i:i + block_records]
+        index.append(INDEX_ENTRY.pack(len(out), len(block), block[0][0], block[-1][0]))
+        out += encode_block(block)
+    for entry in index:
+        out += entry
+    out += FOOTER.pack(len(index), MAGIC)
+    return bytes(out)
+
+
+def read_index(data):
+    """Block index of a compressed segment as a list of (offset, count, first_ts, last_ts)."""
+    if len(data) < len(MAGIC) + FOOTER.size or data[:4] not in (MAGIC, MAGIC_MS):
+        raise ValueError("not a compressed history segment")
+    n, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+    if magic != data[:4]:
+        raise ValueError("truncated compressed history segment")
+    start = len(data) - FOOTER.size - n * INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(data, start + i * INDEX_ENTRY.size) for i in range(n)]
+
+
+def iter_segment(data, lo=float('-inf'), hi=float('inf')):
+    """
+    Stream records with lo <= ts <= hi from a compressed segment.
+    Blocks are located by binary search on the index and decoded lazily;
+    decoding stops at the first record past `hi`.
+    """
+    index = read_index(data)
+    exact = data[:4] == MAGIC
+    first = max(0, bisect.bisect_left([entry[3] for entry in index], lo))
+    for offset, count, first_ts, last_ts in index[first:]:
+        if first_ts > hi:
+            return
+        for record in decode_block(data, offset, count, exact):
+            if record[0] > hi:
+                return
+            if record[0] >= lo:
+                yield record
@@ -0,0 +1,749 @@
+"""
+CropStack History Log — durable on-disk time series for hub telemetry.
+Append-only segmented log per hub with fixed-width binary records, group
+commit through one shared journal, memory-mapped range reads and background
+compaction/retention. Stays on local disk — sensor readings are never sent to Firestore.
+
+Layout:
+    <root>/journal-<index>.log                  group-commit journal (crc-framed appends, all hubs)
+    <root>/<hub_id>/active.seg                  appended to at checkpoints, sealed early if out of time order
+    <root>/<hub_id>/<min_ms>-<max_ms>.gseg      sealed, sorted, Gorilla-compressed
+    <root>/<hub_id>/<min_ms>-<max_ms>.seg       sealed, sorted, fixed-width (uncompressed)
+    <root>/<hub_id>/rollup-<resolution>.dat     closed rollup buckets, sorted by bucket start
+    <root>/<hub_id>/rollup-<resolution>.amend   corrected buckets (late readings), folded in by compaction
+"""
+
+import bisect
+import math
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+
+import gorilla
+
+
+# One reading: epoch seconds (float64), temperature (float32), moisture (float32)
+RECORD = struct.Struct('<dff')
+
+# One closed rollup bucket, in RollupTier column order:
+# start (float64), t_min, t_max (float32), t_sum (float64), t_last, m_min, m_max (float32),
+# m_sum (float64), m_last (float32), count (uint32)
+ROLLUP = struct.Struct('<dffdfffdfI')
+
+ACTIVE_SEGMENT = 'active.seg'
+JOURNAL_FRAME = struct.Struct('<II')  # payload length, crc32
+JOURNAL_KEY = struct.Struct('<H')  # length of the file key that starts each payload
+SEGMENT_SUFFIX = '.seg'
+COMPRESSED_SUFFIX = '.gseg'
+
+
+def sealed_segment_name(min_ts, max_ts, suffix=COMPRESSED_SUFFIX):
+    # Round outward to whole milliseconds so the name's range covers every record
+    return f"{math.floor(min_ts * 1000):016d}-{math.ceil(max_ts * 1000):016d}{suffix}"
+
+
+def parse_segment_name(name):
+    """(min_ts, max_ts) for a sealed segment file name, or None."""
+    if name == ACTIVE_SEGMENT:
+        return None
+    for suffix in (SEGMENT_SUFFIX, COMPRESSED_SUFFIX):
+        if name.endswith(suffix):
+            try:
+                lo, hi = name[:-len(suffix)].split('-')
+                return int(lo) / 1000, int(hi) / 1000
+            except ValueError:
+                return None
+    return None
+
+
+def rollup_name(resolution):
+    return f"rollup-{int(resolution)}.dat"
+
+
+def rollup_amend_name(resolution):
+    return f"rollup-{int(resolution)}.amend"
+
+
+def is_rollup_name(name):
+    return name.startswith('rollup-') and name.endswith(('.dat', '.amend'))
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_SUFFIX)
+
+
+def read_records(path):
+    """All complete records in a segment file as a list of (ts, temperature, moisture)."""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not is_compressed(path):
+                size -= size % RECORD.size
+            if size == 0:
+                return []
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+                if is_compressed(path):
+                    return list(gorilla.iter_segment(m))
+                return list(RECORD.iter_unpack(m))
+    except FileNotFoundError:
+        return []
+
+
+def segment_record_count(path):
+    """Number of records in a sealed segment without decoding it."""
+    if not is_compressed(path):
+        return os.path.getsize(path) // RECORD.size
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        return sum(entry[1] for entry in gorilla.read_index(m))
+
+
+def lower_bound(buf, count, ts, record=RECORD):
+    """Index of the first record with time >= ts in a time-sorted record buffer. O(log n)."""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if record.unpack_from(buf, mid * record.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def upper_bound(buf, count, ts, record=RECORD):
+    """Index past the last record with time <= ts in a time-sorted record buffer. O(log n)."""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if record.unpack_from(buf, mid * record.size)[0] <= ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def read_sorted_range(path, lo, hi, limit=None):
+    """
+    Records with lo <= ts <= hi from a time-sorted segment (with `limit`,
+    only the newest `limit` of them). Binary-searches the mmap for both ends
+    and only unpacks the matching slice; compressed segments binary-search
+    their block index and stream-decode.
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if is_compressed(path):
+                with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+                    records = list(gorilla.iter_segment(m, lo, hi))
+                return records if limit is None else records[-limit:]
+            count = size // RECORD.size
+            if count == 0:
+                return []
+            with mmap.mmap(f.fileno(), count * RECORD.size, access=mmap.ACCESS_READ) as m:
+                first = lower_bound(m, count, lo)
+                last = upper_bound(m, count, hi)
+                if limit is not None:
+                    first = max(first, last - limit)
+                if first >= last:
+                    return []
+                return list(RECORD.iter_unpack(m[first * RECORD.size:last * RECORD.size]))
+    except FileNotFoundError:
+        return []
+
+
+def sorted_tail(records, last):
+    """Time of the last record if `records` continue in time order after `last`, else None."""
+    for record in records:
+        if record[0] < last:
+            return None
+        last = record[0]
+    return last
+
+
+def read_rollup_range(path, lo, hi):
+    """Rollup rows with lo <= start <= hi from a rollup file, binary-searched through mmap."""
+    try:
+        with open(path, 'rb') as f:
+            count = os.fstat(f.fileno()).st_size // ROLLUP.size
+            if count == 0:
+                return []
+            with mmap.mmap(f.fileno(), count * ROLLUP.size, access=mmap.ACCESS_READ) as m:
+                first = lower_bound(m, count, lo, ROLLUP)
+                last = upper_bound(m, count, hi, ROLLUP)
+                return list(ROLLUP.iter_unpack(m[first * ROLLUP.size:last * ROLLUP.size]))
+    except FileNotFoundError:
+        return []
+
+
+def rollup_file_bounds(path):
+    """(first start, last start) of the rows in a rollup file, or None if it has none."""
+    try:
+        with open(path, 'rb') as f:
+            count = os.fstat(f.fileno()).st_size // ROLLUP.size
+            if count == 0:
+                return None
+            first = ROLLUP.unpack(f.read(ROLLUP.size))[0]
+            f.seek((count - 1) * ROLLUP.size)
+            return first, ROLLUP.unpack(f.read(ROLLUP.size))[0]
+    except FileNotFoundError:
+        return None
+
+
+def journal_name(index):
+    return f"journal-{index:010d}.log"
+
+
+def parse_journal_name(name):
+    if name.startswith('journal-') and name.endswith('.log'):
+        try:
+            return int(name[8:-4])
+        except ValueError:
+            return None
+    return None
+
+
+def encode_journal_frame(key, data):
+    """One journal frame: bytes `data` to append to the file `key` (relative to the root)."""
+    raw = key.encode()
+    payload = JOURNAL_KEY.pack(len(raw)) + raw + data
+    return JOURNAL_FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_journal(path):
+    """(key, data) frames of a journal in order, stopping at the first torn or corrupt frame."""
+    with open(path, 'rb') as f:
+        buf = f.read()
+    offset = 0
+    while offset + JOURNAL_FRAME.size <= len(buf):
+        length, crc = JOURNAL_FRAME.unpack_from(buf, offset)
+        payload = buf[offset + JOURNAL_FRAME.size:offset + JOURNAL_FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        (key_len,) = JOURNAL_KEY.unpack_from(payload)
+        yield payload[JOURNAL_KEY.size:JOURNAL_KEY.size + key_len].decode(), payload[JOURNAL_KEY.size + key_len:]
+        offset += JOURNAL_FRAME.size + length
+
+
+def append_unless_present(path, data, record_size):
+    """
+    Append `data` to `path`, skipping any prefix of it the file already ends
+    with (a replayed journal frame whose checkpoint write had landed, fully or
+    partly, before a crash). Torn trailing records are truncated first.
+    """
+    with open(path, 'a+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size % record_size:
+            size -= size % record_size
+            f.truncate(size)
+        f.seek(max(0, size - len(data)))
+        tail = f.read()
+        present = 0
+        for n in range(min(len(tail), len(data)), 0, -record_size):
+            if tail.endswith(data[:n]):
+                present = n
+                break
+        f.seek(0, os.SEEK_END)
+        f.write(data[present:])
+        return (len(data) - present) // record_size
+
+
+def write_segment(path, records):
+    """Write records to `path` atomically (temp file, fsync, rename)."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        if is_compressed(path):
+            f.write(gorilla.encode_segment(records))
+        else:
+            f.write(b''.join(RECORD.pack(*r) for r in records))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SegmentedHistoryLog:
+    """
+    Durable per-hub history. `append` only buffers in memory. Every
+    `flush_interval` seconds a background thread writes all buffered records,
+    for every hub, to one shared journal with a single fsync (group commit).
+    Every `checkpoint_interval` seconds the journaled records are appended to
+    each hub's active segment (one open/fsync per hub per checkpoint, not per
+    flush) and the old journal is deleted; after a crash the journal is
+    replayed. The active segment is sealed (sorted, renamed with its time
+    range) once it holds `segment_max_records`, or at the next checkpoint
+    if a record arrived out of time order, so range reads can binary-search
+    it like a sealed segment; with `compress_sealed` sealed
+    segments use the Gorilla block format (see gorilla.py). Compaction merges
+    small adjacent sealed segments, compresses any left uncompressed and
+    deletes segments past `retention_seconds`.
+    Closed rollup buckets (see HubHistoryStore) are journaled the same way
+    into one file per hub and resolution and trimmed to the retention each
+    resolution registers with `keep_rollups`. A bucket stored again after a
+    late reading (`amend_rollup`) goes to a side file that reads apply over
+    the rollup file until compaction folds it in.
+    """
+
+    def __init__(self, root, flush_interval=1.0, checkpoint_interval=300.0, segment_max_records=65536,
+                 retention_seconds=30 * 24 * 3600, compact_interval=3600.0, compress_sealed=True):
+        self.root = root
+        self.sealed_suffix = COMPRESSED_SUFFIX if compress_sealed else SEGMENT_SUFFIX
+        self.flush_interval = flush_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.segment_max_records = segment_max_records
+        self.retention_seconds = retention_seconds
+        self.compact_interval = compact_interval
+
+        self.pending = {}  # { hub_id: [record, ...] } not yet journaled
+        self.pending_rollups = {}  # { file key: bytearray } rollup rows not yet journaled
+        self.rollup_retention = {}  # { resolution: seconds of rollup rows kept }
+        self.pending_lock = threading.Lock()
+        self.io_lock = threading.RLock()  # guards files, the journal and unapplied data
+        self.unapplied = {}  # { file key: bytearray } journaled, not yet in its file
+        self.journal = None
+        self.journal_index = 0
+        self.active_counts = {}  # { hub_id: records in active segment }
+        # { hub_id: newest ts if the active segment is in time order, else None } (absent: not checked yet)
+        self.active_tails = {}
+        self.thread = None
+        self.stats = {
+            "appended": 0,
+            "written": 0,
+            "flushes": 0,
+            "fsyncs": 0,
+            "checkpoints": 0,
+            "replayed": 0,
+            "sealed": 0,
+            "rollups_amended": 0,
+            "compactions": 0,
+            "segments_removed": 0,
+            "last_flush_ms": None,
+            "last_checkpoint_ms": None,
+        }
+
+    # ── lifecycle ─────────────────────────────
+
+    def _recover(self):
+        """Drop torn trailing records and leftover temp files, then replay journals left by a crash."""
+        for hub_id in self.hub_ids():
+            hub_dir = self._hub_dir(hub_id)
+            for name in os.listdir(hub_dir):
+                path = os.path.join(hub_dir, name)
+                if name.endswith('.tmp'):
+                    os.remove(path)
+                elif name == ACTIVE_SEGMENT or is_rollup_name(name):
+                    record_size = RECORD.size if name == ACTIVE_SEGMENT else ROLLUP.size
+                    size = os.path.getsize(path)
+                    if size % record_size:
+                        with open(path, 'r+b') as f:
+                            f.truncate(size - size % record_size)
+                    if name == ACTIVE_SEGMENT:
+                        self.active_counts[hub_id] = size // record_size
+
+        journals = sorted(index for index in map(parse_journal_name, os.listdir(self.root)) if index is not None)
+        touched = set()
+        for index in journals:
+            for key, data in read_journal(os.path.join(self.root, journal_name(index))):
+                touched.update(self._replay(key, data))
+        for path in touched:
+            if os.path.exists(path):
+                with open(path, 'rb+') as f:
+                    os.fsync(f.fileno())
+        for index in journals:
+            os.remove(os.path.join(self.root, journal_name(index)))
+        self.journal_index = journals[-1] + 1 if journals else 0
+
+    def _replay(self, key, data):
+        """Apply one journal frame to its file; returns the paths written."""
+        hub_id, _, name = key.partition('/')
+        if not name:
+            # Hub removal marker
+            shutil.rmtree(self._hub_dir(hub_id), ignore_errors=True)
+            self.active_counts.pop(hub_id, None)
+            self.active_tails.pop(hub_id, None)
+            return []
+        os.makedirs(self._hub_dir(hub_id), exist_ok=True)
+        path = os.path.join(self.root, key)
+        if name == ACTIVE_SEGMENT:
+            added = append_unless_present(path, data, RECORD.size)
+            self.active_counts[hub_id] = self.active_counts.get(hub_id, 0) + added
+            self.active_tails.pop(hub_id, None)
+            self.stats["replayed"] += added
+        else:
+            append_unless_present(path, data, ROLLUP.size)
+        return [path]
+
+    def start(self):
+        """Recover the log directory after a crash and start the background flush thread."""
+        if self.thread is None:
+            os.makedirs(self.root, exist_ok=True)
+            self._recover()
+            self._open_journal()
+            self.thread = threading.Thread(target=self._run, name='history-log', daemon=True)
+            self.thread.start()
+
+    def _open_journal(self):
+        self.journal = open(os.path.join(self.root, journal_name(self.journal_index)), 'ab')
+
+    def _run(self):
+        last_checkpoint = last_compact = time.monotonic()
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                    self.checkpoint()
+                    last_checkpoint = time.monotonic()
+                if time.monotonic() - last_compact >= self.compact_interval:
+                    self.compact()
+                    last_compact = time.monotonic()
+            except Exception as e:
+                print(f"⚠️  History log error: {e}")
+
+    def close(self):
+        self.flush()
+        self.checkpoint()
+        with self.io_lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    # ── writes ────────────────────────────────
+
+    def _hub_dir(self, hub_id):
+        return os.path.join(self.root, hub_id)
+
+    def append(self, hub_id, ts, temperature, moisture):
+        with self.pending_lock:
+            self.pending.setdefault(hub_id, []).append((ts, temperature, moisture))
+            self.stats["appended"] += 1
+
+    def _journal_write(self, frames):
+        """Append frames to the journal with one fsync (caller holds io_lock)."""
+        self.journal.write(b''.join(frames))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.stats["fsyncs"] += 1
+
+    def append_rollup(self, hub_id, resolution, row):
+        """Buffer one closed rollup bucket (a tuple in ROLLUP field order) for a hub."""
+        with self.pending_lock:
+            self.pending_rollups.setdefault(f"{hub_id}/{rollup_name(resolution)}", bytearray()).extend(
+                ROLLUP.pack(*row))
+
+    def amend_rollup(self, hub_id, resolution, row):
+        """Buffer a corrected version of an already stored rollup bucket for a hub."""
+        with self.pending_lock:
+            self.pending_rollups.setdefault(f"{hub_id}/{rollup_amend_name(resolution)}", bytearray()).extend(
+                ROLLUP.pack(*row))
+            self.stats["rollups_amended"] += 1
+
+    def keep_rollups(self, resolution, retention):
+        """Keep `resolution` rollup rows for `retention` seconds (applied by compaction)."""
+        self.rollup_retention[resolution] = retention
+
+    def flush(self):
+        """Journal all buffered records and rollup rows, for every hub, with a single fsync."""
+        with self.io_lock:
+            if self.journal is None:
+                return
+            # Swap under io_lock so readers never see records in neither place
+            with self.pending_lock:
+                pending, self.pending = self.pending, {}
+                rollups, self.pending_rollups = self.pending_rollups, {}
+            if not pending and not rollups:
+                return
+            started = time.perf_counter()
+            frames, written = [], 0
+            for hub_id, records in pending.items():
+                data = b''.join(RECORD.pack(*r) for r in records)
+                key = f"{hub_id}/{ACTIVE_SEGMENT}"
+                frames.append(encode_journal_frame(key, data))
+                self.unapplied.setdefault(key, bytearray()).extend(data)
+                written += len(records)
+            for key, data in rollups.items():
+                frames.append(encode_journal_frame(key, bytes(data)))
+                self.unapplied.setdefault(key, bytearray()).extend(data)
+            self._journal_write(frames)
+            self.stats["written"] += written
+            self.stats["flushes"] += 1
+            self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def checkpoint(self):
+        """
+        Move journaled data into the per-hub files (one fsync per file), then
+        delete the journal. Each file is applied under the lock on its own, so
+        readers and flushes are only held up for one file at a time.
+        """
+        started = time.perf_counter()
+        with self.io_lock:
+            if self.journal is None or not self.unapplied:
+                return
+            self.journal.close()
+            old_index = self.journal_index
+            self.journal_index += 1
+            self._open_journal()
+            keys = list(self.unapplied)
+        for key in keys:
+            with self.io_lock:
+                data = self.unapplied.pop(key, None)
+                if not data:
+                    continue
+                hub_id, _, name = key.partition('/')
+                if not os.path.isdir(self._hub_dir(hub_id)):
+                    os.makedirs(self._hub_dir(hub_id), exist_ok=True)
+                if name == ACTIVE_SEGMENT:
+                    tail = self._active_tail(hub_id)
+                with open(os.path.join(self.root, key), 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.stats["fsyncs"] += 1
+                if name == ACTIVE_SEGMENT:
+                    self.active_counts[hub_id] = self.active_counts.get(hub_id, 0) + len(data) // RECORD.size
+                    self.active_tails[hub_id] = None if tail is None else sorted_tail(RECORD.iter_unpack(data), tail)
+        with self.io_lock:
+            for index in range(old_index, -1, -1):
+                path = os.path.join(self.root, journal_name(index))
+                if not os.path.exists(path):
+                    break
+                os.remove(path)
+            for hub_id, count in list(self.active_counts.items()):
+                if count >= self.segment_max_records or (count and hub_id in self.active_tails
+                                                         and self.active_tails[hub_id] is None):
+                    self._seal(hub_id)
+            self.stats["checkpoints"] += 1
+            self.stats["last_checkpoint_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _seal(self, hub_id):
+        """Sort the active segment into a sealed, time-named segment (caller holds io_lock)."""
+        active = os.path.join(self._hub_dir(hub_id), ACTIVE_SEGMENT)
+        records = sorted(read_records(active))
+        if records:
+            path = os.path.join(self._hub_dir(hub_id),
+                                sealed_segment_name(records[0][0], records[-1][0], self.sealed_suffix))
+            if os.path.exists(path):
+                records = sorted(records + read_records(path))
+            write_segment(path, records)
+            self.stats["sealed"] += 1
+        if os.path.exists(active):
+            os.remove(active)
+        self.active_counts[hub_id] = 0
+        self.active_tails[hub_id] = float('-inf')
+
+    def remove_hub(self, hub_id):
+        with self.pending_lock:
+            self.pending.pop(hub_id, None)
+            for key in [key for key in self.pending_rollups if key.startswith(hub_id + '/')]:
+                del self.pending_rollups[key]
+        with self.io_lock:
+            for key in [key for key in self.unapplied if key.startswith(hub_id + '/')]:
+                del self.unapplied[key]
+            if self.journal is not None:
+                # Journaled so a replay after a crash does not bring the hub's files back
+                self._journal_write([encode_journal_frame(hub_id + '/', b'')])
+            self.active_counts.pop(hub_id, None)
+            self.active_tails.pop(hub_id, None)
+            shutil.rmtree(self._hub_dir(hub_id), ignore_errors=True)
+
+    # ── reads ─────────────────────────────────
+
+    def hub_ids(self):
+        try:
+            return [name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name))]
+        except FileNotFoundError:
+            return []
+
+    def sealed_segments(self, hub_id):
+        """Sealed segments for a hub as (min_ts, max_ts, path), oldest first."""
+        try:
+            names = os.listdir(self._hub_dir(hub_id))
+        except FileNotFoundError:
+            return []
+        segments = []
+        for name in names:
+            span = parse_segment_name(name)
+            if span:
+                segments.append((span[0], span[1], os.path.join(self._hub_dir(hub_id), name)))
+        segments.sort()
+        return segments
+
+    def _active_tail(self, hub_id):
+        """
+        Time of the newest record if a hub's active segment is in time order
+        (-inf when empty), else None. Read from the file once, then kept up
+        to date by checkpoints (caller holds io_lock).
+        """
+        if hub_id not in self.active_tails:
+            records = read_records(os.path.join(self._hub_dir(hub_id), ACTIVE_SEGMENT))
+            self.active_tails[hub_id] = sorted_tail(records, float('-inf'))
+        return self.active_tails[hub_id]
+
+    def _active_range(self, hub_id, lo, hi, limit=None):
+        """
+        Records with lo <= ts <= hi in the active segment plus those journaled
+        for it (caller holds io_lock); with `limit`, at least the newest
+        `limit` of them. A segment in time order is binary-searched; one with
+        out-of-order records (sealed at the next checkpoint) is scanned.
+        """
+        path = os.path.join(self._hub_dir(hub_id), ACTIVE_SEGMENT)
+        if self._active_tail(hub_id) is None:
+            records = [r for r in read_records(path) if lo <= r[0] <= hi]
+        else:
+            records = read_sorted_range(path, lo, hi, limit)
+        data = self.unapplied.get(f"{hub_id}/{ACTIVE_SEGMENT}")
+        if data:
+            records.extend(r for r in RECORD.iter_unpack(data) if lo <= r[0] <= hi)
+        return records
+
+    def read_range(self, hub_id, start=None, end=None, limit=None):
+        """
+        Records for a hub with start <= ts <= end (either bound optional),
+        sorted by time; with `limit`, only the newest `limit` of them. Sealed
+        segments outside the range are skipped by name, and matching ones are
+        binary-searched through mmap so only the records in range are decoded.
+        With a limit, segments are read newest first and reading stops once
+        no older segment can hold one of the newest `limit` records.
+        Includes records not yet flushed.
+        """
+        lo = float('-inf') if start is None else start
+        hi = float('inf') if end is None else end
+        with self.io_lock:
+            segments = self.sealed_segments(hub_id)
+            # Sealed segments sorted by min time: none starting after `hi` can match
+            stop = bisect.bisect_right([seg[0] for seg in segments], hi)
+            records = self._active_range(hub_id, lo, hi, limit)
+            with self.pending_lock:
+                records.extend(r for r in self.pending.get(hub_id, ()) if lo <= r[0] <= hi)
+            for seg_lo, seg_hi, path in sorted(segments[:stop], key=lambda seg: seg[1], reverse=True):
+                if seg_hi < lo:
+                    break
+                if limit is not None and len(records) >= limit:
+                    records.sort()
+                    if seg_hi < records[-limit][0]:
+                        break
+                records.extend(read_sorted_range(path, lo, hi, limit))
+        records.sort()
+        return records if limit is None else records[-limit:]
+
+    def recent(self, hub_id, limit):
+        """The newest `limit` records for a hub, oldest first."""
+        return self.read_range(hub_id, limit=limit)
+
+    def _rollup_rows(self, hub_id, name):
+        """Rollup rows journaled or buffered but not yet in the file `name` (caller holds io_lock)."""
+        key = f"{hub_id}/{name}"
+        rows = list(ROLLUP.iter_unpack(self.unapplied.get(key, b'')))
+        with self.pending_lock:
+            rows.extend(ROLLUP.iter_unpack(self.pending_rollups.get(key, b'')))
+        return rows
+
+    def rollup_bounds(self, hub_id, resolution):
+        """(first start, last start) of a hub's stored rollup rows at `resolution`, or None."""
+        with self.io_lock:
+            bounds = rollup_file_bounds(os.path.join(self._hub_dir(hub_id), rollup_name(resolution)))
+            rows = self._rollup_rows(hub_id, rollup_name(resolution))
+        if not rows:
+            return bounds
+        return (bounds[0] if bounds else rows[0][0]), rows[-1][0]
+
+    def read_rollups(self, hub_id, resolution, start, end):
+        """Stored rollup rows with start <= bucket start <= end, oldest first."""
+        with self.io_lock:
+            rows = read_rollup_range(os.path.join(self._hub_dir(hub_id), rollup_name(resolution)), start, end)
+            rows.extend(row for row in self._rollup_rows(hub_id, rollup_name(resolution)) if start <= row[0] <= end)
+            # The amendment file is unsorted and small; the newest amendment of a bucket wins
+            amendments = read_rollup_range(os.path.join(self._hub_dir(hub_id), rollup_amend_name(resolution)),
+                                           float('-inf'), float('inf'))
+            amendments.extend(self._rollup_rows(hub_id, rollup_amend_name(resolution)))
+        amended = {row[0]: row for row in amendments if start <= row[0] <= end}
+        return [amended.get(row[0], row) for row in rows] if amended else rows
+
+    # ── compaction ────────────────────────────
+
+    def compact(self, now=None):
+        """
+        Apply retention and merge small sealed segments.
+        Segments entirely older than the retention window are deleted; runs of
+        adjacent sealed segments smaller than a quarter of `segment_max_records`
+        are merged into one sorted segment, and sealed segments not in the
+        configured format are re-encoded. An active segment that has had no
+        new records for a compaction interval is sealed, so idle hubs don't keep
+        an unsorted tail forever. Rollup rows past their resolution's retention
+        are dropped once they make up a quarter of the file.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - self.retention_seconds
+        small = self.segment_max_records // 4
+        for hub_id in self.hub_ids():
+            with self.io_lock:
+                if self.active_counts.get(hub_id):
+                    newest = max((r[0] for r in self._active_range(hub_id, float('-inf'), float('inf'), 1)),
+                                 default=now)
+                    if now - newest >= self.compact_interval:
+                        self._seal(hub_id)
+
+                run = []
+                for seg_lo, seg_hi, path in self.sealed_segments(hub_id):
+                    if seg_hi < cutoff:
+                        os.remove(path)
+                        self.stats["segments_removed"] += 1
+                        continue
+                    if segment_record_count(path) < small:
+                        run.append(path)
+                        continue
+                    self._merge(hub_id, run)
+                    run = []
+                    if not path.endswith(self.sealed_suffix):
+                        self._merge(hub_id, [path], rewrite=True)
+                self._merge(hub_id, run, rewrite=len(run) == 1 and not run[0].endswith(self.sealed_suffix))
+                for resolution, retention in self.rollup_retention.items():
+                    self._compact_rollups(hub_id, resolution, now - retention)
+        self.stats["compactions"] += 1
+
+    def _compact_rollups(self, hub_id, resolution, cutoff):
+        """
+        Rewrite a rollup file with its amendments applied and without rows
+        starting before `cutoff`, then drop the amendment file (caller holds io_lock).
+        """
+        path = os.path.join(self._hub_dir(hub_id), rollup_name(resolution))
+        amend_path = os.path.join(self._hub_dir(hub_id), rollup_amend_name(resolution))
+        rows = read_rollup_range(path, float('-inf'), float('inf'))
+        amended = {row[0]: row for row in read_rollup_range(amend_path, float('-inf'), float('inf'))}
+        keep = bisect.bisect_left([row[0] for row in rows], cutoff)
+        if not amended and (keep == 0 or keep * 4 < len(rows)):
+            return
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b''.join(ROLLUP.pack(*amended.get(row[0], row)) for row in rows[keep:]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if amended:
+            os.remove(amend_path)
+
+    def _merge(self, hub_id, paths, rewrite=False):
+        """Merge sealed segments into one, or re-encode a single one (caller holds io_lock)."""
+        if len(paths) < 2 and not rewrite:
+            return
+        records = []
+        for path in paths:
+            records.extend(read_records(path))
+        records.sort()
+        merged = os.path.join(self._hub_dir(hub_id),
+                              sealed_segment_name(records[0][0], records[-1][0], self.sealed_suffix))
+        write_segment(merged, records)
+        for path in paths:
+            if path != merged:
+                os.remove(path)
+
+    def status(self):
+        with self.pending_lock:
+            pending = sum(len(r) for r in self.pending.values())
+            pending_rollups = sum(len(data) for data in self.pending_rollups.values()) // ROLLUP.size
+        with self.io_lock:
+            unapplied = sum(len(data) // (RECORD.size if key.endswith(ACTIVE_SEGMENT) else ROLLUP.size)
+                            for key, data in self.unapplied.items())
+            return dict(self.stats, pending=pending, pending_rollups=pending_rollups, unapplied=unapplied,
+                        journal_index=self.journal_index)
@@ -0,0 +1,538 @@
+"""
+CropStack Hub History — local sensor history storage for hubs.
+Readings are kept in fixed-capacity columnar ring buffers (epoch seconds plus
+float32 temperature/moisture) so appends are O(1) and never copy the buffer.
+Alongside them, 1-minute/15-minute/1-hour rollups (min/max/avg/last/count)
+are maintained incrementally, each with its own retention, so long-range
+queries never touch raw readings.
+An optional durable backend (see history_log.py) keeps the full history on
+disk, and with it the coarse rollup tiers are archived there bucket by bucket
+instead of being held in memory.
+History stays local only — it is never sent to Firestore.
+"""
+
+import bisect
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+
+from hub_store import StripedLock
+
+
+# Points kept per hub (matches the old list trim of 100)
+DEFAULT_CAPACITY = 100
+
+# Rollup tiers as (resolution seconds, retention seconds), finest first
+DEFAULT_ROLLUP_TIERS = (
+    (60, 6 * 3600),            # 1 minute, kept 6 hours
+    (900, 14 * 24 * 3600),     # 15 minutes, kept 14 days
+    (3600, 180 * 24 * 3600),   # 1 hour, kept 180 days
+)
+
+# Tiers at least this coarse are archived to the backend as their buckets
+# close; memory only holds the bucket still being filled
+ARCHIVE_MIN_RESOLUTION = 900
+
+# Without a backend every tier stays in memory, kept at most this long
+MEMORY_ROLLUP_RETENTION = 7 * 24 * 3600
+
+
+def to_point(ts, temperature, moisture):
+    """One reading in the API shape: { time, temperature, moisture }."""
+    return {
+        "time": datetime.fromtimestamp(ts).isoformat(),
+        "temperature": round(temperature, 1),
+        "moisture": round(moisture, 1),
+    }
+
+
+# Aggregations supported by downsample()
+AGGREGATES = ('min', 'max', 'avg', 'last')
+
+
+def downsample(records, start, end, step, agg='avg'):
+    """
+    Bucket time-sorted (ts, temperature, moisture) records into `step`-second
+    buckets aligned to `start` and aggregate each bucket with min, max, avg or
+    last. Returns API-shaped points (one per non-empty bucket) with a count.
+    """
+    points = []
+    bucket = None
+    temps, moists = [], []
+
+    def emit():
+        if agg == 'min':
+            t, m = min(temps), min(moists)
+        elif agg == 'max':
+            t, m = max(temps), max(moists)
+        elif agg == 'last':
+            t, m = temps[-1], moists[-1]
+        else:
+            t, m = sum(temps) / len(temps), sum(moists) / len(moists)
+        point = to_point(start + bucket * step, t, m)
+        point["count"] = len(temps)
+        points.append(point)
+
+    for ts, t, m in records:
+        if ts < start or ts > end:
+            continue
+        b = int((ts - start) // step)
+        if b != bucket:
+            if temps:
+                emit()
+            bucket, temps, moists = b, [], []
+        temps.append(t)
+        moists.append(m)
+    if temps:
+        emit()
+    return points
+
+
+def downsample_rollups(buckets, start, end, step, agg='avg'):
+    """
+    Re-bucket rollup buckets (see RollupTier.buckets) into `step`-second
+    buckets aligned to `start`. `step` must be a multiple of the tier
+    resolution and `start` on the tier grid so buckets combine exactly.
+    """
+    points = []
+    current = None
+
+    def emit():
+        b, t_min, t_max, t_sum, t_last, m_min, m_max, m_sum, m_last, count = current
+        if agg == 'min':
+            t, m = t_min, m_min
+        elif agg == 'max':
+            t, m = t_max, m_max
+        elif agg == 'last':
+            t, m = t_last, m_last
+        else:
+            t, m = t_sum / count, m_sum / count
+        point = to_point(start + b * step, t, m)
+        point["count"] = count
+        points.append(point)
+
+    for bucket_start, t_min, t_max, t_sum, t_last, m_min, m_max, m_sum, m_last, count in buckets:
+        if bucket_start < start or bucket_start > end:
+            continue
+        b = int((bucket_start - start) // step)
+        if current is not None and current[0] == b:
+            current = [b, min(current[1], t_min), max(current[2], t_max), current[3] + t_sum, t_last,
+                       min(current[5], m_min), max(current[6], m_max), current[7] + m_sum, m_last,
+                       current[9] + count]
+        else:
+            if current is not None:
+                emit()
+            current = [b, t_min, t_max, t_sum, t_last, m_min, m_max, m_sum, m_last, count]
+    if current is not None:
+        emit()
+    return points
+
+
+class RollupTier:
+    """
+    Time-bucketed aggregates of one hub's readings at a fixed resolution.
+    Columnar arrays sorted by bucket start; an append into the newest bucket
+    is O(1), older buckets are found by binary search. Buckets older than
+    `retention` seconds behind the newest are trimmed in amortized chunks.
+    `complete_from` is the first bucket known to hold every reading (the tier
+    starts empty after a restart), so queries before it fall back to raw data.
+    """
+
+    __slots__ = ('resolution', 'retention', 'complete_from', 'starts', 't_min', 't_max', 't_sum', 't_last',
+                 'm_min', 'm_max', 'm_sum', 'm_last', 'counts')
+
+    def __init__(self, resolution, retention):
+        self.resolution = resolution
+        self.retention = retention
+        self.complete_from = None
+        self.starts = array('d')
+        self.t_min, self.t_max, self.t_last = array('f'), array('f'), array('f')
+        self.m_min, self.m_max, self.m_last = array('f'), array('f'), array('f')
+        self.t_sum, self.m_sum = array('d'), array('d')
+        self.counts = array('I')
+
+    def _columns(self):
+        return (self.starts, self.t_min, self.t_max, self.t_sum, self.t_last,
+                self.m_min, self.m_max, self.m_sum, self.m_last, self.counts)
+
+    def add(self, ts, temperature, moisture):
+        bucket = ts - ts % self.resolution
+        if self.complete_from is None:
+            self.complete_from = bucket + self.resolution
+        starts = self.starts
+        if starts and starts[-1] == bucket:
+            i = len(starts) - 1
+        else:
+            i = bisect.bisect_left(starts, bucket)
+            if i == len(starts) or starts[i] != bucket:
+                if starts and bucket < starts[-1] - self.retention:
+                    return  # older than this tier keeps
+                for column, value in zip(self._columns(), (bucket, temperature, temperature, 0.0, temperature,
+                                                           moisture, moisture, 0.0, moisture, 0)):
+                    column.insert(i, value)
+        if temperature < self.t_min[i]:
+            self.t_min[i] = temperature
+        if temperature > self.t_max[i]:
+            self.t_max[i] = temperature
+        if moisture < self.m_min[i]:
+            self.m_min[i] = moisture
+        if moisture > self.m_max[i]:
+            self.m_max[i] = moisture
+        self.t_sum[i] += temperature
+        self.m_sum[i] += moisture
+        self.t_last[i] = temperature
+        self.m_last[i] = moisture
+        self.counts[i] += 1
+        self._trim()
+
+    def _trim(self):
+        cutoff = self.starts[-1] - self.retention
+        if cutoff > self.complete_from:
+            self.complete_from = cutoff
+        expired = bisect.bisect_left(self.starts, cutoff)
+        # Trim in chunks so the front-of-array copy is amortized across appends
+        if expired >= 64 or (expired and expired * 4 >= len(self.starts)):
+            for column in self._columns():
+                del column[:expired]
+
+    def covers(self, start, now):
+        """True if every reading from `start` on is held by this tier."""
+        return self.complete_from is not None and start >= max(self.complete_from, now - self.retention)
+
+    def buckets(self, start, end):
+        """Buckets with start <= bucket start <= end, as tuples in column order."""
+        lo = bisect.bisect_left(self.starts, start)
+        hi = bisect.bisect_right(self.starts, end)
+        return zip(*(column[lo:hi] for column in self._columns()))
+
+    def row(self, i):
+        """Bucket `i` as a tuple in column order."""
+        return tuple(column[i] for column in self._columns())
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self._columns())
+
+
+class HubHistoryBuffer:
+    """Fixed-capacity ring buffer of (time, temperature, moisture) readings for one hub."""
+
+    __slots__ = ('capacity', 'times', 'temperatures', 'moistures', 'start', 'size')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.temperatures = array('f', bytes(4 * capacity))
+        self.moistures = array('f', bytes(4 * capacity))
+        self.start = 0  # index of the oldest point
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, ts, temperature, moisture):
+        """Append one reading, overwriting the oldest once full. O(1)."""
+        if self.size < self.capacity:
+            idx = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            idx = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[idx] = ts
+        self.temperatures[idx] = temperature
+        self.moistures[idx] = moisture
+
+    def segments(self, limit=None):
+        """
+        Return the last `limit` points as up to two contiguous index ranges
+        into the column arrays, oldest first.
+        """
+        n = self.size if limit is None else max(0, min(int(limit), self.size))
+        if n == 0:
+            return []
+        first = (self.start + self.size - n) % self.capacity
+        end = first + n
+        if end <= self.capacity:
+            return [(first, end)]
+        return [(first, self.capacity), (0, end - self.capacity)]
+
+    def columns(self, limit=None):
+        """
+        Zero-copy view of the last `limit` points: a list of
+        (times, temperatures, moistures) memoryview triples, oldest first.
+        """
+        times = memoryview(self.times)
+        temps = memoryview(self.temperatures)
+        moist = memoryview(self.moistures)
+        return [(times[a:b], temps[a:b], moist[a:b]) for a, b in self.segments(limit)]
+
+    def newest(self):
+        """The readings that share the newest time, as (time, temperature, moisture) tuples."""
+        readings = []
+        for i in range(self.size):
+            idx = (self.start + self.size - 1 - i) % self.capacity
+            if readings and self.times[idx] != readings[0][0]:
+                break
+            readings.append((self.times[idx], self.temperatures[idx], self.moistures[idx]))
+        return readings
+
+    def tail(self, limit=None):
+        """Return the last `limit` points in the API shape: [{ time, temperature, moisture }]."""
+        points = []
+        for times, temps, moist in self.columns(limit):
+            points.extend(map(to_point, times, temps, moist))
+        return points
+
+    def nbytes(self):
+        """Bytes used by the column arrays."""
+        return (self.times.itemsize + self.temperatures.itemsize + self.moistures.itemsize) * self.capacity
+
+
+class HubHistoryStore:
+    """
+    Per-hub history buffers keyed by hub ID.
+    With a `backend` (anything providing append/read_range/recent/remove_hub,
+    e.g. SegmentedHistoryLog), every reading is also handed to it and reads
+    that reach past the in-memory buffer are served from it. If the backend
+    also stores rollups (append_rollup/amend_rollup/rollup_bounds/read_rollups/
+    keep_rollups), tiers of ARCHIVE_MIN_RESOLUTION and coarser hand each
+    bucket to it as the next one opens, and again whenever a late reading
+    lands in it, and queries on them read the archived buckets back.
+    A hub's buffer and rollups are only touched under its stripe lock, so
+    readers copy out consistent data while other hubs keep recording.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, backend=None, rollup_tiers=DEFAULT_ROLLUP_TIERS, stripes=64):
+        self.capacity = capacity
+        self.buffers = {}
+        self.backend = backend
+        self.rollup_tiers = rollup_tiers
+        self.rollups = {}  # { hub_id: [RollupTier, ...] } finest first
+        self.archived_bounds = {}  # { (hub_id, resolution): [first start, last start] or None }
+        self.lock = StripedLock(stripes)
+        for res, ret in rollup_tiers:
+            if self.archives(res):
+                backend.keep_rollups(res, ret)
+
+    def __contains__(self, hub_id):
+        return hub_id in self.buffers
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def record(self, hub_id, ts, temperature, moisture):
+        """Append a reading for a hub. `ts` is epoch seconds or a datetime."""
+        if isinstance(ts, datetime):
+            ts = ts.timestamp()
+        with self.lock(hub_id):
+            self._apply(hub_id, ts, temperature, moisture)
+            if self.backend is not None:
+                self.backend.append(hub_id, ts, temperature, moisture)
+
+    def archives(self, resolution):
+        """True if closed buckets at `resolution` go to the backend rather than staying in memory."""
+        return resolution >= ARCHIVE_MIN_RESOLUTION and hasattr(self.backend, 'append_rollup')
+
+    def memory_tiers(self):
+        """(resolution, retention) of each rollup tier as held in memory, finest first."""
+        return [(res, res if self.archives(res) else min(ret, MEMORY_ROLLUP_RETENTION))
+                for res, ret in self.rollup_tiers]
+
+    def _apply(self, hub_id, ts, temperature, moisture, replay=False):
+        """Add a reading to the in-memory buffer and rollups only (caller holds the hub's lock)."""
+        buf = self.buffers.get(hub_id)
+        if buf is None:
+            buf = self.buffers[hub_id] = HubHistoryBuffer(self.capacity)
+        buf.append(ts, temperature, moisture)
+        self._apply_rollups(hub_id, ts, temperature, moisture, replay)
+
+    def _apply_rollups(self, hub_id, ts, temperature, moisture, replay=False):
+        """
+        Add a reading to the hub's rollup tiers. A new reading in an already
+        archived bucket (a late one) has the bucket archived again; readings
+        replayed from the backend are already counted in the archive.
+        """
+        tiers = self.rollups.get(hub_id)
+        if tiers is None:
+            tiers = self.rollups[hub_id] = [RollupTier(res, ret) for res, ret in self.memory_tiers()]
+        for tier in tiers:
+            if not self.archives(tier.resolution):
+                tier.add(ts, temperature, moisture)
+                continue
+            bucket = ts - ts % tier.resolution
+            if tier.starts and bucket > tier.starts[-1]:
+                self._archive(hub_id, tier)
+            tier.add(ts, temperature, moisture)
+            bounds = self._archived(hub_id, tier.resolution)
+            if bounds and bucket <= bounds[1] and not replay:
+                self._amend(hub_id, tier.resolution, bucket, temperature, moisture)
+
+    def _archived(self, hub_id, resolution):
+        """[first start, last start] of a hub's archived buckets, or None (caller holds the hub's lock)."""
+        key = (hub_id, resolution)
+        if key not in self.archived_bounds:
+            bounds = self.backend.rollup_bounds(hub_id, resolution)
+            self.archived_bounds[key] = list(bounds) if bounds else None
+        return self.archived_bounds[key]
+
+    def _archive(self, hub_id, tier):
+        """Hand a tier's newest bucket, now closed, to the backend unless it is already there."""
+        row = tier.row(len(tier.starts) - 1)
+        bounds = self._archived(hub_id, tier.resolution)
+        if bounds is None:
+            self.archived_bounds[(hub_id, tier.resolution)] = [row[0], row[0]]
+        elif row[0] > bounds[1]:
+            bounds[1] = row[0]
+        else:
+            return
+        self.backend.append_rollup(hub_id, tier.resolution, row)
+
+    def _amend(self, hub_id, resolution, bucket, temperature, moisture):
+        """
+        Store an archived bucket again with a late reading folded in. Its last
+        values stay: the late reading is taken to be older than the ones that
+        were logged before the bucket closed.
+        """
+        stored = self.backend.read_rollups(hub_id, resolution, bucket, bucket)
+        if not stored:
+            return  # trimmed past its retention
+        start, t_min, t_max, t_sum, t_last, m_min, m_max, m_sum, m_last, count = stored[-1]
+        self.backend.amend_rollup(hub_id, resolution, (
+            start, min(t_min, temperature), max(t_max, temperature), t_sum + temperature, t_last,
+            min(m_min, moisture), max(m_max, moisture), m_sum + moisture, m_last, count + 1))
+
+    def latest(self, hub_id):
+        """Epoch seconds of the newest buffered reading for a hub, or None."""
+        with self.lock(hub_id):
+            buf = self.buffers.get(hub_id)
+            if not buf:
+                return None
+            return buf.times[(buf.start + buf.size - 1) % buf.capacity]
+
+    def tail(self, hub_id, limit=None):
+        """Last `limit` readings for a hub in API shape (empty list if none)."""
+        with self.lock(hub_id):
+            buf = self.buffers.get(hub_id)
+            if not (self.backend is not None and limit is not None and limit > (len(buf) if buf else 0)):
+                return buf.tail(limit) if buf is not None else []
+        return [to_point(*r) for r in self.backend.recent(hub_id, limit)]
+
+    def read_range(self, hub_id, start=None, end=None, limit=None):
+        """
+        Readings with start <= ts <= end as (ts, temperature, moisture) tuples,
+        oldest first; with `limit`, only the newest `limit` of them.
+        """
+        if self.backend is not None:
+            return self.backend.read_range(hub_id, start, end, limit)
+        lo = float('-inf') if start is None else start
+        hi = float('inf') if end is None else end
+        records = []
+        with self.lock(hub_id):
+            buf = self.buffers.get(hub_id)
+            if buf is None:
+                return []
+            for times, temps, moist in buf.columns():
+                records.extend(r for r in zip(times, temps, moist) if lo <= r[0] <= hi)
+        return records if limit is None else records[-limit:]
+
+    def rollup_tier(self, hub_id, start, step, now):
+        """
+        The coarsest rollup tier usable for a `step`-second query starting at
+        `start`: its resolution divides the step and its retention reaches back
+        to `start`. None if raw readings are needed.
+        """
+        for tier in reversed(self.rollups.get(hub_id, ())):
+            if tier.resolution <= step and step % tier.resolution == 0 and self._covers(hub_id, tier, start, now):
+                return tier
+        return None
+
+    def _covers(self, hub_id, tier, start, now):
+        if not self.archives(tier.resolution):
+            return tier.covers(start, now)
+        # The first archived bucket may have been partial, so coverage starts after it
+        bounds = self._archived(hub_id, tier.resolution)
+        complete_from = bounds[0] + tier.resolution if bounds else tier.complete_from
+        retention = dict(self.rollup_tiers)[tier.resolution]
+        return complete_from is not None and start >= max(complete_from, now - retention)
+
+    def aggregate(self, hub_id, start, end, step, agg='avg', now=None, max_scan=None):
+        """
+        Bucketed history for a hub. Served from the coarsest rollup tier that
+        fits (with `start` snapped down to the tier grid), else from raw
+        readings. Returns (points, source, scanned) where source is 'raw' or
+        'rollup_<resolution>s' and scanned counts the rows read. Raises
+        ValueError if more than `max_scan` raw readings would be needed.
+        """
+        now = time.time() if now is None else now
+        with self.lock(hub_id):
+            tier = self.rollup_tier(hub_id, start, step, now)
+            if tier is not None:
+                start -= start % tier.resolution
+                buckets = list(tier.buckets(start, end))
+        if tier is None:
+            records = self.read_range(hub_id, start, end, None if max_scan is None else max_scan + 1)
+            if max_scan is not None and len(records) > max_scan:
+                raise ValueError(f"more than {max_scan} readings in range")
+            return downsample(records, start, end, step, agg), 'raw', len(records)
+        if self.archives(tier.resolution):
+            archived = self.backend.read_rollups(hub_id, tier.resolution, start, end)
+            if archived:
+                buckets = archived + [b for b in buckets if b[0] > archived[-1][0]]
+        return downsample_rollups(buckets, start, end, step, agg), f"rollup_{tier.resolution}s", len(buckets)
+
+    def warm(self, hub_ids):
+        """
+        Bring in-memory state up to date with the backend after a restart.
+        Hubs restored from a snapshot replay the readings logged after it into
+        their buffers and rollups; other hubs refill their buffers from the
+        backend's newest readings and rebuild their archived tiers' open
+        buckets from the readings since the last archived bucket.
+        """
+        if self.backend is None:
+            return
+        for hub_id in hub_ids:
+            last = self.latest(hub_id)
+            if last is not None:
+                # Skip the readings already buffered; others logged at the same time still replay
+                with self.lock(hub_id):
+                    held = Counter(self.buffers[hub_id].newest())
+                records = []
+                for r in self.backend.read_range(hub_id, last):
+                    if held[r]:
+                        held[r] -= 1
+                    else:
+                        records.append(r)
+                with self.lock(hub_id):
+                    for ts, temperature, moisture in records:
+                        self._apply(hub_id, ts, temperature, moisture, replay=True)
+                continue
+            records = self.backend.recent(hub_id, self.capacity)
+            with self.lock(hub_id):
+                for ts, temperature, moisture in records:
+                    buf = self.buffers.get(hub_id)
+                    if buf is None:
+                        buf = self.buffers[hub_id] = HubHistoryBuffer(self.capacity)
+                    buf.append(ts, temperature, moisture)
+                ends = []
+                for res, _ in self.rollup_tiers:
+                    bounds = self._archived(hub_id, res) if self.archives(res) else None
+                    if bounds:
+                        ends.append(bounds[1] + res)
+            if ends:
+                records = self.backend.read_range(hub_id, min(ends))
+                with self.lock(hub_id):
+                    for ts, temperature, moisture in records:
+                        self._apply_rollups(hub_id, ts, temperature, moisture, replay=True)
+
+    def remove(self, hub_id):
+        with self.lock(hub_id):
+            self.buffers.pop(hub_id, None)
+            self.rollups.pop(hub_id, None)
+            for res, _ in self.rollup_tiers:
+                self.archived_bounds.pop((hub_id, res), None)
+        if self.backend is not None:
+            self.backend.remove_hub(hub_id)
+
+    def nbytes(self):
+        return (sum(buf.nbytes() for buf in list(self.buffers.values()))
+                + sum(tier.nbytes() for tiers in list(self.rollups.values()) for tier in tiers))
@@ -0,0 +1,348 @@
+"""
+CropStack Hub Snapshot — warm restart of in-memory hub state.
+Periodically writes the hub records (including runtime fields such as device_ip,
+device_state, servo_state and auto_mode) and the hub history buffers/rollups to
+a compact binary snapshot, and logs every hub change made since the last
+snapshot to a write-ahead log. On startup the snapshot is loaded and the WAL
+replayed, so the server comes back without a full Firestore read.
+
+Layout:
+    <root>/snapshot.bin             header + zlib body + crc32 (see HubStateJournal.snapshot)
+    <root>/wal-<index>.log          length/crc-framed JSON records, replayed in order
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+from hub_history import HubHistoryBuffer, RollupTier
+from hub_store import Hub
+
+
+SNAPSHOT_FILE = 'snapshot.bin'
+SNAPSHOT_MAGIC = b'CSNP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('<4sHId')  # magic, version, first WAL index to replay, created_at
+WAL_FRAME = struct.Struct('<II')  # payload length, crc32
+U8, U16, U32 = struct.Struct('<B'), struct.Struct('<H'), struct.Struct('<I')
+BUFFER_HEADER = struct.Struct('<III')  # capacity, start, size
+TIER_HEADER = struct.Struct('<dddI')  # resolution, retention, complete_from (nan if None), buckets
+
+# Deleted hub IDs remembered so a Firestore reconcile does not bring them back
+MAX_TOMBSTONES = 10000
+
+
+def wal_name(index):
+    return f"wal-{index:010d}.log"
+
+
+def pack_history(store):
+    """Serialize a HubHistoryStore's buffers and rollup tiers."""
+    out = bytearray()
+    buffers = dict(store.buffers)
+    out += U32.pack(len(buffers))
+    for hub_id, buf in buffers.items():
+        key = hub_id.encode()
+        out += U16.pack(len(key)) + key
+        with store.lock(hub_id):
+            out += BUFFER_HEADER.pack(buf.capacity, buf.start, buf.size)
+            out += buf.times.tobytes() + buf.temperatures.tobytes() + buf.moistures.tobytes()
+            tiers = [(tier, len(tier.starts), [column.tobytes() for column in tier._columns()])
+                     for tier in store.rollups.get(hub_id, ())]
+        out += U8.pack(len(tiers))
+        for tier, count, columns in tiers:
+            complete_from = float('nan') if tier.complete_from is None else tier.complete_from
+            out += TIER_HEADER.pack(tier.resolution, tier.retention, complete_from, count)
+            for data in columns:
+                out += data
+    return bytes(out)
+
+
+def unpack_history(store, data):
+    """Load buffers and rollup tiers written by pack_history into `store`."""
+    offset = 0
+    (hubs,) = U32.unpack_from(data, offset)
+    offset += U32.size
+    memory_tiers = store.memory_tiers()
+    configured = [(float(res), float(ret)) for res, ret in memory_tiers]
+    for _ in range(hubs):
+        (key_len,) = U16.unpack_from(data, offset)
+        offset += U16.size
+        hub_id = data[offset:offset + key_len].decode()
+        offset += key_len
+        capacity, start, size = BUFFER_HEADER.unpack_from(data, offset)
+        offset += BUFFER_HEADER.size
+        columns = []
+        for typecode in 'dff':
+            column = array(typecode)
+            column.frombytes(data[offset:offset + capacity * column.itemsize])
+            offset += capacity * column.itemsize
+            columns.append(column)
+        buf = HubHistoryBuffer(store.capacity)
+        if capacity == store.capacity:
+            buf.times, buf.temperatures, buf.moistures = columns
+            buf.start, buf.size = start, size
+        else:
+            for i in range(size):
+                idx = (start + i) % capacity
+                buf.append(columns[0][idx], columns[1][idx], columns[2][idx])
+        store.buffers[hub_id] = buf
+
+        (tier_count,) = U8.unpack_from(data, offset)
+        offset += U8.size
+        tiers = []
+        for _ in range(tier_count):
+            resolution, retention, complete_from, count = TIER_HEADER.unpack_from(data, offset)
+            offset += TIER_HEADER.size
+            tier = RollupTier(resolution, retention)
+            tier.complete_from = None if complete_from != complete_from else complete_from
+            for column in tier._columns():
+                column.frombytes(data[offset:offset + count * column.itemsize])
+                offset += count * column.itemsize
+            tiers.append(tier)
+        # Tiers are only reused when the configuration has not changed
+        if [(tier.resolution, tier.retention) for tier in tiers] == configured:
+            for tier, (res, ret) in zip(tiers, memory_tiers):
+                tier.resolution, tier.retention = res, ret
+            store.rollups[hub_id] = tiers
+
+
+class HubStateJournal:
+    """
+    Snapshot + write-ahead log for `hubs` (a HubStore) and `history`
+    (a HubHistoryStore). Hub changes are coalesced per hub and appended to the
+    current WAL every `flush_interval` seconds; every `snapshot_interval`
+    seconds the WAL is rotated, a new snapshot is written and older WAL files
+    are deleted. History readings are not logged here — the history backend
+    (history_log.py) already keeps them durably, and HubHistoryStore.warm()
+    replays the ones newer than the snapshot.
+    """
+
+    def __init__(self, root, hubs, history, flush_interval=1.0, snapshot_interval=300.0):
+        self.root = root
+        self.hubs = hubs
+        self.history = history
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.pending = {}  # { hub_id: encoded WAL record }
+        self.tombstones = OrderedDict()  # { hub_id: None } for hubs deleted locally
+        self.lock = threading.Lock()
+        self.io_lock = threading.RLock()
+        self.wal_index = 0
+        self.wal = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stats = {
+            "wal_records": 0,
+            "wal_flushes": 0,
+            "snapshots": 0,
+            "last_snapshot_ms": None,
+            "last_snapshot_bytes": None,
+            "last_snapshot_at": None,
+            "restored_hubs": 0,
+            "replayed_records": 0,
+            "restore_ms": None,
+        }
+
+    # ── Logging ────────────────────────────────
+
+    def log_put(self, hub):
+        """Record the current state of a hub (created or changed)."""
+        record = json.dumps({"op": "put", "hub": hub.state()}, separators=(',', ':')).encode()
+        with self.lock:
+            self.pending[hub.id] = record
+
+    def log_delete(self, hub_id):
+        record = json.dumps({"op": "delete", "id": hub_id}, separators=(',', ':')).encode()
+        with self.lock:
+            self.pending[hub_id] = record
+            self._remember_delete(hub_id)
+
+    def _remember_delete(self, hub_id):
+        self.tombstones[hub_id] = None
+        while len(self.tombstones) > MAX_TOMBSTONES:
+            self.tombstones.popitem(last=False)
+
+    def is_deleted(self, hub_id):
+        with self.lock:
+            return hub_id in self.tombstones
+
+    def flush(self):
+        """Append pending hub changes to the current WAL and fsync it."""
+        with self.io_lock:
+            with self.lock:
+                records, self.pending = list(self.pending.values()), {}
+            if not records:
+                return
+            if self.wal is None:
+                self.wal = open(os.path.join(self.root, wal_name(self.wal_index)), 'ab')
+            self.wal.write(b''.join(WAL_FRAME.pack(len(r), zlib.crc32(r)) + r for r in records))
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+            self.stats["wal_records"] += len(records)
+            self.stats["wal_flushes"] += 1
+
+    # ── Snapshots ──────────────────────────────
+
+    def snapshot(self):
+        """
+        Write a snapshot of the current state. The WAL is rotated first, so any
+        change racing with the snapshot lands in the new WAL and is replayed
+        (idempotently) on top of it.
+        """
+        started = time.perf_counter()
+        with self.io_lock:
+            self.flush()
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
+            self.wal_index += 1
+            first_wal = self.wal_index
+
+            with self.lock:
+                tombstones = list(self.tombstones)
+            hubs = [hub.state() for hub in self.hubs.values()]
+            meta = json.dumps({"hubs": hubs, "deleted": tombstones}, separators=(',', ':')).encode()
+            history = pack_history(self.history) if self.history is not None else b''
+            body = zlib.compress(U32.pack(len(meta)) + meta + history, 1)
+
+            path = os.path.join(self.root, SNAPSHOT_FILE)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, first_wal, time.time()))
+                f.write(body)
+                f.write(U32.pack(zlib.crc32(body)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+
+            for index in self._wal_indexes():
+                if index < first_wal:
+                    os.remove(os.path.join(self.root, wal_name(index)))
+
+            self.stats["snapshots"] += 1
+            self.stats["last_snapshot_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self.stats["last_snapshot_bytes"] = len(body)
+            self.stats["last_snapshot_at"] = time.time()
+
+    def _wal_indexes(self):
+        indexes = []
+        for name in os.listdir(self.root):
+            if name.startswith('wal-') and name.endswith('.log'):
+                try:
+                    indexes.append(int(name[4:-4]))
+                except ValueError:
+                    continue
+        return sorted(indexes)
+
+    # ── Restore ────────────────────────────────
+
+    def _read_snapshot(self):
+        """(first WAL index, meta dict, history bytes) from the snapshot, or None."""
+        path = os.path.join(self.root, SNAPSHOT_FILE)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            magic, version, first_wal, _ = SNAPSHOT_HEADER.unpack_from(data, 0)
+            body = data[SNAPSHOT_HEADER.size:-U32.size]
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("unknown snapshot format")
+            if U32.unpack_from(data, len(data) - U32.size)[0] != zlib.crc32(body):
+                raise ValueError("checksum mismatch")
+            body = zlib.decompress(body)
+            (meta_len,) = U32.unpack_from(body, 0)
+            meta = json.loads(body[U32.size:U32.size + meta_len])
+            return first_wal, meta, body[U32.size + meta_len:]
+        except (struct.error, ValueError, zlib.error) as e:
+            print(f"⚠️  Ignoring unreadable hub snapshot: {e}")
+            return None
+
+    def _replay_wal(self, index):
+        """Apply one WAL file to the hub store; stops at a torn or corrupt tail."""
+        with open(os.path.join(self.root, wal_name(index)), 'rb') as f:
+            data = f.read()
+        offset = replayed = 0
+        while offset + WAL_FRAME.size <= len(data):
+            length, crc = WAL_FRAME.unpack_from(data, offset)
+            payload = data[offset + WAL_FRAME.size:offset + WAL_FRAME.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset += WAL_FRAME.size + length
+            record = json.loads(payload)
+            if record["op"] == "put":
+                hub = self.hubs.put(Hub.from_dict(record["hub"]))
+                self.tombstones.pop(hub.id, None)
+            else:
+                self.hubs.pop(record["id"])
+                self._remember_delete(record["id"])
+            replayed += 1
+        return replayed
+
+    def restore(self):
+        """
+        Load the snapshot and replay the WAL into the hub store and history
+        store. Returns restore stats, or None when there was nothing to restore.
+        """
+        started = time.perf_counter()
+        os.makedirs(self.root, exist_ok=True)
+        snapshot = self._read_snapshot()
+        wal_indexes = self._wal_indexes()
+        if snapshot is None and not wal_indexes:
+            return None
+        first_wal = 0
+        if snapshot is not None:
+            first_wal, meta, history = snapshot
+            for hub in meta["hubs"]:
+                self.hubs.put(Hub.from_dict(hub))
+            for hub_id in meta.get("deleted", ()):
+                self._remember_delete(hub_id)
+            if history and self.history is not None:
+                unpack_history(self.history, history)
+        replayed = 0
+        for index in wal_indexes:
+            if index >= first_wal:
+                replayed += self._replay_wal(index)
+        # New changes go to a fresh WAL after everything replayed
+        self.wal_index = max(wal_indexes + [first_wal]) + 1
+        self.stats["restored_hubs"] = len(self.hubs)
+        self.stats["replayed_records"] = replayed
+        self.stats["restore_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {"hubs": len(self.hubs), "wal_records": replayed, "ms": self.stats["restore_ms"],
+                "snapshot": snapshot is not None}
+
+    # ── Background work ────────────────────────
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='hub-snapshot', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                if time.monotonic() >= next_snapshot:
+                    self.snapshot()
+                    next_snapshot = time.monotonic() + self.snapshot_interval
+                else:
+                    self.flush()
+            except Exception as e:
+                print(f"⚠️  Hub snapshot error: {e}")
+
+    def close(self):
+        """Stop the background thread and write a final snapshot (used at shutdown)."""
+        self.stop_event.set()
+        self.snapshot()
+
+    def status(self):
+        with self.lock:
+            pending = len(self.pending)
+        return dict(self.stats, pending=pending, wal_index=self.wal_index)
@@ -0,0 +1,297 @@
+"""
+CropStack Hub Store — thread-safe in-memory hub records.
+Hubs are written from request threads, the history recorder and auto-control
+workers at once. Records are copy-on-write: a record handed out by the store
+is never modified afterwards, so readers take no locks and never see a torn
+hub, while writers serialize per hub on a striped lock.
+Each hub is a compact slotted Hub record with epoch timestamps; the JSON
+shape served by the API is only built by Hub.to_dict(). Because records never
+change once published, each caches its serialized JSON (Hub.to_json()), so a
+list response only re-encodes hubs that changed since they were last served.
+"""
+
+import itertools
+import json
+import math
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+def to_epoch(value, default=None):
+    """Epoch seconds from an epoch number, ISO string or datetime (else `default`)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    return default
+
+
+def to_reading(value, default=None):
+    """A sensor reading as a finite float rounded to 0.1 (else `default`)."""
+    if isinstance(value, bool):
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return round(value, 1) if math.isfinite(value) else default
+
+
+def to_iso(ts):
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+class Hub:
+    """
+    One hub. Optional fields are None until set and are left out of the API
+    shape, matching the keys a hub dict used to gain over time.
+    Repeated short strings (organizer IDs, status and actuator states) are
+    interned so 100k hubs share a handful of string objects.
+    """
+
+    FIELDS = ('id', 'name', 'organizer_id', 'organizer_email', 'temperature', 'moisture',
+              'last_updated', 'status', 'device_ip', 'device_ip_updated', 'device_state',
+              'servo_state', 'auto_mode', 'auto_config')
+    __slots__ = FIELDS + ('fragment',)  # fragment: cached to_json() output
+
+    # Optional fields, in API key order; epoch-second fields are served as ISO strings
+    OPTIONAL = ('device_ip', 'device_ip_updated', 'device_state', 'servo_state', 'auto_mode', 'auto_config')
+    TIMESTAMPS = ('last_updated', 'device_ip_updated')
+    INTERNED = ('organizer_id', 'organizer_email', 'status', 'device_state', 'servo_state')
+
+    def __init__(self, id, name, organizer_id='', organizer_email='', temperature=25.0, moisture=50.0,
+                 last_updated=None, status='online', device_ip=None, device_ip_updated=None,
+                 device_state=None, servo_state=None, auto_mode=None, auto_config=None):
+        self.id = id
+        self.name = name
+        self.organizer_id = organizer_id
+        self.organizer_email = organizer_email
+        self.temperature = temperature
+        self.moisture = moisture
+        self.last_updated = time.time() if last_updated is None else last_updated
+        self.status = status
+        self.device_ip = device_ip
+        self.device_ip_updated = device_ip_updated
+        self.device_state = device_state
+        self.servo_state = servo_state
+        self.auto_mode = auto_mode
+        self.auto_config = auto_config
+        self.fragment = None
+        self.intern()
+
+    def intern(self):
+        for field in self.INTERNED:
+            value = getattr(self, field)
+            if type(value) is str:
+                setattr(self, field, sys.intern(value))
+
+    def copy(self):
+        """A mutable copy for the next version of this hub (without the cached JSON)."""
+        hub = Hub.__new__(Hub)
+        for field in self.FIELDS:
+            setattr(hub, field, getattr(self, field))
+        hub.fragment = None
+        return hub
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a Hub from an API-shaped dict or a state() dict (ISO or epoch timestamps)."""
+        fields = {field: data[field] for field in cls.FIELDS if data.get(field) is not None}
+        fields['last_updated'] = to_epoch(fields.get('last_updated'), time.time())
+        fields['temperature'] = to_reading(fields.get('temperature'), 25.0)
+        fields['moisture'] = to_reading(fields.get('moisture'), 50.0)
+        if 'device_ip_updated' in fields:
+            fields['device_ip_updated'] = to_epoch(fields['device_ip_updated'])
+        return cls(**fields)
+
+    def state(self):
+        """All set fields with epoch timestamps (for snapshots and the WAL)."""
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+
+    def to_dict(self):
+        """The hub in the API's JSON shape."""
+        data = {
+            "id": self.id,
+            "name": self.name,
+            "organizer_id": self.organizer_id,
+            "organizer_email": self.organizer_email,
+            "temperature": self.temperature,
+            "moisture": self.moisture,
+            "last_updated": to_iso(self.last_updated),
+            "status": self.status,
+        }
+        for field in self.OPTIONAL:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = to_iso(value) if field in self.TIMESTAMPS else value
+        return data
+
+    def to_json(self, fields=None):
+        """
+        to_dict() as compact JSON, encoded once per record (only valid once the
+        record is published). With `fields`, only those keys are encoded (not cached).
+        """
+        if fields is not None:
+            data = self.to_dict()
+            return json.dumps({field: data[field] for field in fields if field in data}, separators=(',', ':'))
+        fragment = self.fragment
+        if fragment is None:
+            fragment = self.fragment = json.dumps(self.to_dict(), separators=(',', ':'))
+        return fragment
+
+
+class StripedLock:
+    """A fixed set of locks; each key always maps to the same one (lock striping)."""
+
+    def __init__(self, stripes=64, factory=threading.RLock):
+        self.locks = [factory() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self.locks[hash(key) % len(self.locks)]
+
+
+class HubStore:
+    """
+    Hub records keyed by hub ID.
+    get()/values() never block: values() returns an immutable tuple snapshot
+    that is only rebuilt after a change. update() is an atomic
+    read-modify-write: it copies the current record, applies the change to the
+    copy under the hub's stripe lock and publishes the copy.
+    Secondary indexes on INDEXED fields are kept in step with every change, so
+    find() returns filtered hubs in O(k) for k matches instead of a full scan.
+    """
+
+    INDEXED = ('organizer_id', 'organizer_email', 'status')
+
+    def __init__(self, stripes=64):
+        self.records = {}  # { hub_id: Hub } — records are treated as immutable
+        self.lock = StripedLock(stripes)
+        # { field: { value: { hub_id: None } } } — dicts as insertion-ordered id sets
+        self.indexes = {field: {} for field in self.INDEXED}
+        self.index_lock = threading.Lock()
+        self.versions = itertools.count(1)
+        self.version = 0
+        self.snapshot_cache = (0, ())  # (version, records)
+        self.json_cache = (0, '[]')  # (version, JSON array of all hubs)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, hub_id):
+        return hub_id in self.records
+
+    def _reindex(self, hub_id, old, new):
+        """Move a hub between index entries (caller holds the hub's stripe lock)."""
+        changes = []
+        for field in self.INDEXED:
+            before = getattr(old, field) if old is not None else None
+            after = getattr(new, field) if new is not None else None
+            if old is None or new is None or before != after:
+                changes.append((field, before, after))
+        if not changes:
+            return
+        with self.index_lock:
+            for field, before, after in changes:
+                index = self.indexes[field]
+                if old is not None:
+                    ids = index.get(before)
+                    if ids is not None:
+                        ids.pop(hub_id, None)
+                        if not ids:
+                            del index[before]
+                if new is not None:
+                    index.setdefault(after, {})[hub_id] = None
+
+    def _changed(self):
+        # Every change gets a unique version, so a cached snapshot can never match a newer state
+        self.version = next(self.versions)
+
+    def get(self, hub_id):
+        """The current record for a hub (do not modify it), or None."""
+        return self.records.get(hub_id)
+
+    def ids(self):
+        return list(self.records)
+
+    def values(self):
+        """Copy-on-write snapshot of all records as a tuple."""
+        version = self.version
+        cached_version, records = self.snapshot_cache
+        if cached_version != version:
+            records = tuple(self.records.values())
+            self.snapshot_cache = (version, records)
+        return records
+
+    def values_json(self):
+        """All hubs as a JSON array, joined from per-hub fragments and cached until the next change."""
+        version = self.version
+        cached_version, body = self.json_cache
+        if cached_version != version:
+            body = '[' + ','.join(hub.to_json() for hub in self.values()) + ']'
+            self.json_cache = (version, body)
+        return body
+
+    def put(self, hub):
+        """Insert or replace a whole record. The store takes ownership of `hub`."""
+        with self.lock(hub.id):
+            self._reindex(hub.id, self.records.get(hub.id), hub)
+            self.records[hub.id] = hub
+            self._changed()
+        return hub
+
+    def update(self, hub_id, fn=None, **fields):
+        """
+        Atomically change a hub: the current record is copied, `fields` are
+        set on it and fn(copy) is called, then the copy replaces the record.
+        If fn returns False the change is dropped. Returns the new record, or
+        None if the hub does not exist or nothing was changed.
+        """
+        with self.lock(hub_id):
+            current = self.records.get(hub_id)
+            if current is None:
+                return None
+            hub = current.copy()
+            for field, value in fields.items():
+                setattr(hub, field, value)
+            if fn is not None and fn(hub) is False:
+                return None
+            hub.intern()
+            self._reindex(hub_id, current, hub)
+            self.records[hub_id] = hub
+            self._changed()
+            return hub
+
+    def pop(self, hub_id):
+        """Remove a hub and return its last record (None if it did not exist)."""
+        with self.lock(hub_id):
+            hub = self.records.pop(hub_id, None)
+            if hub is not None:
+                self._reindex(hub_id, hub, None)
+                self._changed()
+            return hub
+
+    def find(self, **filters):
+        """
+        Hubs matching every field=value filter (fields from INDEXED), e.g.
+        find(organizer_id='u1', status='online'). Walks the smallest matching
+        index entry and checks membership in the others.
+        """
+        with self.index_lock:
+            entries = sorted((self.indexes[field].get(value, {}) for field, value in filters.items()), key=len)
+            if not entries:
+                return list(self.values())
+            first, rest = entries[0], entries[1:]
+            ids = [hub_id for hub_id in first if all(hub_id in entry for entry in rest)]
+        return [hub for hub in map(self.records.get, ids) if hub is not None]
+
+    def count(self, field, value):
+        """Number of hubs with field == value (field from INDEXED)."""
+        with self.index_lock:
+            return len(self.indexes[field].get(value, ()))
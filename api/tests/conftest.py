@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+# The API modules are imported top-level (as app.py does), so run with api/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_firestore import FakeFirestore  # noqa: E402
+from hub_history import HubHistoryStore  # noqa: E402
+from hub_store import HubStore  # noqa: E402
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """The app module with fresh in-memory state: hubs loaded, no Firestore, nothing persisted."""
+    import app
+    monkeypatch.setattr(app, 'hub_store', HubStore())
+    monkeypatch.setattr(app, 'hub_sensor_history', HubHistoryStore())
+    monkeypatch.setattr(app, 'history_log', None)
+    monkeypatch.setattr(app, 'hub_state', None)
+    monkeypatch.setattr(app, 'change_log', app.ChangeLog())
+    monkeypatch.setattr(app, 'hub_events', app.HubEventBroadcaster())
+    monkeypatch.setattr(app, 'firestore_state', {"initialized": True, "client": None, "init_ms": None})
+    # Writes stay queued unless a test flushes them
+    monkeypatch.setattr(app, 'firestore_sync_queue', app.FirestoreSyncQueue(flush_interval=3600, max_pending=10 ** 6))
+    monkeypatch.setattr(app, 'device_pool', app.DeviceConnectionPool())
+    monkeypatch.setattr(app, 'device_breakers', app.DeviceCircuitBreakers(failure_threshold=3, base_backoff=5.0))
+    monkeypatch.setattr(app, 'actuation_executor', app.ActuationExecutor(max_workers=4, per_device=1))
+    monkeypatch.setattr(app, 'device_commands', app.DeviceCommandLog())
+    monkeypatch.setattr(app, 'auto_control_stats', dict.fromkeys(app.auto_control_stats, 0))
+    monkeypatch.setattr(app, 'actuator_changed_at', {})
+    monkeypatch.setattr(app, 'auto_suppressed', {})
+    monkeypatch.setattr(app, 'admin_stats_cache', {"value": None, "expires_at": 0.0, "version": 0})
+    monkeypatch.setattr(app, 'compressed_cache', {})
+    monkeypatch.setitem(app.startup_state, 'ready', True)
+    return app
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+@pytest.fixture
+def firestore(api):
+    """A FakeFirestore installed as the app's Firestore client."""
+    db = FakeFirestore()
+    api.firestore_state["client"] = db
+    return db
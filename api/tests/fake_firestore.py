@@ -0,0 +1,185 @@
+"""
+In-memory stand-in for the parts of the Firestore client the API uses:
+where/order_by/select/start_after/limit queries, count aggregations,
+document get/update and batched writes. `reads` counts documents returned
+to the caller, as Firestore bills them.
+"""
+
+import threading
+from types import SimpleNamespace
+
+
+class BadRequest(Exception):
+    """Mimics google.api_core.exceptions.BadRequest (HTTP 400)."""
+
+    code = 400
+
+
+class FakeDocument:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+def field_value(doc_id, data, field):
+    return doc_id if field == '__name__' else data.get(field)
+
+
+def compare(a, b):
+    if type(a) is not type(b) and not (isinstance(a, (int, float)) and isinstance(b, (int, float))):
+        raise BadRequest(f"cursor value {b!r} does not match the ordering")
+    return (a > b) - (a < b)
+
+
+class FakeQuery:
+    def __init__(self, db, name, filters=(), orders=(), fields=None, after=None, limit=None):
+        self.db = db
+        self.name = name
+        self.filters = filters
+        self.orders = orders
+        self.fields = fields
+        self.after = after
+        self._limit = limit
+
+    def _with(self, **changes):
+        options = dict(filters=self.filters, orders=self.orders, fields=self.fields, after=self.after,
+                       limit=self._limit)
+        options.update(changes)
+        return FakeQuery(self.db, self.name, **options)
+
+    def where(self, field, op, value):
+        assert op == '=='
+        return self._with(filters=self.filters + ((field, value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._with(orders=self.orders + ((field, direction),))
+
+    def select(self, fields):
+        return self._with(fields=list(fields))
+
+    def start_after(self, values):
+        return self._with(after=values)
+
+    def limit(self, count):
+        return self._with(limit=count)
+
+    def _matching(self):
+        with self.db.lock:
+            docs = list(self.db.collections.get(self.name, {}).items())
+        docs = [(doc_id, data) for doc_id, data in docs
+                if all(data.get(field) == value for field, value in self.filters)]
+        # Documents missing an order-by field are left out, as Firestore does
+        docs = [(doc_id, data) for doc_id, data in docs
+                if all(field == '__name__' or field in data for field, _ in self.orders)]
+        for field, direction in reversed(self.orders):
+            docs.sort(key=lambda doc: field_value(doc[0], doc[1], field), reverse=direction == 'DESCENDING')
+        if self.after is not None:
+            if set(self.after) != {field for field, _ in self.orders}:
+                raise BadRequest("cursor does not match the ordering")
+            docs = [doc for doc in docs if self._after_cursor(*doc)]
+        return docs
+
+    def _after_cursor(self, doc_id, data):
+        for field, direction in self.orders:
+            order = compare(field_value(doc_id, data, field), self.after[field])
+            if order:
+                return order > 0 if direction == 'ASCENDING' else order < 0
+        return False
+
+    def stream(self):
+        docs = self._matching()
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        with self.db.lock:
+            self.db.reads += len(docs)
+            self.db.queries += 1
+        return [FakeDocument(doc_id, {k: v for k, v in data.items() if self.fields is None or k in self.fields})
+                for doc_id, data in docs]
+
+    def get(self):
+        return self.stream()
+
+    def count(self, alias=None):
+        query = self
+
+        class Aggregation:
+            def get(self):
+                count = len(query._matching())
+                with query.db.lock:
+                    query.db.counts += 1
+                return [[SimpleNamespace(alias=alias, value=count)]]
+
+        return Aggregation()
+
+
+class FakeDocumentRef:
+    def __init__(self, db, name, doc_id):
+        self.db = db
+        self.name = name
+        self.id = doc_id
+
+    def get(self):
+        with self.db.lock:
+            data = self.db.collections.get(self.name, {}).get(self.id)
+            self.db.reads += 1
+        return FakeDocument(self.id, dict(data) if data is not None else None)
+
+    def update(self, data):
+        with self.db.lock:
+            self.db.collections[self.name][self.id].update(data)
+
+
+class FakeCollection(FakeQuery):
+    def document(self, doc_id):
+        return FakeDocumentRef(self.db, self.name, doc_id)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(('set', ref, data, merge))
+
+    def delete(self, ref):
+        self.ops.append(('delete', ref, None, False))
+
+    def commit(self):
+        if self.db.fail_commits:
+            self.db.fail_commits -= 1
+            raise BadRequest("commit failed")
+        with self.db.lock:
+            for op, ref, data, merge in self.ops:
+                docs = self.db.collections.setdefault(ref.name, {})
+                if op == 'delete':
+                    docs.pop(ref.id, None)
+                elif merge and ref.id in docs:
+                    docs[ref.id].update(data)
+                else:
+                    docs[ref.id] = dict(data)
+            self.db.commits.append([(op, ref.id, data) for op, ref, data, _ in self.ops])
+
+
+class FakeFirestore:
+    def __init__(self, collections=None):
+        self.collections = {name: dict(docs) for name, docs in (collections or {}).items()}
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.queries = 0
+        self.counts = 0
+        self.commits = []
+        self.fail_commits = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
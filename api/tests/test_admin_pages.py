@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import pytest
+
+
+def seed(firestore):
+    firestore.collections['collaterals'] = {
+        f"c{i}": {"crop_name": f"Crop {i}", "status": "pending", "seller_name": "x",
+                  "created_at": datetime(2026, 1, 1 + i // 2)}  # pairs share a time; the ID breaks ties
+        for i in range(7)
+    }
+    firestore.collections['profiles'] = {
+        f"u{i}": {"full_name": f"User {i}", "email": f"u{i}@example.com", "role": ('organizer', 'buyer')[i % 2],
+                  "bio": "not in the field mask"}
+        for i in range(6)
+    }
+
+
+def pages(client, url):
+    """(ids of each page, documents read per page) following next_cursor to the end."""
+    result, cursor = [], None
+    while True:
+        body = client.get(url + (f"&cursor={cursor}" if cursor else '')).get_json()
+        items = body.get("collaterals", body.get("profiles"))
+        result.append([item.get("id", item.get("uid")) for item in items])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return result
+
+
+def test_cursor_round_trip(api):
+    values = [datetime(2026, 3, 4, 5, 6, 7, 890000), 'c1', 42, None]
+    cursor = api.encode_page_cursor(values)
+    assert '=' not in cursor
+    assert api.decode_page_cursor(cursor) == values
+
+
+def test_collaterals_page_newest_first(api, client, firestore):
+    seed(firestore)
+    assert pages(client, '/api/admin/collaterals?limit=3') == [['c6', 'c5', 'c4'], ['c3', 'c2', 'c1'], ['c0']]
+    # Each document is read once, with only the dashboard's fields
+    assert firestore.reads == 7
+    body = client.get('/api/admin/collaterals?limit=7').get_json()
+    assert set(body["collaterals"][0]) <= set(api.COLLATERAL_FIELDS) | {"id"}
+
+
+def test_profiles_page_by_id_with_role_filter(api, client, firestore):
+    seed(firestore)
+    assert pages(client, '/api/admin/profiles?limit=2&role=organizer') == [['u0', 'u2'], ['u4']]
+    assert pages(client, '/api/admin/profiles?limit=2&role=buyer') == [['u1', 'u3'], ['u5']]
+    assert 'bio' not in client.get('/api/admin/profiles?limit=1').get_json()["profiles"][0]
+
+
+@pytest.mark.parametrize('cursor', [
+    '!!!',  # not base64
+    'eyJhIjoxfQ',  # a JSON object, not a list
+    'WyJjMSJd',  # ["c1"]: one value for a two-key ordering
+])
+def test_malformed_cursor_is_400(api, client, firestore, cursor):
+    seed(firestore)
+    response = client.get(f'/api/admin/collaterals?cursor={cursor}')
+    assert response.status_code == 400 and response.get_json()["error"] == "Invalid cursor"
+
+
+def test_cursor_rejected_by_firestore_is_400(api, client, firestore):
+    seed(firestore)
+    # A profiles-style value where collaterals order by a timestamp
+    cursor = api.encode_page_cursor(['u1', 'c1'])
+    response = client.get(f'/api/admin/collaterals?cursor={cursor}')
+    assert response.status_code == 400 and response.get_json()["error"] == "Invalid cursor"
+
+
+@pytest.mark.parametrize('limit', ['0', '501', 'ten'])
+def test_invalid_limit_is_400(api, client, firestore, limit):
+    assert client.get(f'/api/admin/profiles?limit={limit}').status_code == 400
@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime
+
+
+def seed(firestore):
+    firestore.collections['profiles'] = {
+        'u1': {"full_name": "Org One", "email": "o1@example.com", "role": "organizer"},
+        'u2': {"full_name": "Buyer", "email": "b@example.com", "role": "buyer"},
+    }
+    firestore.collections['collaterals'] = {
+        'c1': {"crop_name": "Wheat", "status": "pending", "created_at": datetime(2026, 1, 1)},
+    }
+
+
+def test_directory_stats_are_cached_until_invalidated(api, firestore):
+    seed(firestore)
+    stats = api.get_admin_directory_stats()
+    assert [o["uid"] for o in stats["organizers"]] == ['u1']
+    queries, version = firestore.queries + firestore.counts, api.admin_stats_cache["version"]
+
+    assert api.get_admin_directory_stats() is stats
+    assert firestore.queries + firestore.counts == queries
+
+    firestore.collections['collaterals']['c1']["status"] = "verified"
+    api.invalidate_admin_stats()
+    refreshed = api.get_admin_directory_stats()
+    assert refreshed["collaterals"][0]["status"] == "verified"
+    assert api.admin_stats_cache["version"] == version + 1
+
+
+def test_directory_stats_expire_after_ttl(api, firestore, monkeypatch):
+    seed(firestore)
+    monkeypatch.setattr(api, 'ADMIN_STATS_TTL', 0.05)
+    api.get_admin_directory_stats()
+    firestore.collections['profiles']['u3'] = {"role": "organizer"}
+    assert len(api.get_admin_directory_stats()["organizers"]) == 1
+    time.sleep(0.06)
+    assert len(api.get_admin_directory_stats()["organizers"]) == 2
+
+
+def test_concurrent_callers_share_one_refresh(api, firestore, monkeypatch):
+    seed(firestore)
+    calls = []
+    slow_counts = api.get_profile_counts_from_firestore
+
+    def counts():
+        calls.append(1)
+        time.sleep(0.05)
+        return slow_counts()
+
+    monkeypatch.setattr(api, 'get_profile_counts_from_firestore', counts)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(api.get_admin_directory_stats())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_approving_a_collateral_invalidates_stats(api, client, firestore):
+    seed(firestore)
+    first = client.get('/api/admin/stats')
+    assert first.get_json()["collaterals"][0]["status"] == "pending"
+
+    response = client.post('/api/admin/collaterals/c1/approve', json={"status": "verified"})
+    assert response.status_code == 200
+    second = client.get('/api/admin/stats', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.get_json()["collaterals"][0]["status"] == "verified"
+    assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_profile_counts_use_aggregations(api, firestore):
+    firestore.collections['profiles'] = {
+        'u1': {"role": "organizer"}, 'u2': {"role": "organizer"}, 'u3': {"role": "buyer"},
+        'u4': {"role": "admin"}, 'u5': {"full_name": "No role"},
+    }
+    counts = api.get_profile_counts_from_firestore()
+    assert counts == {"total_users": 5, "role_counts": {"organizer": 2, "buyer": 1, "other": 2}}
+    # One aggregation for the total and one per role; no profile is downloaded
+    assert firestore.counts == 1 + len(api.PROFILE_ROLES)
+    assert firestore.reads == 0
+
+
+def test_profile_counts_fall_back_to_zero(api, firestore, monkeypatch):
+    def failing(query):
+        raise RuntimeError("deadline exceeded")
+
+    monkeypatch.setattr(api, 'count_firestore_query', failing)
+    assert api.get_profile_counts_from_firestore() == {"total_users": 0, "role_counts": {}}
+    api.firestore_state["client"] = None
+    assert api.get_profile_counts_from_firestore() == {"total_users": 0, "role_counts": {}}
@@ -0,0 +1,120 @@
+import math
+
+import pytest
+
+from hub_store import Hub
+
+
+@pytest.fixture
+def dispatched(api, monkeypatch):
+    """Auto-control dispatches as {hub_id: (heater, fan)} instead of device commands."""
+    sent = {}
+
+    def queue(hub_id, hub, heater, fan):
+        sent[hub_id] = (heater, fan)
+        return object()
+
+    monkeypatch.setattr(api, 'queue_auto_control', queue)
+    return sent
+
+
+def auto_hub(api, hub_id, temperature, moisture, heater='OFF', fan='OFF', auto_mode=True, **fields):
+    return api.hub_store.put(Hub(id=hub_id, name=hub_id, temperature=temperature, moisture=moisture,
+                                 device_ip='10.0.0.1', device_state=heater, servo_state=fan, auto_mode=auto_mode,
+                                 **fields))
+
+
+def test_targets_follow_thresholds_without_bands(api):
+    heaters, fans, held_heaters, held_fans = api.compute_auto_targets(
+        [36.0, 20.0, 5.0, 35.0], [30.0, 50.0, 90.0, 35.0], ['OFF', 'ON', 'ON', 'ON'], ['OFF', 'ON', 'ON', 'ON'])
+    assert heaters == ['ON', 'OFF', 'ON', 'OFF']  # > 80% keeps the current state
+    assert fans == ['ON', 'OFF', 'ON', 'OFF']  # < 10°C keeps the current state
+    assert not any(held_heaters) and not any(held_fans)
+
+
+def test_bands_keep_running_actuators_on(api):
+    heaters, fans, held_heaters, held_fans = api.compute_auto_targets(
+        [34.5, 34.5, 33.9], [36.0, 36.0, 37.1], ['ON', 'OFF', 'ON'], ['ON', 'OFF', 'ON'],
+        temp_bands=[1.0] * 3, moisture_bands=[2.0] * 3)
+    assert heaters == ['ON', 'OFF', 'OFF']
+    assert fans == ['ON', 'OFF', 'OFF']
+    assert held_heaters == [True, False, False]
+    assert held_fans == [True, False, False]
+
+
+def test_tick_dispatches_only_hubs_that_must_change(api, dispatched):
+    auto_hub(api, 'HUB-DRY', 25.0, 20.0)
+    auto_hub(api, 'HUB-HOT', 40.0, 50.0)
+    auto_hub(api, 'HUB-OK', 25.0, 50.0)
+    api.hub_store.put(Hub(id='HUB-MANUAL', name='m', temperature=40.0, moisture=20.0, device_ip='10.0.0.2'))
+    api.hub_store.put(Hub(id='HUB-NO-DEVICE', name='n', temperature=40.0, moisture=20.0, auto_mode=True))
+    api.auto_control_tick()
+    assert dispatched == {'HUB-DRY': ('ON', 'OFF'), 'HUB-HOT': ('OFF', 'ON')}
+    stats = api.auto_control_stats
+    assert (stats["ticks"], stats["hubs_evaluated"], stats["dispatched"]) == (1, 3, 2)
+
+
+def test_tick_skips_hubs_with_unusable_values(api, dispatched):
+    auto_hub(api, 'HUB-A', 40.0, 50.0)
+    auto_hub(api, 'HUB-NONE', None, 20.0)
+    auto_hub(api, 'HUB-NAN', 40.0, 20.0, auto_config={"min_dwell_seconds": math.nan})
+    auto_hub(api, 'HUB-STR', 40.0, 20.0, auto_config={"temperature_hysteresis": "1"})
+    api.auto_control_tick()
+    assert dispatched == {'HUB-A': ('OFF', 'ON')}
+    assert (api.auto_control_stats["hubs_evaluated"], api.auto_control_stats["hubs_skipped"]) == (1, 3)
+
+
+def test_hysteresis_hold_is_counted_once(api, dispatched):
+    auto_hub(api, 'HUB-A', 25.0, 36.0, heater='ON')  # inside the 2% band above 35%
+    for _ in range(3):
+        api.auto_control_tick()
+    assert dispatched == {}
+    assert api.auto_control_stats["avoided_by_hysteresis"] == 1
+
+    api.hub_store.update('HUB-A', moisture=37.5)  # back in range by the band width
+    api.auto_control_tick()
+    assert dispatched == {'HUB-A': ('OFF', 'OFF')}
+    assert api.auto_control_stats["avoided_by_hysteresis"] == 1
+
+
+def test_dwell_holds_recent_switches(api, dispatched):
+    auto_hub(api, 'HUB-A', 25.0, 20.0, auto_config={"min_dwell_seconds": 60.0})
+    api.actuator_changed_at[('HUB-A', 'device_state')] = api.time.time() - 10
+    for _ in range(3):
+        api.auto_control_tick()
+    assert dispatched == {}
+    assert api.auto_control_stats["avoided_by_dwell"] == 1
+
+    api.actuator_changed_at[('HUB-A', 'device_state')] -= 60
+    api.auto_control_tick()
+    assert dispatched == {'HUB-A': ('ON', 'OFF')}
+    assert api.auto_control_stats["avoided_by_dwell"] == 1
+
+
+def test_changing_state_or_leaving_auto_mode_resets_holds(api, dispatched):
+    auto_hub(api, 'HUB-A', 25.0, 36.0, heater='ON')
+    api.auto_control_tick()
+    assert api.auto_suppressed == {('HUB-A', 'device_state'): 'hysteresis'}
+
+    # A switch reported by the device clears the hold, so a new one counts again
+    api.hub_store.update('HUB-A', lambda hub: api.set_actuator_state(hub, 'device_state', 'OFF'))
+    assert api.auto_suppressed == {}
+    api.hub_store.update('HUB-A', lambda hub: api.set_actuator_state(hub, 'device_state', 'ON'))
+    api.actuator_changed_at.clear()
+    api.auto_control_tick()
+    assert api.auto_control_stats["avoided_by_hysteresis"] == 2
+
+    api.hub_store.update('HUB-A', auto_mode=False)
+    api.auto_control_tick()
+    assert api.auto_suppressed == {}
+
+
+def test_auto_route_validates_settings(api, client):
+    auto_hub(api, 'HUB-A', 25.0, 50.0, auto_mode=None)
+    response = client.post('/api/hubs/HUB-A/auto', json={"enabled": True, "min_dwell_seconds": 5})
+    assert response.get_json()["auto_config"]["min_dwell_seconds"] == 5.0
+    assert api.hub_store.get('HUB-A').auto_mode is True
+    assert client.post('/api/hubs/HUB-A/auto', json={"moisture_hysteresis": -1}).status_code == 400
+    assert client.post('/api/hubs/HUB-A/auto', json={"moisture_hysteresis": "wide"}).status_code == 400
+    assert client.post('/api/hubs/HUB-A/auto', json={"min_dwell_seconds": "nan"}).status_code == 400
+    assert api.get_auto_config(api.hub_store.get('HUB-A'))["moisture_hysteresis"] == 2.0
@@ -0,0 +1,94 @@
+from app import ChangeLog
+from hub_store import Hub
+
+
+def test_since_latest_is_empty():
+    log = ChangeLog()
+    log.append('hubs', 'a')
+    assert log.since('hubs', log.seq) == (log.seq, [])
+
+
+def test_since_future_cursor_resyncs():
+    log = ChangeLog()
+    log.append('hubs', 'a')
+    assert log.since('hubs', log.seq + 1) == (log.seq, None)
+
+
+def test_since_before_first_entry():
+    log = ChangeLog(max_entries=3)
+    start = log.seq
+    for key in 'abc':
+        log.append('hubs', key)
+    # The cursor just before the first entry is still covered
+    assert log.since('hubs', start) == (log.seq, ['a', 'b', 'c'])
+    assert log.since('hubs', start - 1) == (log.seq, None)
+
+
+def test_since_after_entries_fall_off():
+    log = ChangeLog(max_entries=3)
+    start = log.seq
+    for key in 'abcde':
+        log.append('hubs', key)
+    first = log.entries[0][0]
+    assert first == start + 3
+    assert log.since('hubs', first - 1) == (log.seq, ['c', 'd', 'e'])
+    assert log.since('hubs', first - 2) == (log.seq, None)
+    assert log.since('hubs', start) == (log.seq, None)
+
+
+def test_since_empty_log():
+    log = ChangeLog()
+    assert log.since('hubs', log.seq) == (log.seq, [])
+    assert log.since('hubs', log.seq - 1) == (log.seq, None)
+
+
+def test_since_cursor_from_earlier_process_resyncs():
+    earlier = ChangeLog()
+    earlier.append('hubs', 'a')
+    later = ChangeLog()
+    later.append('hubs', 'b')
+    assert later.since('hubs', earlier.seq) == (later.seq, None)
+
+
+def test_since_dedupes_keys_in_last_change_order():
+    log = ChangeLog()
+    start = log.seq
+    for collection, key in [('hubs', 'a'), ('orders', 'x'), ('hubs', 'b'), ('hubs', 'a'), ('orders', 'y')]:
+        log.append(collection, key)
+    assert log.since('hubs', start) == (log.seq, ['b', 'a'])
+    assert log.since('orders', start) == (log.seq, ['x', 'y'])
+    assert log.since('hubs', start + 2) == (log.seq, ['b', 'a'])
+    assert log.since('hubs', start + 4) == (log.seq, [])
+
+
+def test_since_with_filters_skips_keys_that_never_matched():
+    log = ChangeLog()
+    log.seed('hubs', [('a', {"organizer_id": "u1"}), ('b', {"organizer_id": "u2"})])
+    start = log.seq
+    log.append('hubs', 'b', {"organizer_id": "u2"})
+    log.append('hubs', 'a', {"organizer_id": "u3"})  # moved out of u1
+    log.append('hubs', 'c', {"organizer_id": "u3"})
+    log.append('hubs', 'c', {"organizer_id": "u1"})  # moved into u1
+    log.append('hubs', 'b')  # deleted
+
+    assert log.since('hubs', start, {"organizer_id": "u1"}) == (log.seq, ['a', 'c'])
+    assert log.since('hubs', start, {"organizer_id": "u2"}) == (log.seq, ['b'])
+    assert log.since('hubs', start, {"organizer_id": "u9"}) == (log.seq, [])
+    assert log.since('hubs', start) == (log.seq, ['a', 'c', 'b'])
+
+
+def test_hubs_since_returns_changes_for_the_filter(api, client):
+    for hub_id, org in (('A', 'org-1'), ('B', 'org-2'), ('C', 'org-1'), ('D', 'org-2')):
+        api.publish_hub_change(api.hub_store.put(Hub(id=hub_id, name=hub_id, organizer_id=org)))
+    seq = client.get('/api/hubs').get_json()["seq"]
+    api.publish_hub_change(api.hub_store.update('A', temperature=30.0))
+    api.publish_hub_change(api.hub_store.update('B', organizer_id='org-1'))
+    api.publish_hub_delete(api.hub_store.pop('C'))
+    api.publish_hub_change(api.hub_store.update('D', temperature=10.0))
+
+    body = client.get(f'/api/hubs?organizer_id=org-1&since={seq}').get_json()
+    assert ([hub["id"] for hub in body["hubs"]], body["deleted"], body["resync"]) == (['A', 'B'], ['C'], False)
+    body = client.get(f'/api/hubs?organizer_id=org-2&since={seq}').get_json()
+    assert ([hub["id"] for hub in body["hubs"]], body["deleted"]) == (['D'], ['B'])
+    assert client.get(f'/api/hubs?since={body["seq"]}').get_json()["hubs"] == []
+    assert client.get('/api/hubs?since=1').get_json()["resync"] is True
@@ -0,0 +1,55 @@
+import gzip
+import json
+
+import pytest
+
+from hub_store import Hub
+
+
+@pytest.fixture
+def hubs(api):
+    for i in range(30):
+        api.hub_store.put(Hub(id=f"HUB-{i:04d}", name=f"Silo {i}", organizer_id='org-1', device_state='ON'))
+    return api.hub_store
+
+
+def test_large_json_is_gzipped(api, client, hubs):
+    response = client.get('/api/hubs', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.data))["hubs"] == [hub.to_dict() for hub in hubs.values()]
+    # The compressed body is cached for the ETag and served again without re-running the route
+    assert len(api.compressed_cache) == 1
+    again = client.get('/api/hubs', headers={'Accept-Encoding': 'gzip'})
+    assert again.data == response.data and again.headers['ETag'] == response.headers['ETag']
+    hubs.update('HUB-0001', temperature=30.0)
+    changed = client.get('/api/hubs', headers={'Accept-Encoding': 'gzip'})
+    assert json.loads(gzip.decompress(changed.data))["hubs"][1]["temperature"] == 30.0
+
+
+def test_identity_when_not_accepted_or_small(api, client, hubs):
+    assert 'Content-Encoding' not in client.get('/api/hubs').headers
+    small = client.get('/api/health', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_br_falls_back_without_brotli(api, client, hubs, monkeypatch):
+    monkeypatch.setattr(api, 'brotli', None)
+    assert 'Content-Encoding' not in client.get('/api/hubs', headers={'Accept-Encoding': 'br'}).headers
+    response = client.get('/api/hubs', headers={'Accept-Encoding': 'br, gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_brotli_preferred_when_installed(api, client, hubs):
+    brotli = pytest.importorskip('brotli')
+    response = client.get('/api/hubs', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert len(json.loads(brotli.decompress(response.data))["hubs"]) == 30
+
+
+def test_fields_projection(api, client, hubs):
+    body = client.get('/api/hubs?fields=temperature,device_state,auto_mode').get_json()
+    assert body["hubs"][0] == {"id": "HUB-0000", "temperature": 25.0, "device_state": "ON"}
+    assert len(body["hubs"]) == 30
+    response = client.get('/api/hubs?fields=temperature,secret')
+    assert response.status_code == 400 and 'secret' in response.get_json()["error"]
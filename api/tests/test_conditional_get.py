@@ -0,0 +1,56 @@
+from hub_store import Hub
+
+
+def test_hubs_etag_and_304(api, client):
+    api.hub_store.put(Hub(id='HUB-1', name='Silo 1'))
+    first = client.get('/api/hubs')
+    tag = first.headers['ETag']
+    assert first.status_code == 200 and tag.startswith('W/"')
+    cached = client.get('/api/hubs', headers={'If-None-Match': tag})
+    assert cached.status_code == 304 and cached.data == b''
+    assert cached.headers['ETag'] == tag
+    # Any hub write changes the tag
+    api.hub_store.update('HUB-1', temperature=30.0)
+    fresh = client.get('/api/hubs', headers={'If-None-Match': tag})
+    assert fresh.status_code == 200 and fresh.headers['ETag'] != tag
+    assert fresh.get_json()["hubs"][0]["temperature"] == 30.0
+
+
+def test_write_routes_bump_their_collection(api, client):
+    tag = client.get('/api/market').headers['ETag']
+    assert client.get('/api/market', headers={'If-None-Match': tag}).status_code == 304
+    client.put('/api/market', json={})
+    assert client.get('/api/market', headers={'If-None-Match': tag}).status_code == 200
+    # Other collections keep their tags
+    orders = client.get('/api/orders').headers['ETag']
+    client.put('/api/market', json={})
+    assert client.get('/api/orders', headers={'If-None-Match': orders}).status_code == 304
+
+
+def test_route_does_not_run_for_a_matching_tag(api):
+    calls = []
+
+    @api.versioned('market')
+    def route():
+        calls.append(1)
+        return api.jsonify({"ok": True})
+
+    with api.app.test_request_context('/x'):
+        tag = route().headers['ETag']
+    with api.app.test_request_context('/x', headers={'If-None-Match': tag}):
+        assert route().status_code == 304
+    with api.app.test_request_context('/x', headers={'If-None-Match': 'W/"other"'}):
+        assert route().status_code == 200
+    assert len(calls) == 2
+
+
+def test_error_responses_carry_no_etag(api, client):
+    response = client.get('/api/orders?since=abc')
+    assert response.status_code == 400 and 'ETag' not in response.headers
+
+
+def test_tags_differ_between_processes(api):
+    a, b = api.CollectionVersions('x'), api.CollectionVersions('x')
+    assert a.etag('x') != b.etag('x')
+    a.bump('x')
+    assert a.etag('x').endswith('-1')
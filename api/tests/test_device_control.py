@@ -0,0 +1,342 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import device_control
+from device_control import (ActuationExecutor, CircuitBreaker, DeviceCircuitBreakers, DeviceCommandLog,
+                            DeviceConnectionPool, DeviceError, DeviceUnavailable)
+from hub_store import Hub
+
+
+class DeviceHandler(BaseHTTPRequestHandler):
+    """An ESP32-like device: answers /toggle?state=on with 'ON' over keep-alive HTTP/1.1."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        status, body = (200, self.path.split('state=')[-1].upper()) if '?state=' in self.path else (404, 'no')
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def device():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DeviceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_keep_alive_connections(device):
+    pool = DeviceConnectionPool()
+    assert pool.request(device, '/toggle?state=on') == 'ON'
+    assert pool.request(device, '/servo?state=off') == 'OFF'
+    status = pool.status()
+    assert (status["requests"], status["opened"], status["reused"], status["idle_connections"]) == (2, 1, 1, 1)
+
+    with pytest.raises(DeviceError):
+        pool.request(device, '/missing')
+    assert pool.status()["errors"] == 1
+
+    pool.forget(device)
+    assert pool.status()["idle_connections"] == 0
+
+
+def test_pool_reports_unreachable_devices():
+    pool = DeviceConnectionPool()
+    with pytest.raises(DeviceError):
+        pool.request('127.0.0.1:1', '/toggle?state=on', timeout=0.5)
+    assert pool.status()["errors"] == 1
+
+
+class Blocker:
+    """A command that records its arguments and blocks until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.calls = []
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+
+    def __call__(self, device, value):
+        with self.lock:
+            self.calls.append(value)
+            self.running[device] = self.running.get(device, 0) + 1
+            self.peak[device] = max(self.peak.get(device, 0), self.running[device])
+        self.started.release()
+        self.release.wait(5)
+        with self.lock:
+            self.running[device] -= 1
+        return value
+
+
+def test_queued_commands_for_a_key_are_merged():
+    executor = ActuationExecutor(max_workers=4, per_device=1)
+    command = Blocker()
+    first = executor.submit('k1', 'dev', command, 'dev', 'first')
+    assert command.started.acquire(timeout=5)
+    # 'dev' is busy, so these queue behind it and merge into one command
+    replaced = []
+    second = executor.submit('k2', 'dev', command, 'dev', 'second', on_merge=replaced.append)
+    third = executor.submit('k2', 'dev', command, 'dev', 'third', on_merge=replaced.append)
+    assert replaced == [('dev', 'second')]
+    command.release.set()
+    assert [f.result(5) for f in (first, second, third)] == ['first', 'third', 'third']
+    assert command.calls == ['first', 'third']
+    assert executor.status()["merged"] == 1
+
+
+def test_commands_are_capped_per_device_and_overall():
+    executor = ActuationExecutor(max_workers=3, per_device=1)
+    command = Blocker()
+    futures = [executor.submit(('cmd', i), device, command, device, i)
+               for i, device in enumerate(['a', 'a', 'b', 'b', 'c', 'd'])]
+    for _ in range(3):
+        assert command.started.acquire(timeout=5)
+    assert not command.started.acquire(timeout=0.1)
+    status = executor.status()
+    assert (status["running"], status["queued"], status["workers"]) == (3, 3, 3)
+    command.release.set()
+    assert [f.result(5) for f in futures] == list(range(6))
+    assert command.peak == {'a': 1, 'b': 1, 'c': 1, 'd': 1}
+
+
+def test_failed_command_fails_every_merged_caller():
+    executor = ActuationExecutor(max_workers=1, per_device=1)
+    command = Blocker()
+    executor.submit('busy', 'dev', command, 'dev', 'busy')
+    assert command.started.acquire(timeout=5)
+
+    def broken():
+        raise DeviceError("unreachable")
+
+    futures = [executor.submit('k', 'dev', broken) for _ in range(2)]
+    command.release.set()
+    for future in futures:
+        with pytest.raises(DeviceError):
+            future.result(5)
+    assert executor.status()["failed"] == 1
+
+
+def test_device_ip_change_drops_pooled_connections(api, client):
+    api.hub_store.put(Hub(id='HUB-A', name='Silo', device_ip='10.0.0.1'))
+    old, other = FakeConnection(), FakeConnection()
+    api.device_pool.idle['10.0.0.1'] = [(old, 0.0)]
+    api.device_pool.idle['10.0.0.9'] = [(other, 0.0)]
+
+    client.post('/api/hubs/HUB-A/sensors', json={"temperature": 20.0, "device_ip": "10.0.0.1"})
+    assert '10.0.0.1' in api.device_pool.idle
+
+    client.post('/api/hubs/HUB-A/sensors', json={"temperature": 20.0, "device_ip": "10.0.0.2"})
+    assert api.hub_store.get('HUB-A').device_ip == '10.0.0.2'
+    assert '10.0.0.1' not in api.device_pool.idle and old.closed
+    assert not other.closed
+
+
+def test_command_log_tracks_superseded_commands():
+    log = DeviceCommandLog(max_commands=2)
+    first = log.create('HUB-A', 'servo', 'on')
+    second = log.create('HUB-A', 'servo', 'off')
+    done = log.supersede(first, second["id"])
+    assert (done["status"], done["superseded_by"]) == ('superseded', second["id"])
+    # A result for the merged command never overwrites the superseded record
+    assert log.complete(first, result='OFF')["status"] == 'superseded'
+    log.mark_running(second)
+    assert log.complete(second, result='OFF')["result"] == 'OFF'
+
+    third = log.create('HUB-A', 'toggle', 'toggle')
+    assert log.get(first["id"]) is None  # oldest finished command dropped
+    assert log.get(third["id"])["status"] == 'queued'
+
+
+class BlockingPool:
+    """Stands in for DeviceConnectionPool: records each request and holds the first until released."""
+
+    def __init__(self):
+        self.paths = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def request(self, device_ip, path, timeout=3):
+        self.paths.append(path)
+        self.started.set()
+        self.release.wait(5)
+        return path.split('state=')[-1].upper()
+
+
+def wait_for_command(client, hub_id, command_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        command = client.get(f'/api/hubs/{hub_id}/commands/{command_id}').get_json()["command"]
+        if command["status"] not in ('queued', 'running'):
+            return command
+        time.sleep(0.01)
+    raise AssertionError(f"{command_id} did not finish")
+
+
+def test_queued_on_off_command_is_superseded(api, client, monkeypatch):
+    pool = BlockingPool()
+    monkeypatch.setattr(api, 'device_pool', pool)
+    api.hub_store.put(Hub(id='HUB-A', name='Silo', organizer_id='org-1', device_ip='10.0.0.1',
+                          device_ip_updated=time.time()))
+
+    def command(action, state):
+        response = client.post(f'/api/hubs/HUB-A/{action}', json={"state": state})
+        assert response.status_code == 202
+        return response.get_json()["command_id"]
+
+    running = command('toggle', 'on')
+    assert pool.started.wait(5)
+    replaced = command('servo', 'on')
+    latest = command('servo', 'off')
+    toggled = command('toggle', 'toggle')
+    pool.release.set()
+
+    results = {cid: wait_for_command(client, 'HUB-A', cid) for cid in (running, replaced, latest, toggled)}
+    assert results[replaced]["status"] == 'superseded'
+    assert results[replaced]["superseded_by"] == latest
+    assert [results[cid]["status"] for cid in (running, latest, toggled)] == ['succeeded'] * 3
+    assert pool.paths == ['/toggle?state=on', '/servo?state=off', '/toggle?state=toggle']
+    assert api.hub_store.get('HUB-A').servo_state == 'OFF'
+    pushed = [frame for _, _, _, frame in api.hub_events.events if 'event: command' in frame]
+    assert sum('"superseded"' in frame for frame in pushed) == 1
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(device_control.time, 'monotonic', clock)
+    return clock
+
+
+def fail():
+    raise DeviceError("unreachable")
+
+
+def call(breakers, fn):
+    try:
+        return breakers.call('10.0.0.1', fn)
+    except DeviceUnavailable:
+        return 'fast-fail'
+    except Exception:
+        return 'error'
+
+
+def state(breakers):
+    return breakers.breakers['10.0.0.1'].state
+
+
+def test_opens_after_consecutive_failures(clock):
+    breakers = DeviceCircuitBreakers(failure_threshold=3, base_backoff=5.0)
+    assert call(breakers, fail) == 'error'
+    assert call(breakers, fail) == 'error'
+    assert state(breakers) == CircuitBreaker.CLOSED
+    assert call(breakers, fail) == 'error'
+    assert state(breakers) == CircuitBreaker.OPEN
+    assert breakers.is_open('10.0.0.1')
+    assert call(breakers, lambda: 'ok') == 'fast-fail'
+    assert breakers.status()["fast_failures"] == 1
+    assert breakers.status()["opened"] == 1
+
+
+def test_success_resets_failure_count(clock):
+    breakers = DeviceCircuitBreakers(failure_threshold=2)
+    call(breakers, fail)
+    assert call(breakers, lambda: 'ok') == 'ok'
+    call(breakers, fail)
+    assert state(breakers) == CircuitBreaker.CLOSED
+
+
+def test_half_open_trial_success_closes(clock):
+    breakers = DeviceCircuitBreakers(failure_threshold=1, base_backoff=5.0)
+    call(breakers, fail)
+    clock.now += 4.9
+    assert call(breakers, lambda: 'ok') == 'fast-fail'
+    clock.now += 0.1
+    assert breakers.retry_after('10.0.0.1') == 0.0
+
+    seen = []
+    assert call(breakers, lambda: seen.append(state(breakers)) or 'ok') == 'ok'
+    assert seen == [CircuitBreaker.HALF_OPEN]
+    assert state(breakers) == CircuitBreaker.CLOSED
+    assert breakers.breakers['10.0.0.1'].backoff == 5.0
+
+
+def test_half_open_allows_one_trial(clock):
+    breakers = DeviceCircuitBreakers(failure_threshold=1, base_backoff=5.0)
+    call(breakers, fail)
+    clock.now += 5.0
+
+    def trial():
+        # A second caller during the trial fails fast
+        assert call(breakers, lambda: 'ok') == 'fast-fail'
+        return 'ok'
+
+    assert call(breakers, trial) == 'ok'
+
+
+def test_failed_trial_reopens_with_doubled_backoff(clock):
+    breakers = DeviceCircuitBreakers(failure_threshold=1, base_backoff=5.0, max_backoff=15.0)
+    call(breakers, fail)
+    for backoff in (10.0, 15.0, 15.0):
+        clock.now += 100.0
+        assert call(breakers, fail) == 'error'
+        assert state(breakers) == CircuitBreaker.OPEN
+        assert breakers.breakers['10.0.0.1'].backoff == backoff
+        assert breakers.retry_after('10.0.0.1') == backoff
+
+
+def test_unexpected_exception_in_trial_reopens(clock):
+    breakers = DeviceCircuitBreakers(failure_threshold=1, base_backoff=5.0)
+    call(breakers, fail)
+    clock.now += 5.0
+
+    def broken():
+        raise KeyError("bug")
+
+    assert call(breakers, broken) == 'error'
+    assert state(breakers) == CircuitBreaker.OPEN
+    clock.now += 10.0
+    assert call(breakers, lambda: 'ok') == 'ok'
+    assert state(breakers) == CircuitBreaker.CLOSED
+
+
+def test_device_ip_change_drops_breaker_state(api, client):
+    api.hub_store.put(Hub(id='HUB-A', name='Silo', device_ip='10.0.0.1'))
+    for _ in range(3):
+        call(api.device_breakers, fail)
+    assert api.device_breakers.is_open('10.0.0.1')
+
+    client.post('/api/hubs/HUB-A/sensors', json={"temperature": 20.0, "device_ip": "10.0.0.1"})
+    assert api.hub_store.get('HUB-A').status == 'unreachable'
+
+    client.post('/api/hubs/HUB-A/sensors', json={"temperature": 20.0, "device_ip": "10.0.0.2"})
+    assert api.hub_store.get('HUB-A').status == 'online'
+    assert api.device_breakers.status()["devices"] == 0
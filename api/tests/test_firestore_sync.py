@@ -0,0 +1,85 @@
+import time
+from types import SimpleNamespace
+
+
+def queue(api, **options):
+    options.setdefault('flush_interval', 3600)
+    return api.FirestoreSyncQueue(**options)
+
+
+def test_writes_to_a_hub_are_coalesced(api, firestore):
+    sync = queue(api)
+    sync.enqueue('HUB-A', 'set', {"name": "old"})
+    sync.enqueue('HUB-B', 'set', {"name": "B"})
+    sync.enqueue('HUB-A', 'set', {"name": "new"})
+    sync.enqueue('HUB-B', 'delete')
+    assert sync.status()["pending"] == 2
+    sync.flush()
+    assert firestore.commits == [[('set', 'HUB-A', {"name": "new"}), ('delete', 'HUB-B', None)]]
+    status = sync.status()
+    assert (status["enqueued"], status["coalesced"], status["ops_written"], status["depth"]) == (4, 2, 2, 0)
+
+
+def test_batches_stay_within_the_firestore_limit(api, firestore, monkeypatch):
+    monkeypatch.setattr(api.FirestoreSyncQueue, 'MAX_BATCH_OPS', 3)
+    sync = queue(api)
+    for i in range(7):
+        sync.enqueue(f'HUB-{i}', 'set', {"n": i})
+    sync.flush()
+    assert [len(ops) for ops in firestore.commits] == [3, 3, 1]
+
+
+def test_failed_batch_is_requeued_without_overwriting_newer_writes(api, firestore):
+    sync = queue(api)
+    sync.enqueue('HUB-A', 'set', {"name": "v1"})
+    sync.enqueue('HUB-B', 'set', {"name": "B"})
+    commit = sync._commit
+
+    def fail_after_newer_write(ops):
+        sync.enqueue('HUB-A', 'set', {"name": "v2"})  # arrives while the batch is in flight
+        raise RuntimeError("unavailable")
+
+    sync._commit = fail_after_newer_write
+    sync.flush()
+    assert sync.status()["failures"] == 1
+    assert sync.pending == {'HUB-A': ('set', {"name": "v2"}), 'HUB-B': ('set', {"name": "B"})}
+
+    sync._commit = commit
+    sync.flush()
+    assert firestore.collections['hubs'] == {'HUB-A': {"name": "v2"}, 'HUB-B': {"name": "B"}}
+
+
+def test_background_flush_backs_off_exponentially(api, firestore, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(api, 'time', SimpleNamespace(perf_counter=time.perf_counter, sleep=sleeps.append))
+    firestore.fail_commits = 5
+    sync = queue(api, flush_interval=0.005, max_backoff=8.0)
+    sync.enqueue('HUB-A', 'set', {"name": "A"})
+    deadline = time.monotonic() + 5
+    while not firestore.commits and time.monotonic() < deadline:
+        time.sleep(0.005)
+    sync.flush_interval = 3600  # park the background thread
+    assert firestore.commits == [[('set', 'HUB-A', {"name": "A"})]]
+    assert sleeps == [1.0, 2.0, 4.0, 8.0, 8.0]
+    assert sync.status()["failures"] == 5
+
+
+def test_full_queue_flushes_without_waiting(api, firestore):
+    sync = queue(api, max_pending=3)
+    for i in range(3):
+        sync.enqueue(f'HUB-{i}', 'set', {"n": i})
+    deadline = time.monotonic() + 5
+    while not firestore.commits and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert len(firestore.commits[0]) == 3
+
+
+def test_hub_writes_go_through_the_queue(api, client, firestore):
+    response = client.post('/api/hubs', json={"name": "Silo", "organizer_id": "org-1"})
+    hub_id = response.get_json()["hub"]["id"]
+    client.put(f'/api/hubs/{hub_id}', json={"name": "Silo 2"})
+    assert firestore.commits == []
+    assert api.firestore_sync_queue.pending[hub_id][1]["name"] == "Silo 2"
+    client.delete(f'/api/hubs/{hub_id}')
+    api.firestore_sync_queue.flush()
+    assert firestore.commits == [[('delete', hub_id, None)]]
@@ -0,0 +1,116 @@
+import random
+import struct
+
+import pytest
+
+import gorilla
+from history_log import read_records, read_sorted_range, write_segment
+
+F32 = struct.Struct('<f')
+
+
+def f32(value):
+    return F32.unpack(F32.pack(value))[0]
+
+
+def make_records(n, start=1_700_000_000.0, seed=1):
+    """Silo-like readings: mostly regular intervals with jitter, values rounded to 0.1."""
+    rng = random.Random(seed)
+    records, ts, t, m = [], start, 24.0, 55.0
+    for _ in range(n):
+        ts += rng.choice((60.0, 60.0, 60.0, 59.5, 61.25, 300.0))
+        t = round(t + rng.uniform(-0.3, 0.3), 1)
+        m = round(m + rng.uniform(-0.5, 0.5), 1)
+        records.append((ts, f32(t), f32(m)))
+    return records
+
+
+def test_block_round_trip():
+    records = make_records(500)
+    data = gorilla.encode_block(records)
+    assert list(gorilla.decode_block(data, 0, len(records))) == records
+
+
+def test_single_record_and_repeated_values():
+    records = [(1_700_000_000.0, f32(21.5), f32(40.0))]
+    assert list(gorilla.decode_block(gorilla.encode_block(records), 0, 1)) == records
+    flat = [(1_700_000_000.0 + i * 60, f32(21.5), f32(40.0)) for i in range(100)]
+    encoded = gorilla.encode_block(flat)
+    assert list(gorilla.decode_block(encoded, 0, len(flat))) == flat
+    # Unchanged values and regular intervals cost a couple of bits per record
+    assert len(encoded) < 100
+
+
+def test_timestamps_round_trip_exactly():
+    rng = random.Random(4)
+    times = [1_700_000_000.123, 1_700_000_000.1234567, 1_700_000_000.5 + 2 ** -22, 1_700_000_100.001]
+    times += sorted(1_700_000_200 + rng.uniform(0, 100) for _ in range(200))  # time.time()-like
+    times += [1e12 + 0.25, 9e15 + 1.0]
+    records = [(ts, f32(20.0), f32(50.0)) for ts in times]
+    assert list(gorilla.decode_block(gorilla.encode_block(records), 0, len(records))) == records
+    odd = [(-5.0000001, f32(1.0), f32(2.0)), (-0.0004, f32(1.0), f32(2.0)), (0.0, f32(1.0), f32(2.0)),
+           (1e-300, f32(1.0), f32(2.0))]
+    assert list(gorilla.decode_block(gorilla.encode_block(odd), 0, len(odd))) == odd
+
+
+def encode_ms_format(monkeypatch, records, **options):
+    """A segment as the GRL1 encoder wrote it: the same blocks without the per-timestamp residuals."""
+    with monkeypatch.context() as m:
+        m.setattr(gorilla, 'MAGIC', gorilla.MAGIC_MS)
+        m.setattr(gorilla, '_write_residual', lambda w, ms, ts: None)
+        return gorilla.encode_segment(records, **options)
+
+
+def test_whole_millisecond_timestamps_cost_one_extra_bit(monkeypatch):
+    flat = [(1_700_000_000.0 + i * 60, f32(21.5), f32(40.0)) for i in range(800)]
+    assert len(gorilla.encode_segment(flat)) - len(encode_ms_format(monkeypatch, flat)) == 800 // 8
+    jittered = [(ts + 0.000_123_4, t, m) for ts, t, m in flat]
+    assert len(gorilla.encode_segment(jittered)) - len(encode_ms_format(monkeypatch, flat)) == 800 * 18 // 8
+
+
+def test_reads_millisecond_format_segments(monkeypatch):
+    records = make_records(600, seed=5)
+    legacy = encode_ms_format(monkeypatch, records, block_records=256)
+    assert legacy[:4] == b'GRL1'
+    assert list(gorilla.iter_segment(legacy)) == [(round(ts * 1000) / 1000, t, m) for ts, t, m in records]
+
+
+def test_segment_round_trip_across_blocks():
+    records = make_records(2500)
+    data = gorilla.encode_segment(records, block_records=1000)
+    assert [entry[1] for entry in gorilla.read_index(data)] == [1000, 1000, 500]
+    assert list(gorilla.iter_segment(data)) == records
+
+
+def test_segment_range_queries():
+    records = make_records(3000, seed=2)
+    data = gorilla.encode_segment(records, block_records=256)
+    times = [r[0] for r in records]
+    bounds = [
+        (times[0], times[-1]),
+        (times[10], times[20]),
+        (times[255], times[256]),  # spans a block boundary
+        (times[700] + 0.1, times[1800] - 0.1),
+        (times[-1], times[-1] + 1000),
+        (times[0] - 1000, times[0]),
+    ]
+    for lo, hi in bounds:
+        assert list(gorilla.iter_segment(data, lo, hi)) == [r for r in records if lo <= r[0] <= hi]
+    assert list(gorilla.iter_segment(data, times[-1] + 1, times[-1] + 2)) == []
+    assert list(gorilla.iter_segment(data, times[0] - 2, times[0] - 1)) == []
+
+
+def test_sealed_segment_files(tmp_path):
+    records = make_records(1500, seed=3)
+    lo, hi = records[200][0], records[1300][0]
+    for suffix in ('.gseg', '.seg'):
+        path = str(tmp_path / f"segment{suffix}")
+        write_segment(path, records)
+        assert read_records(path) == records
+        assert read_sorted_range(path, lo, hi) == records[200:1301]
+
+
+@pytest.mark.parametrize('data', [b'', b'GRL1', b'XXXX' + bytes(20)])
+def test_rejects_non_segments(data):
+    with pytest.raises(ValueError):
+        gorilla.read_index(data)
@@ -0,0 +1,195 @@
+import os
+
+import pytest
+
+from history_log import SegmentedHistoryLog
+from hub_history import HubHistoryBuffer, HubHistoryStore
+from hub_snapshot import pack_history, unpack_history
+from hub_store import Hub
+
+
+def times(points):
+    return [p[0] for p in points]
+
+
+def buffered(buf, limit=None):
+    records = []
+    for ts, temps, moist in buf.columns(limit):
+        records.extend(zip(ts, temps, moist))
+    return records
+
+
+def test_buffer_fills_without_wrapping():
+    buf = HubHistoryBuffer(capacity=4)
+    for i in range(3):
+        buf.append(float(i), 20.0, 50.0)
+    assert len(buf) == 3
+    assert buf.segments() == [(0, 3)]
+    assert times(buffered(buf)) == [0.0, 1.0, 2.0]
+
+
+def test_buffer_wraparound_keeps_newest_in_order():
+    buf = HubHistoryBuffer(capacity=4)
+    for i in range(10):
+        buf.append(float(i), 20.0 + i, 50.0)
+    assert len(buf) == 4
+    # Oldest point sits mid-array, so the view comes back as two ranges
+    assert buf.segments() == [(2, 4), (0, 2)]
+    assert times(buffered(buf)) == [6.0, 7.0, 8.0, 9.0]
+    assert [p["temperature"] for p in buf.tail()] == [26.0, 27.0, 28.0, 29.0]
+
+
+def test_buffer_wraps_exactly_at_capacity():
+    buf = HubHistoryBuffer(capacity=3)
+    for i in range(6):
+        buf.append(float(i), 0.0, 0.0)
+    assert buf.start == 0
+    assert buf.segments() == [(0, 3)]
+    assert times(buffered(buf)) == [3.0, 4.0, 5.0]
+
+
+@pytest.mark.parametrize('limit, expected', [
+    (None, [5.0, 6.0, 7.0, 8.0, 9.0]),
+    (2, [8.0, 9.0]),
+    (4, [6.0, 7.0, 8.0, 9.0]),  # spans the wrap point
+    (50, [5.0, 6.0, 7.0, 8.0, 9.0]),
+    (0, []),
+])
+def test_buffer_tail_limits(limit, expected):
+    buf = HubHistoryBuffer(capacity=5)
+    for i in range(10):
+        buf.append(float(i), 20.0, 50.0)
+    assert times(buffered(buf, limit)) == expected
+    assert len(buf.tail(limit)) == len(expected)
+
+
+def test_store_keeps_a_buffer_per_hub():
+    store = HubHistoryStore(capacity=3)
+    for i in range(5):
+        store.record('a', 1_700_000_000.0 + i, 20.0 + i, 50.0)
+    store.record('b', 1_700_000_000.0, 30.0, 60.0)
+    assert [p["temperature"] for p in store.tail('a')] == [22.0, 23.0, 24.0]
+    assert [p["temperature"] for p in store.tail('a', 2)] == [23.0, 24.0]
+    assert store.latest('a') == 1_700_000_004.0
+    assert len(store.tail('b')) == 1
+    store.remove('a')
+    assert 'a' not in store and store.tail('a') == []
+
+
+def test_store_reads_past_buffer_from_backend(tmp_path):
+    log = SegmentedHistoryLog(str(tmp_path), flush_interval=3600)
+    log.start()
+    store = HubHistoryStore(capacity=5, backend=log)
+    for i in range(50):
+        store.record('hub', 1_700_000_000.0 + i * 60, 20.0, 50.0)
+    log.flush()
+    assert len(store.tail('hub', 5)) == 5
+    assert len(store.tail('hub', 30)) == 30
+    assert len(store.read_range('hub', limit=12)) == 12
+    assert len(store.read_range('hub')) == 50
+    log.close()
+
+
+def test_raw_aggregation_is_bounded():
+    store = HubHistoryStore()
+    for i in range(50):
+        store.record('hub', 1_700_000_000.0 + i, 20.0, 50.0)
+    points, source, scanned = store.aggregate('hub', 1_700_000_000.0, 1_700_000_049.0, 7, max_scan=50)
+    assert source == 'raw' and scanned == 50 and len(points) == 8
+    with pytest.raises(ValueError):
+        store.aggregate('hub', 1_700_000_000.0, 1_700_000_049.0, 7, max_scan=49)
+
+
+def test_history_route_rejects_unbounded_raw_aggregation(api, client, monkeypatch):
+    api.hub_store.put(Hub(id='HUB-A', name='HUB-A'))
+    for i in range(20):
+        api.hub_sensor_history.record('HUB-A', 1_700_000_000.0 + i, 20.0, 50.0)
+    url = '/api/hubs/HUB-A/sensors/history?from=1700000000&to=1700000019&step=7'
+    body = client.get(url).get_json()
+    assert body["source"] == 'raw' and body["points_scanned"] == 20
+    monkeypatch.setattr(api, 'MAX_HISTORY_SCAN', 10)
+    assert client.get(url).status_code == 400
+    # Raw range reads are capped by ?limit= and flagged as truncated instead
+    body = client.get('/api/hubs/HUB-A/sensors/history?from=1700000000&to=1700000019&limit=5').get_json()
+    assert body["truncated"] and [p["temperature"] for p in body["history"]] == [20.0] * 5
+
+
+def test_archived_rollups_match_in_memory_tiers(tmp_path):
+    log = SegmentedHistoryLog(str(tmp_path), flush_interval=3600)
+    log.start()
+    archived = HubHistoryStore(backend=log)
+    memory = HubHistoryStore()
+    start = 1_700_000_000.0 - 1_700_000_000.0 % 3600
+    for i in range(3 * 24 * 60):
+        reading = (start + i * 60, 20.0 + i % 7, 50.0 - i % 5)
+        archived.record('hub', *reading)
+        memory.record('hub', *reading)
+    end = start + 3 * 24 * 3600
+    query = start + 24 * 3600
+    assert archived.aggregate('hub', query, end, 3600, now=end) == memory.aggregate('hub', query, end, 3600, now=end)
+    # Only the open bucket of each coarse tier stays in memory
+    assert [len(tier.starts) for tier in archived.rollups['hub']][1:] == [2, 2]
+    log.close()
+
+
+def test_late_reading_re_archives_its_bucket(tmp_path):
+    log = SegmentedHistoryLog(str(tmp_path), flush_interval=3600)
+    log.start()
+    archived = HubHistoryStore(backend=log)
+    start = 1_700_000_000.0 - 1_700_000_000.0 % 3600
+    for i in range(6 * 60):
+        archived.record('hub', start + i * 60, 20.0, 50.0)
+    # Lands in buckets both coarse tiers have archived already
+    archived.record('hub', start + 3600 + 30, 99.0, 10.0)
+    # The same readings in time order, aggregated from raw data
+    raw = HubHistoryStore(capacity=1000, rollup_tiers=())
+    for ts, temperature, moisture in sorted(log.read_range('hub')):
+        raw.record('hub', ts, temperature, moisture)
+    end = start + 6 * 3600
+    for agg in ('max', 'min', 'avg'):
+        for step in (900, 3600):
+            expected = raw.aggregate('hub', start, end, step, agg, now=end)[0]
+            assert archived.aggregate('hub', start, end, step, agg, now=end)[0] == expected
+    assert log.stats["rollups_amended"] == 2
+    log.flush()
+    log.checkpoint()
+    log.close()
+
+    # After a restart, and once compaction has folded the amendments into the rollup files
+    log = SegmentedHistoryLog(str(tmp_path), flush_interval=3600)
+    log.start()
+    restored = HubHistoryStore(backend=log)
+    restored.warm(['hub'])
+    points = restored.aggregate('hub', start, end, 3600, 'max', now=end)[0]
+    assert points == raw.aggregate('hub', start, end, 3600, 'max', now=end)[0]
+    log.compact(now=end)
+    assert not [name for name in os.listdir(tmp_path / 'hub') if name.endswith('.amend')]
+    assert restored.aggregate('hub', start, end, 3600, 'max', now=end)[0] == points
+    assert log.stats["rollups_amended"] == 0
+    log.close()
+
+
+def test_warm_replays_only_readings_missing_from_a_restored_buffer(tmp_path):
+    log = SegmentedHistoryLog(str(tmp_path), flush_interval=3600, segment_max_records=2)
+    log.start()
+    store = HubHistoryStore(backend=log)
+    base = 1_700_000_000.0
+    store.record('hub', base + 0.000_123_4, 20.0, 50.0)
+    store.record('hub', base + 1.000_4, 21.0, 50.0)
+    snapshot = pack_history(store)
+    # Logged after the snapshot, one at the same time as its newest reading
+    store.record('hub', base + 1.000_4, 22.0, 50.0)
+    store.record('hub', base + 2.000_6, 23.0, 50.0)
+    log.flush()
+    log.checkpoint()
+    assert log.sealed_segments('hub')[0][2].endswith('.gseg')
+    log.close()
+
+    log = SegmentedHistoryLog(str(tmp_path), flush_interval=3600)
+    log.start()
+    restored = HubHistoryStore(backend=log)
+    unpack_history(restored, snapshot)
+    restored.warm(['hub'])
+    assert buffered(restored.buffers['hub']) == buffered(store.buffers['hub'])
+    assert [r[0] - base for r in log.read_range('hub')] == [r[0] - base for r in buffered(store.buffers['hub'])]
+    log.close()
@@ -0,0 +1,54 @@
+import json
+from datetime import datetime
+
+from hub_store import Hub, HubStore
+
+
+def make_hub(i, **fields):
+    return Hub(id=f"HUB-{i:04d}", name=f"Silo {i}", organizer_id=f"org-{i % 2}",
+               last_updated=1_700_000_000.0 + i, **fields)
+
+
+def test_hub_json_fragment_is_cached_per_record():
+    store = HubStore()
+    hub = store.put(make_hub(1, device_state='ON'))
+    fragment = hub.to_json()
+    assert hub.to_json() is fragment
+    assert json.loads(fragment) == hub.to_dict()
+    updated = store.update('HUB-0001', temperature=33.3)
+    assert updated.fragment is None
+    assert json.loads(updated.to_json())["temperature"] == 33.3
+    assert json.loads(hub.to_json())["temperature"] == 25.0
+    assert json.loads(hub.to_json(('id', 'device_state', 'auto_mode'))) == {"id": "HUB-0001", "device_state": "ON"}
+
+
+def test_values_json_is_rebuilt_only_after_a_change():
+    store = HubStore()
+    for i in range(3):
+        store.put(make_hub(i))
+    body = store.values_json()
+    assert store.values_json() is body
+    assert json.loads(body) == [hub.to_dict() for hub in store.values()]
+    store.update('HUB-0002', status='offline')
+    assert [hub["status"] for hub in json.loads(store.values_json())] == ['online', 'online', 'offline']
+
+
+def test_hub_list_json_matches_jsonify(api):
+    for i in range(3):
+        api.hub_store.put(make_hub(i))
+    when = datetime(2024, 5, 1, 12, 30)
+    body = api.hub_list_json(seq=7, timestamp=when)
+    assert json.loads(body) == {"hubs": [hub.to_dict() for hub in api.hub_store.values()], "seq": 7,
+                                "timestamp": json.loads(api.app.json.dumps(when))}
+    assert '", "' not in body and '": ' not in body
+    assert json.loads(api.hub_list_json(api.hub_store.find(organizer_id='org-1'))) == {
+        "hubs": [api.hub_store.get('HUB-0001').to_dict()]}
+
+
+def test_hubs_route_serves_the_cached_list(api, client):
+    for i in range(3):
+        api.hub_store.put(make_hub(i))
+    assert client.get('/api/hubs').get_json()["hubs"] == [hub.to_dict() for hub in api.hub_store.values()]
+    cached = api.hub_store.json_cache
+    client.get('/api/hubs')
+    assert api.hub_store.json_cache is cached
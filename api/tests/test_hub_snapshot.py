@@ -0,0 +1,94 @@
+import os
+
+from hub_history import HubHistoryStore
+from hub_snapshot import SNAPSHOT_FILE, HubStateJournal, wal_name
+from hub_store import Hub, HubStore
+
+
+def make_hub(i, **fields):
+    return Hub(id=f"HUB-{i:04d}", name=f"Silo {i}", organizer_id=f"org-{i % 3}",
+               temperature=20.0 + i, moisture=50.0, last_updated=1_700_000_000.0 + i, **fields)
+
+
+def states(store):
+    return sorted((hub.state() for hub in store.values()), key=lambda state: state["id"])
+
+
+def new_journal(root):
+    hubs, history = HubStore(), HubHistoryStore(capacity=10)
+    return HubStateJournal(str(root), hubs, history), hubs, history
+
+
+def test_restore_snapshot_and_wal(tmp_path):
+    journal, hubs, history = new_journal(tmp_path)
+    for i in range(5):
+        journal.log_put(hubs.put(make_hub(i)))
+        for j in range(15):
+            history.record(f"HUB-{i:04d}", 1_700_000_000.0 + j * 60, 20.0 + j, 50.0)
+    journal.snapshot()
+
+    # Changes after the snapshot only reach the WAL
+    journal.log_put(hubs.update("HUB-0001", device_state="ON", auto_mode=True))
+    journal.log_put(hubs.put(make_hub(7, device_ip="10.0.0.7")))
+    hubs.pop("HUB-0002")
+    journal.log_delete("HUB-0002")
+    journal.flush()
+
+    restored, restored_hubs, restored_history = new_journal(tmp_path)
+    result = restored.restore()
+    assert result["snapshot"] is True
+    assert result["wal_records"] == 3
+    assert states(restored_hubs) == states(hubs)
+    assert restored.is_deleted("HUB-0002")
+    assert restored_history.tail("HUB-0003") == history.tail("HUB-0003")
+    assert len(restored_history.tail("HUB-0003")) == 10
+
+
+def test_restore_from_wal_only(tmp_path):
+    journal, hubs, _ = new_journal(tmp_path)
+    for i in range(3):
+        journal.log_put(hubs.put(make_hub(i)))
+    journal.flush()
+
+    restored, restored_hubs, _ = new_journal(tmp_path)
+    assert restored.restore()["snapshot"] is False
+    assert states(restored_hubs) == states(hubs)
+
+
+def test_torn_wal_tail_is_ignored(tmp_path):
+    journal, hubs, _ = new_journal(tmp_path)
+    journal.log_put(hubs.put(make_hub(1)))
+    journal.flush()
+    journal.log_put(hubs.put(make_hub(2)))
+    journal.flush()
+    journal.wal.close()
+
+    path = os.path.join(str(tmp_path), wal_name(journal.wal_index))
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    restored, restored_hubs, _ = new_journal(tmp_path)
+    assert restored.restore()["wal_records"] == 1
+    assert [hub.id for hub in restored_hubs.values()] == ["HUB-0001"]
+
+
+def test_corrupt_snapshot_falls_back_to_wal(tmp_path):
+    journal, hubs, _ = new_journal(tmp_path)
+    journal.log_put(hubs.put(make_hub(1)))
+    journal.snapshot()
+    journal.log_put(hubs.put(make_hub(2)))
+    journal.flush()
+
+    with open(os.path.join(str(tmp_path), SNAPSHOT_FILE), 'r+b') as f:
+        f.seek(30)
+        f.write(b'\xff\xff\xff\xff')
+
+    restored, restored_hubs, _ = new_journal(tmp_path)
+    result = restored.restore()
+    assert result["snapshot"] is False
+    assert [hub.id for hub in restored_hubs.values()] == ["HUB-0002"]
+
+
+def test_nothing_to_restore(tmp_path):
+    journal, _, _ = new_journal(tmp_path)
+    assert journal.restore() is None
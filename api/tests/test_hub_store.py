@@ -0,0 +1,115 @@
+import threading
+
+from hub_store import Hub, HubStore, to_iso
+
+
+def make_hub(i, **fields):
+    return Hub(id=f"HUB-{i:04d}", name=f"Silo {i}", organizer_id=f"org-{i % 3}",
+               organizer_email=f"owner{i % 3}@farm.test", last_updated=1_700_000_000.0 + i, **fields)
+
+
+def test_update_publishes_a_copy():
+    store = HubStore()
+    before = store.put(make_hub(1))
+    after = store.update('HUB-0001', temperature=31.5, device_state='ON')
+    assert store.get('HUB-0001') is after is not before
+    assert (before.temperature, before.device_state) == (25.0, None)
+    assert (after.temperature, after.device_state) == (31.5, 'ON')
+    assert store.update('missing', temperature=1.0) is None
+
+
+def test_update_dropped_when_fn_returns_false():
+    store = HubStore()
+    hub = store.put(make_hub(1))
+    version = store.version
+    assert store.update('HUB-0001', lambda h: False, temperature=40.0) is None
+    assert store.get('HUB-0001') is hub
+    assert store.version == version
+
+
+def test_values_snapshot_is_cached_until_a_change():
+    store = HubStore()
+    for i in range(3):
+        store.put(make_hub(i))
+    snapshot = store.values()
+    assert store.values() is snapshot
+    store.update('HUB-0001', status='offline')
+    assert store.values() is not snapshot
+    assert [hub.status for hub in snapshot] == ['online'] * 3
+    assert store.pop('HUB-0002').id == 'HUB-0002'
+    assert store.pop('HUB-0002') is None
+    assert [hub.id for hub in store.values()] == ['HUB-0000', 'HUB-0001']
+
+
+def test_concurrent_updates_are_not_lost():
+    store = HubStore(stripes=4)
+    for i in range(8):
+        store.put(make_hub(i, auto_config={"n": 0}))
+
+    def bump(hub):
+        hub.auto_config = {"n": hub.auto_config["n"] + 1}
+
+    def worker():
+        for _ in range(250):
+            for i in range(8):
+                store.update(f"HUB-{i:04d}", bump)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [hub.auto_config["n"] for hub in store.values()] == [2000] * 8
+
+
+def test_hub_dict_round_trip():
+    data = {"id": "HUB-1", "name": "Silo", "organizer_id": "org-1", "organizer_email": "a@farm.test",
+            "temperature": "24.26", "moisture": 61, "last_updated": "2023-11-14T22:13:20",
+            "status": "online", "device_ip": "10.0.0.5", "device_ip_updated": 1_700_000_000.0}
+    hub = Hub.from_dict(data)
+    assert (hub.temperature, hub.moisture) == (24.3, 61.0)
+    assert hub.to_dict() == dict(data, temperature=24.3, moisture=61.0, device_ip_updated=to_iso(1_700_000_000.0))
+    # Unset optional fields are left out of the API shape and the state
+    assert 'auto_mode' not in hub.to_dict() and 'auto_mode' not in hub.state()
+    assert Hub.from_dict(hub.state()).state() == hub.state()
+    assert Hub.from_dict({"id": "HUB-2", "name": "x", "temperature": float('nan')}).temperature == 25.0
+
+
+def test_hub_interns_repeated_strings():
+    a = Hub(id='a', name='a', organizer_id=''.join(['org-', '7']), status=''.join(['on', 'line']))
+    b = Hub(id='b', name='b', organizer_id=''.join(['org-', '7']), status=''.join(['on', 'line']))
+    assert a.organizer_id is b.organizer_id and a.status is b.status
+    assert not hasattr(a, '__dict__')
+
+
+def test_find_and_count_follow_every_change():
+    store = HubStore()
+    for i in range(9):
+        store.put(make_hub(i))
+    assert sorted(hub.id for hub in store.find(organizer_id='org-1')) == ['HUB-0001', 'HUB-0004', 'HUB-0007']
+    store.update('HUB-0004', status='offline')
+    store.update('HUB-0007', organizer_id='org-2')
+    store.pop('HUB-0001')
+    store.put(make_hub(10))  # org-1
+    assert [hub.id for hub in store.find(organizer_id='org-1')] == ['HUB-0004', 'HUB-0010']
+    assert [hub.id for hub in store.find(organizer_id='org-1', status='online')] == ['HUB-0010']
+    assert [hub.id for hub in store.find(organizer_id='org-1', status='offline')] == ['HUB-0004']
+    assert store.find(organizer_id='org-1', organizer_email='owner0@farm.test') == []
+    assert store.find(status='maintenance') == []
+    assert store.count('status', 'online') == 8 and store.count('status', 'offline') == 1
+    assert store.count('organizer_id', 'org-2') == 4
+    # Emptied index entries are dropped
+    store.update('HUB-0004', status='online')
+    assert 'offline' not in store.indexes['status']
+    # Found records are the current ones
+    assert store.find(organizer_id='org-1', status='online')[0] is store.get('HUB-0004')
+
+
+def test_hubs_route_combines_filters(api, client):
+    for i in range(6):
+        api.hub_store.put(make_hub(i, status='offline' if i < 3 else 'online'))
+    body = client.get('/api/hubs?organizer_id=org-0&status=online').get_json()
+    assert [hub["id"] for hub in body["hubs"]] == ['HUB-0003']
+    body = client.get('/api/hubs?organizer_email=owner1@farm.test').get_json()
+    assert sorted(hub["id"] for hub in body["hubs"]) == ['HUB-0001', 'HUB-0004']
+    assert client.get('/api/hubs?status=online&organizer_id=org-9').get_json()["hubs"] == []
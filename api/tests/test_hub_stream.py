@@ -0,0 +1,77 @@
+import json
+import time
+
+from hub_store import Hub
+
+
+def frames(response, count):
+    """The first `count` SSE frames of a streamed response, as (event, id, data) tuples."""
+    chunks = iter(response.response)
+    assert next(chunks) == b"retry: 3000\n\n"
+    parsed = []
+    for _ in range(count):
+        fields = dict(line.split(': ', 1) for line in next(chunks).decode().strip().split('\n'))
+        parsed.append((fields["event"], int(fields["id"]), json.loads(fields["data"])))
+    response.close()
+    return parsed
+
+
+def put_hub(api, hub_id, organizer_id='org-1', **fields):
+    hub = api.hub_store.put(Hub(id=hub_id, name=hub_id, organizer_id=organizer_id, **fields))
+    api.publish_hub_change(hub)
+    return hub
+
+
+def test_events_since_resumes_within_backlog(api):
+    events = api.HubEventBroadcaster(max_events=3)
+    start = events.last_id
+    for i in range(5):
+        events.publish('hub', {"n": i})
+    assert events.events_since(events.last_id) == []
+    assert [e[0] for e in events.events_since(events.last_id - 2)] == [events.last_id - 1, events.last_id]
+    # The oldest kept event is start + 3, so start + 2 is the oldest cursor still covered
+    assert len(events.events_since(start + 2)) == 3
+    assert events.events_since(start + 1) is None
+    assert events.events_since(events.last_id + 1) is None
+
+
+def test_event_id_from_earlier_process_needs_snapshot(api):
+    earlier = api.HubEventBroadcaster()
+    for i in range(3):
+        earlier.publish('hub', {"n": i})
+    time.sleep(0.001)
+    later = api.HubEventBroadcaster()
+    assert later.events_since(earlier.last_id) is None
+    for i in range(10):
+        later.publish('hub', {"n": i})
+    assert later.last_id > earlier.last_id
+    assert later.events_since(earlier.last_id) is None
+
+
+def test_stream_starts_with_filtered_snapshot(api, client):
+    put_hub(api, 'HUB-A')
+    put_hub(api, 'HUB-B', organizer_id='org-2')
+    (event, event_id, data), = frames(client.get('/api/hubs/stream?organizer_id=org-1', buffered=False), 1)
+    assert event == 'snapshot'
+    assert event_id == api.hub_events.last_id
+    assert [hub["id"] for hub in data["hubs"]] == ['HUB-A']
+
+
+def test_stream_resumes_from_last_event_id(api, client):
+    put_hub(api, 'HUB-A')
+    cursor = api.hub_events.last_id
+    put_hub(api, 'HUB-B', organizer_id='org-2')
+    put_hub(api, 'HUB-C')
+    api.hub_events.publish('delete', {"id": "HUB-A"}, 'org-1')
+
+    response = client.get('/api/hubs/stream?organizer_id=org-1', headers={'Last-Event-ID': str(cursor)},
+                          buffered=False)
+    assert [(event, data.get("id")) for event, _, data in frames(response, 2)] == [('hub', 'HUB-C'),
+                                                                                 ('delete', 'HUB-A')]
+
+
+def test_stream_sends_snapshot_for_unknown_cursor(api, client):
+    put_hub(api, 'HUB-A')
+    for cursor in (api.hub_events.last_id - 100, api.hub_events.last_id + 1, 'garbage'):
+        response = client.get('/api/hubs/stream', headers={'Last-Event-ID': str(cursor)}, buffered=False)
+        assert frames(response, 1)[0][0] == 'snapshot'
@@ -0,0 +1,49 @@
+import json
+
+from hub_store import Hub
+
+
+def add_hub(api, hub_id):
+    return api.hub_store.put(Hub(id=hub_id, name=hub_id, organizer_id='org-1', last_updated=1_700_000_000.0))
+
+
+def test_batch_reports_a_status_per_record(api, client):
+    add_hub(api, 'HUB-A')
+    add_hub(api, 'HUB-B')
+    response = client.post('/api/hubs/sensors/batch', json=[
+        {"hub_id": "HUB-A", "temperature": 21.04, "moisture": 40, "ts": 1_700_000_060},
+        {"hub_id": "HUB-X", "temperature": 22.0},
+        "not a record",
+        {"hub_id": "HUB-B", "temperature": 30.0, "device_ip": "10.0.0.2", "pin_state": "on"},
+        {"hub_id": "HUB-A", "temperature": 21.5, "ts": 1_700_000_120},
+    ])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body["accepted"], body["rejected"]) == (3, 2)
+    assert [(r["index"], r["status"]) for r in body["results"]] == [
+        (0, 'ok'), (1, 'error'), (2, 'error'), (3, 'ok'), (4, 'ok')]
+
+    hub_a, hub_b = api.hub_store.get('HUB-A'), api.hub_store.get('HUB-B')
+    assert (hub_a.temperature, hub_a.moisture, hub_a.last_updated) == (21.5, 40.0, 1_700_000_120.0)
+    assert (hub_b.device_ip, hub_b.device_state) == ('10.0.0.2', 'ON')
+    assert [r[0] for r in api.hub_sensor_history.read_range('HUB-A')] == [1_700_000_060.0, 1_700_000_120.0]
+    # One change per hub touched, not per reading
+    assert api.change_log.since('hubs', api.change_log.seq - 2) == (api.change_log.seq, ['HUB-A', 'HUB-B'])
+    assert api.change_log.since('hubs', api.change_log.seq - 3) == (api.change_log.seq, None)
+
+
+def test_batch_accepts_readings_object_and_ndjson(api, client):
+    add_hub(api, 'HUB-A')
+    response = client.post('/api/hubs/sensors/batch', json={"readings": [{"hub_id": "HUB-A", "moisture": 33.3}]})
+    assert response.get_json()["accepted"] == 1
+
+    lines = [json.dumps({"hub_id": "HUB-A", "temperature": 19.5}), '', '{not json', json.dumps({"hub_id": 7})]
+    response = client.post('/api/hubs/sensors/batch', data='\n'.join(lines), content_type='application/x-ndjson')
+    body = response.get_json()
+    assert [r["status"] for r in body["results"]] == ['ok', 'error', 'error']
+    assert api.hub_store.get('HUB-A').temperature == 19.5
+
+
+def test_batch_without_records_is_rejected(client):
+    assert client.post('/api/hubs/sensors/batch', json=[]).status_code == 400
+    assert client.post('/api/hubs/sensors/batch', data='', content_type='application/x-ndjson').status_code == 400
@@ -0,0 +1,22 @@
+import threading
+
+
+def test_serving_the_module_app_starts_loading_on_first_request(api, client, monkeypatch):
+    # As under `gunicorn app:app` or `flask run`: create_app() was never called
+    monkeypatch.setattr(api, 'startup_state', dict(api.startup_state, phase="imported", ready=False))
+    release, loaded = threading.Event(), threading.Event()
+
+    def load_hub_state():
+        release.wait(5)
+        api.startup_state.update(phase="ready", ready=True)
+        loaded.set()
+
+    monkeypatch.setattr(api, 'load_hub_state', load_hub_state)
+    response = client.get('/api/hubs')
+    assert response.status_code == 503
+    assert response.get_json()["phase"] == "loading_hubs"
+    assert client.get('/api/ready').status_code == 503
+    release.set()
+    assert loaded.wait(5)
+    assert client.get('/api/ready').status_code == 200
+    assert client.get('/api/hubs').status_code == 200